@@ -0,0 +1,175 @@
+import argparse
+import asyncio
+import inspect
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.schemas.node import Node
+from src.tasks.graph import Graph, to_thread
+
+# Shape of a full-entity dag: (name, dependencies)
+DAG_SHAPE = [
+    ("raw_block_init", []),
+    ("block_init", ["raw_block_init"]),
+    ("transaction_init", ["raw_block_init"]),
+    ("raw_receipt_init", []),
+    ("receipt_init", ["raw_receipt_init"]),
+    ("log_init", ["raw_receipt_init"]),
+    ("transfer_init", ["log_init"]),
+    ("uniswap_v2_event_init", ["log_init"]),
+    ("uniswap_v3_event_init", ["log_init"]),
+    ("pool_init_address", ["uniswap_v2_event_init", "uniswap_v3_event_init"]),
+    ("raw_trace_init", []),
+    ("trace_init", ["raw_trace_init"]),
+    ("export_block", ["block_init"]),
+    ("export_log", ["log_init"]),
+    ("export_trace", ["trace_init"]),
+]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--num-batches", type=int, default=50)
+    parser.add_argument("--node-duration", type=float, default=0.005)
+    parser.add_argument("--pending-queue-size", type=int, default=100)
+    parser.add_argument("--running-queue-size", type=int, default=20)
+    return parser.parse_args()
+
+
+class PollingGraph:
+    """The scheduler before it became event-driven, kept here as the benchmark baseline."""
+
+    def __init__(self, running_queue_size: int):
+        self.nodes: dict[str, Node] = {}
+        self.running_queue_size = running_queue_size
+        self.pending_count = 0
+        self.running_count = 0
+
+    def add_nodes(self, new_nodes):
+        self.nodes.update(new_nodes)
+        self.pending_count = self.pending_count + len(new_nodes)
+
+    def run(self, task_group, thread_pool):
+        for name, node in list(self.nodes.items()):
+            if node.status == "running" and node.task.done():
+                node.status = "done"
+                self.running_count = self.running_count - 1
+                if "finish" in name:
+                    for i in node.dep_nodes:
+                        del self.nodes[i]
+
+                    del self.nodes[name]
+
+        for name, node in self.nodes.items():
+            if self.running_count >= self.running_queue_size:
+                break
+
+            if node.status != "pending":
+                continue
+
+            if not all(
+                self.nodes[node_name].status == "done" for node_name in node.dep_nodes
+            ):
+                continue
+
+            if inspect.iscoroutinefunction(node.func):
+                coro = node.func(**node.kwargs)
+            else:
+                coro = to_thread(node.func, executor=thread_pool, **node.kwargs)
+
+            node.task = task_group.create_task(coro, name=name)
+            node.status = "running"
+            self.pending_count = self.pending_count - 1
+            self.running_count = self.running_count + 1
+
+
+def create_node(dag_id: int, duration: float, counter: list[int]):
+    async def work(**kwargs):
+        await asyncio.sleep(duration)
+
+    async def finish(**kwargs):
+        counter[0] = counter[0] + 1
+
+    nodes = {}
+    for node_id, (name, deps) in enumerate(DAG_SHAPE):
+        node_name = f"{dag_id}_{name}"
+        nodes[node_name] = Node(
+            dag_id=str(dag_id),
+            node_id=node_id,
+            name=node_name,
+            func=work,
+            resource="cpu",
+            kwargs={},
+            task=None,
+            dep_nodes=[f"{dag_id}_{dep}" for dep in deps],
+            dep_data=[],
+            status="pending",
+        )
+
+    nodes[f"{dag_id}_finish"] = Node(
+        dag_id=str(dag_id),
+        node_id=len(DAG_SHAPE),
+        name=f"{dag_id}_finish",
+        func=finish,
+        resource="control",
+        kwargs={},
+        task=None,
+        dep_nodes=list(nodes),
+        dep_data=[],
+        status="pending",
+    )
+    return nodes
+
+
+async def run_polling(args) -> float:
+    graph = PollingGraph(args.running_queue_size)
+    counter = [0]
+    dag_id = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        async with asyncio.TaskGroup() as tg:
+            while counter[0] < args.num_batches:
+                if graph.pending_count < args.pending_queue_size and dag_id < args.num_batches:
+                    graph.add_nodes(create_node(dag_id, args.node_duration, counter))
+                    dag_id = dag_id + 1
+
+                graph.run(tg, pool)
+                await asyncio.sleep(0.1)
+
+    return time.perf_counter() - start
+
+
+async def run_event_driven(args) -> float:
+    graph = Graph(args.running_queue_size)
+    counter = [0]
+    dag_id = 0
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=4) as pool:
+        async with asyncio.TaskGroup() as tg:
+            graph.run(tg, pool)
+            while counter[0] < args.num_batches:
+                if graph.pending_count < args.pending_queue_size and dag_id < args.num_batches:
+                    graph.add_nodes(create_node(dag_id, args.node_duration, counter))
+                    dag_id = dag_id + 1
+                    continue
+
+                await graph.wait()
+
+    return time.perf_counter() - start
+
+
+def main():
+    args = parse_args()
+    polling = asyncio.run(run_polling(args))
+    event_driven = asyncio.run(run_event_driven(args))
+
+    print(f"batches: {args.num_batches}, node duration: {args.node_duration}s")
+    print(f"polling      : {polling:.3f}s ({args.num_batches / polling:.1f} batch/s)")
+    print(f"event driven : {event_driven:.3f}s ({args.num_batches / event_driven:.1f} batch/s)")
+    print(f"speedup      : {polling / event_driven:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
+
+# python -m scripts.benchmark.graph_scheduler --num-batches 50 --node-duration 0.005
@@ -0,0 +1,174 @@
+import argparse
+import asyncio
+import resource
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+import orjson
+import uvloop
+
+from src.clis import historical
+from src.utils.common import dump_json, parse_resource_limits
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--cassette", type=str, required=True)
+    parser.add_argument(
+        "--record",
+        default=False,
+        action="store_true",
+        help="run against PROVIDER_URIS and write the cassette instead of replaying it",
+    )
+    parser.add_argument("--timing", choices=["original", "fast"], default="original")
+    parser.add_argument("--start-block", type=int, default=23170000)
+    parser.add_argument("--end-block", type=int, default=23170030)
+    parser.add_argument("--request-batch-size", type=int, default=30)
+    parser.add_argument("--pending-queue-size", type=int, default=1000)
+    parser.add_argument("--running-queue-size", type=int, default=5)
+    parser.add_argument("--resource-limits", type=parse_resource_limits, default={})
+    parser.add_argument(
+        "--entities",
+        type=str,
+        default="raw_block,block,transaction,withdrawal,raw_receipt,receipt,log,transfer,event,raw_trace,trace",
+    )
+    parser.add_argument("--exporters", type=str, default="")
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--num-processes", type=int, default=0)
+    parser.add_argument("--output", type=str, default="artifacts/data/benchmark.json", help="where the baseline json is written")
+    parser.add_argument("--compare", type=str, default=None, help="a previous baseline json to compare against")
+    parser.add_argument(
+        "--max-regression",
+        type=float,
+        default=0.1,
+        help="exit with an error when blocks/s drops more than this fraction below --compare",
+    )
+    return parser.parse_args()
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def node_latencies(trace_path: Path):
+    """count, mean/p50/p95/max run time and mean wait for a slot of every node name, in seconds."""
+    with open(trace_path, "rb") as f:
+        events = orjson.loads(f.read())["traceEvents"]
+
+    runs = defaultdict(list)
+    waits = defaultdict(list)
+    for event in events:
+        if event["ph"] != "X":
+            continue
+        runs[event["name"]].append(event["dur"] / 1e6)
+        waits[event["name"]].append(event["args"]["ready_to_started"])
+
+    latencies = {}
+    for name, durations in sorted(runs.items()):
+        durations.sort()
+        latencies[name] = {
+            "count": len(durations),
+            "mean": statistics.fmean(durations),
+            "p50": durations[int(0.5 * len(durations))],
+            "p95": durations[min(int(0.95 * len(durations)), len(durations) - 1)],
+            "max": durations[-1],
+            "wait": statistics.fmean(waits[name]),
+        }
+    return latencies
+
+
+def run(args, work_dir: Path):
+    rpc_options = {"batch_size": args.request_batch_size}
+    if args.record:
+        rpc_options["record_cassette"] = args.cassette
+    else:
+        rpc_options["replay_cassette"] = args.cassette
+        rpc_options["replay_timing"] = args.timing
+
+    kwargs = {
+        "start_block": args.start_block,
+        "end_block": args.end_block,
+        "request_batch_size": args.request_batch_size,
+        "rpc_options": rpc_options,
+        "pending_queue_size": args.pending_queue_size,
+        "running_queue_size": args.running_queue_size,
+        "resource_limits": args.resource_limits,
+        "entities": args.entities.split(",") if args.entities else [],
+        "exporters": args.exporters.split(",") if args.exporters else [],
+        "num_workers": args.num_workers,
+        "num_processes": args.num_processes,
+        "prefetch_depth": 0,
+        "prefetch_memory_mb": 512,
+        "resume": False,
+        # a scratch ledger, a benchmark must neither skip nor mark real ranges
+        "checkpoint_file": str(work_dir / "checkpoint.sqlite"),
+        "profile_output": str(work_dir / "trace.json"),
+    }
+
+    start = time.perf_counter()
+    with asyncio.Runner(loop_factory=uvloop.new_event_loop) as runner:
+        runner.run(historical.main(**kwargs))
+    return time.perf_counter() - start
+
+
+def compare(baseline: dict, previous: dict, max_regression: float):
+    change = baseline["blocks_per_second"] / previous["blocks_per_second"] - 1
+    print(f"blocks/s     : {previous['blocks_per_second']:.2f} -> {baseline['blocks_per_second']:.2f} ({change:+.1%})")
+    print(f"peak rss (mb): {previous['peak_rss_mb']:.0f} -> {baseline['peak_rss_mb']:.0f}")
+    for name, latency in baseline["nodes"].items():
+        before = previous["nodes"].get(name)
+        if before is None:
+            continue
+        print(f"{name:<28} mean {before['mean'] * 1000:8.1f}ms -> {latency['mean'] * 1000:8.1f}ms")
+
+    return change >= -max_regression
+
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as work_dir:
+        seconds = run(args, Path(work_dir))
+        nodes = node_latencies(Path(work_dir) / "trace.json")
+
+    blocks = args.end_block - args.start_block + 1
+    baseline = {
+        "commit": git_commit(),
+        "cassette": args.cassette,
+        "mode": "record" if args.record else f"replay_{args.timing}",
+        "start_block": args.start_block,
+        "end_block": args.end_block,
+        "entities": args.entities,
+        "exporters": args.exporters,
+        "seconds": seconds,
+        "blocks_per_second": blocks / seconds,
+        # ru_maxrss is in kilobytes on linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        "nodes": nodes,
+    }
+    Path(args.output).parent.mkdir(parents=True, exist_ok=True)
+    dump_json(args.output, baseline)
+    print(f"{blocks} blocks in {seconds:.2f}s ({baseline['blocks_per_second']:.2f} blocks/s), peak rss {baseline['peak_rss_mb']:.0f}mb -> {args.output}")
+
+    if args.compare:
+        with open(args.compare, "rb") as f:
+            previous = orjson.loads(f.read())
+        if not compare(baseline, previous, args.max_regression):
+            print(f"blocks/s regressed more than {args.max_regression:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
+
+# record once against a live provider, then replay on every build:
+# python -m scripts.benchmark.pipeline --cassette artifacts/data/23170000_23170030.jsonl.gz --record
+# python -m scripts.benchmark.pipeline --cassette artifacts/data/23170000_23170030.jsonl.gz --timing fast \
+# --output artifacts/data/benchmark_new.json --compare artifacts/data/benchmark.json
@@ -0,0 +1,337 @@
+import argparse
+import asyncio
+import itertools
+import random
+import time
+
+import h11
+import orjson
+import uvloop
+from wsproto import ConnectionType, WSConnection
+from wsproto.events import (
+    AcceptConnection,
+    CloseConnection,
+    Ping,
+    Request,
+    TextMessage,
+)
+
+from scripts.benchmark.synthetic_chain import Revert, SyntheticChain
+from src.logger import logger
+
+TOO_MANY_REQUESTS = b"<html><body><h1>429 Too Many Requests</h1>\nYou have sent too many requests in a given amount of time.\n</body></html>\n"
+
+
+def parse_arg():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--host", type=str, default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--head", type=int, default=23170030, help="block number of the head at start")
+    parser.add_argument(
+        "--block-time",
+        type=float,
+        default=12,
+        help="seconds between new heads (and newHeads notifications), 0 keeps the head fixed",
+    )
+    parser.add_argument("--transactions-per-block", type=int, default=150)
+    parser.add_argument("--logs-per-transaction", type=float, default=2.0)
+    parser.add_argument("--dex-event-ratio", type=float, default=0.2, help="share of logs that are uniswap v2/v3 events")
+    parser.add_argument("--traces-per-transaction", type=float, default=3.0)
+    parser.add_argument("--max-logs", type=int, default=10000, help="eth_getLogs results above this are refused")
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every http post")
+    parser.add_argument("--jitter", type=float, default=0.0, help="random extra latency up to this many seconds")
+    parser.add_argument("--rate-limit-ratio", type=float, default=0.0, help="share of posts answered with a 429")
+    parser.add_argument("--malformed-ratio", type=float, default=0.0, help="share of posts answered with truncated json")
+    return parser.parse_args()
+
+
+class MockRpcServer:
+    """Json-rpc over http and websocket answering from a SyntheticChain.
+
+    Serves eth_getBlockByNumber, eth_getBlockReceipts, eth_getLogs, trace_block,
+    eth_call (Multicall3 included), eth_getBalance, eth_blockNumber and eth_subscribe
+    newHeads, single or batched, over plain HTTP/1.1 keep-alive connections.
+    eth_getLogs refuses filters matching more than `max_logs` logs the way geth
+    based providers do. Every
+    post can be delayed by `latency` plus up to `jitter`, answered with a 429
+    (`rate_limit_ratio`) or with a truncated body (`malformed_ratio`).
+    """
+
+    def __init__(
+        self,
+        chain: SyntheticChain,
+        head: int,
+        block_time: float = 12,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        rate_limit_ratio: float = 0.0,
+        malformed_ratio: float = 0.0,
+        max_logs: int = 10000,
+        seed: int = 0,
+    ):
+        self.chain = chain
+        self.start_head = head
+        self.block_time = block_time
+        self.latency = latency
+        self.jitter = jitter
+        self.rate_limit_ratio = rate_limit_ratio
+        self.malformed_ratio = malformed_ratio
+        self.max_logs = max_logs
+        self.random = random.Random(seed)
+        self.subscription_ids = itertools.count(1)
+        self.started = time.monotonic()
+        self.server: asyncio.Server | None = None
+        self.stats = {"posts": 0, "requests": 0, "rate_limited": 0, "malformed": 0}
+
+    @property
+    def head(self):
+        if self.block_time <= 0:
+            return self.start_head
+        return self.start_head + int((time.monotonic() - self.started) / self.block_time)
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8545):
+        self.started = time.monotonic()
+        self.server = await asyncio.start_server(self._handle_connection, host, port)
+        logger.info(f"Mock rpc server listening on {host}:{port}, head {self.head}")
+        return self
+
+    async def close(self):
+        if self.server is not None:
+            self.server.close()
+            await self.server.wait_closed()
+        logger.info(f"Mock rpc server stats: {self.stats}")
+
+    # --------------------------------------------------------------- json-rpc
+
+    def _block_number(self, tag: str):
+        match tag:
+            case "latest" | "pending":
+                return self.head
+            case "safe":
+                return self.head - 32
+            case "finalized":
+                return self.head - 64
+            case "earliest":
+                return 0
+            case _:
+                return int(tag, 16)
+
+    def dispatch(self, request: dict):
+        method = request.get("method")
+        params = request.get("params") or []
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        try:
+            match method:
+                case "eth_blockNumber":
+                    result = hex(self.head)
+                case "eth_chainId":
+                    result = "0x1"
+                case "web3_clientVersion":
+                    result = "mock-rpc-server/0.1.0"
+                case "eth_getBlockByNumber":
+                    number = self._block_number(params[0])
+                    result = self.chain.block(number, bool(params[1])) if number <= self.head else None
+                case "eth_getBlockReceipts":
+                    number = self._block_number(params[0])
+                    result = self.chain.receipts(number) if number <= self.head else None
+                case "trace_block":
+                    number = self._block_number(params[0])
+                    result = self.chain.traces(number) if number <= self.head else None
+                case "eth_getLogs":
+                    log_filter = params[0]
+                    from_block = self._block_number(log_filter.get("fromBlock", "latest"))
+                    to_block = min(self._block_number(log_filter.get("toBlock", "latest")), self.head)
+                    result = self.chain.logs(from_block, to_block, log_filter.get("address"), log_filter.get("topics"))
+                    if len(result) > self.max_logs:
+                        response["error"] = {"code": -32005, "message": f"query returned more than {self.max_logs} results"}
+                        return response
+                case "eth_getBalance":
+                    result = hex(self.chain.balance(params[0]))
+                case "eth_call":
+                    result = self.chain.call(params[0]["to"], params[0].get("data") or params[0].get("input"))
+                case _:
+                    response["error"] = {"code": -32601, "message": f"the method {method} does not exist/is not available"}
+                    return response
+        except Revert as e:
+            response["error"] = {"code": 3, "message": str(e), "data": "0x"}
+            return response
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            response["error"] = {"code": -32602, "message": f"invalid params: {e!r}"}
+            return response
+
+        response["result"] = result
+        return response
+
+    async def handle_post(self, body: bytes):
+        """Return (status code, body) of one http post."""
+        self.stats["posts"] = self.stats["posts"] + 1
+        delay = self.latency + self.random.uniform(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        if self.random.random() < self.rate_limit_ratio:
+            self.stats["rate_limited"] = self.stats["rate_limited"] + 1
+            return 429, TOO_MANY_REQUESTS
+
+        try:
+            payload = orjson.loads(body)
+        except orjson.JSONDecodeError:
+            return 200, orjson.dumps({"jsonrpc": "2.0", "id": None, "error": {"code": -32700, "message": "parse error"}})
+
+        if isinstance(payload, list):
+            self.stats["requests"] = self.stats["requests"] + len(payload)
+            content = orjson.dumps([self.dispatch(request) for request in payload])
+        else:
+            self.stats["requests"] = self.stats["requests"] + 1
+            content = orjson.dumps(self.dispatch(payload))
+
+        if self.random.random() < self.malformed_ratio:
+            self.stats["malformed"] = self.stats["malformed"] + 1
+            content = content[: len(content) // 2]
+
+        return 200, content
+
+    # ------------------------------------------------------------- transport
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            initial = await reader.readuntil(b"\r\n\r\n")
+            if b"upgrade: websocket" in initial.lower():
+                await self._serve_websocket(initial, reader, writer)
+            else:
+                await self._serve_http(initial, reader, writer)
+        except (asyncio.IncompleteReadError, ConnectionError, h11.ProtocolError):
+            pass
+        finally:
+            writer.close()
+
+    async def _serve_http(self, initial: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = h11.Connection(h11.SERVER)
+        connection.receive_data(initial)
+        body = bytearray()
+        while True:
+            event = connection.next_event()
+            if event is h11.NEED_DATA:
+                connection.receive_data(await reader.read(65536))
+            elif isinstance(event, h11.Request):
+                body = bytearray()
+            elif isinstance(event, h11.Data):
+                body += event.data
+            elif isinstance(event, h11.EndOfMessage):
+                status, content = await self.handle_post(bytes(body))
+                headers = [("content-type", "application/json"), ("content-length", str(len(content)))]
+                writer.write(connection.send(h11.Response(status_code=status, headers=headers)))
+                writer.write(connection.send(h11.Data(data=content)))
+                writer.write(connection.send(h11.EndOfMessage()))
+                await writer.drain()
+                if connection.our_state is h11.MUST_CLOSE:
+                    return
+                connection.start_next_cycle()
+            elif isinstance(event, h11.ConnectionClosed):
+                return
+
+    async def _serve_websocket(self, initial: bytes, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        connection = WSConnection(ConnectionType.SERVER)
+        connection.receive_data(initial)
+        subscriptions: list[asyncio.Task] = []
+        text = ""
+        try:
+            while True:
+                for event in connection.events():
+                    if isinstance(event, Request):
+                        writer.write(connection.send(AcceptConnection()))
+                    elif isinstance(event, Ping):
+                        writer.write(connection.send(event.response()))
+                    elif isinstance(event, CloseConnection):
+                        writer.write(connection.send(event.response()))
+                        await writer.drain()
+                        return
+                    elif isinstance(event, TextMessage):
+                        text = text + event.data
+                        if not event.message_finished:
+                            continue
+
+                        request = orjson.loads(text)
+                        text = ""
+                        response = self._handle_ws_request(request, connection, writer, subscriptions)
+                        writer.write(connection.send(TextMessage(data=orjson.dumps(response).decode())))
+                await writer.drain()
+
+                data = await reader.read(65536)
+                if not data:
+                    return
+                connection.receive_data(data)
+        finally:
+            for task in subscriptions:
+                task.cancel()
+
+    def _handle_ws_request(self, request: dict, connection: WSConnection, writer: asyncio.StreamWriter, subscriptions: list):
+        match request.get("method"):
+            case "eth_subscribe" if request.get("params") == ["newHeads"]:
+                subscription_id = hex(next(self.subscription_ids))
+                subscriptions.append(
+                    asyncio.create_task(self._publish_heads(subscription_id, connection, writer))
+                )
+                return {"jsonrpc": "2.0", "id": request.get("id"), "result": subscription_id}
+            case "eth_unsubscribe":
+                return {"jsonrpc": "2.0", "id": request.get("id"), "result": True}
+            case _:
+                return self.dispatch(request)
+
+    async def _publish_heads(self, subscription_id: str, connection: WSConnection, writer: asyncio.StreamWriter):
+        if self.block_time <= 0:
+            return
+
+        published = self.head
+        while True:
+            await asyncio.sleep(self.block_time - (time.monotonic() - self.started) % self.block_time)
+            for number in range(published + 1, self.head + 1):
+                message = {
+                    "jsonrpc": "2.0",
+                    "method": "eth_subscription",
+                    "params": {"subscription": subscription_id, "result": self.chain.header(number)},
+                }
+                writer.write(connection.send(TextMessage(data=orjson.dumps(message).decode())))
+            published = max(published, self.head)
+            await writer.drain()
+
+
+async def main(args):
+    chain = SyntheticChain(
+        seed=args.seed,
+        transactions_per_block=args.transactions_per_block,
+        logs_per_transaction=args.logs_per_transaction,
+        dex_event_ratio=args.dex_event_ratio,
+        traces_per_transaction=args.traces_per_transaction,
+    )
+    server = MockRpcServer(
+        chain,
+        head=args.head,
+        block_time=args.block_time,
+        latency=args.latency,
+        jitter=args.jitter,
+        rate_limit_ratio=args.rate_limit_ratio,
+        malformed_ratio=args.malformed_ratio,
+        max_logs=args.max_logs,
+        seed=args.seed,
+    )
+    await server.start(args.host, args.port)
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+
+if __name__ == "__main__":
+    asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+    args = parse_arg()
+    with asyncio.Runner() as runner:
+        try:
+            runner.run(main(args))
+        except KeyboardInterrupt:
+            pass
+
+
+# python -m scripts.benchmark.rpc_server --port 8545 --head 23170030 --latency 0.05 --rate-limit-ratio 0.01
+# PROVIDER_URIS='["http://127.0.0.1:8545"]' WEBSOCKET_URL=ws://127.0.0.1:8545 python -m src.clis.historical ...
@@ -0,0 +1,363 @@
+import hashlib
+import random
+from functools import lru_cache
+
+from eth_abi import decode, encode
+
+from src.abis.event import EVENT_ABI, EVENT_HEX_SIGNATURES
+from src.abis.function import FUNCTION_HEX_SIGNATURES, MULTICALL3_ADDRESS
+from src.tasks.extract.pool import USDT_ADDRESS, WETH_ADDRESS, WETH_USDT_UNISWAP_V2_ADDRESS
+from src.tasks.extract.transfer import TRANSFER_EVENT_HEX_SIGNATURE
+
+SELECTORS = {
+    signature[:10]: function for function, signature in FUNCTION_HEX_SIGNATURES["erc20"].items()
+}
+AGGREGATE3_SELECTOR = FUNCTION_HEX_SIGNATURES["multicall3"]["aggregate3"][:10]
+EMPTY_BLOOM = "0x" + "00" * 256
+
+
+class Revert(Exception):
+    pass
+
+
+class SyntheticChain:
+    """Deterministic mainnet-shaped blocks, receipts and traces for offline runs.
+
+    Everything is derived from (seed, block number), so two servers with the same
+    settings answer byte for byte the same. Densities are means: a transaction
+    gets int(logs_per_transaction) logs plus one more with the fractional
+    probability, and `dex_event_ratio` of its logs are Uniswap v2/v3 events of a
+    fixed pool set (the rest are erc20 Transfers). Pools and tokens answer the
+    erc20 views the enrichment tasks call, directly or through Multicall3.
+    """
+
+    def __init__(
+        self,
+        seed: int = 0,
+        transactions_per_block: int = 150,
+        logs_per_transaction: float = 2.0,
+        dex_event_ratio: float = 0.2,
+        traces_per_transaction: float = 3.0,
+        withdrawals_per_block: int = 16,
+        num_tokens: int = 100,
+        num_pools: int = 200,
+        genesis_timestamp: int = 1438269973,
+        block_time: int = 12,
+    ):
+        self.seed = seed
+        self.transactions_per_block = transactions_per_block
+        self.logs_per_transaction = logs_per_transaction
+        self.dex_event_ratio = dex_event_ratio
+        self.traces_per_transaction = traces_per_transaction
+        self.withdrawals_per_block = withdrawals_per_block
+        self.genesis_timestamp = genesis_timestamp
+        self.block_time = block_time
+
+        # the real weth/usdt pair comes first so price enrichment finds its anchor
+        self.tokens = [WETH_ADDRESS, USDT_ADDRESS] + [
+            self._address("token", i) for i in range(2, num_tokens)
+        ]
+        self.token_info = {
+            address: {
+                "name": f"Token {i}",
+                "symbol": f"TK{i}",
+                "decimals": (18, 6, 8)[i % 3],
+                "totalSupply": self._number("supply", i) % 10**30,
+            }
+            for i, address in enumerate(self.tokens)
+        }
+        self.token_info[WETH_ADDRESS].update(name="Wrapped Ether", symbol="WETH", decimals=18)
+        self.token_info[USDT_ADDRESS].update(name="Tether USD", symbol="USDT", decimals=6)
+
+        rng = random.Random(f"{seed}:pools")
+        self.pools = {WETH_USDT_UNISWAP_V2_ADDRESS: ("uniswap_v2", WETH_ADDRESS, USDT_ADDRESS)}
+        for i in range(1, num_pools):
+            token0, token1 = rng.sample(self.tokens, 2)
+            dex = "uniswap_v2" if i % 2 else "uniswap_v3"
+            self.pools[self._address("pool", i)] = (dex, token0, token1)
+        self.pool_addresses = list(self.pools)
+
+    # ------------------------------------------------------------------ ids
+
+    def _hash(self, *parts):
+        text = ":".join(str(part) for part in (self.seed, *parts))
+        return "0x" + hashlib.sha256(text.encode()).hexdigest()
+
+    def _address(self, *parts):
+        return self._hash("address", *parts)[:42]
+
+    def _number(self, *parts):
+        return int(self._hash("number", *parts), 16)
+
+    def block_hash(self, number: int):
+        return self._hash("block", number)
+
+    def timestamp(self, number: int):
+        return self.genesis_timestamp + number * self.block_time
+
+    # ---------------------------------------------------------------- blocks
+
+    def block(self, number: int, include_transactions: bool):
+        block = dict(self._generate(number)["block"])
+        if not include_transactions:
+            block["transactions"] = [transaction["hash"] for transaction in block["transactions"]]
+        return block
+
+    def header(self, number: int):
+        header = dict(self._generate(number)["block"])
+        del header["transactions"]
+        del header["withdrawals"]
+        return header
+
+    def receipts(self, number: int):
+        return self._generate(number)["receipts"]
+
+    def traces(self, number: int):
+        return self._generate(number)["traces"]
+
+    def logs(self, from_block: int, to_block: int, address=None, topics: list = None):
+        """Logs of the blocks matching an eth_getLogs filter, address and topic entries may be lists."""
+        addresses = {address} if isinstance(address, str) else set(address or [])
+        positions = [{topic} if isinstance(topic, str) else set(topic or []) for topic in topics or []]
+        return [
+            log
+            for number in range(from_block, to_block + 1)
+            for receipt in self.receipts(number)
+            for log in receipt["logs"]
+            if (not addresses or log["address"] in addresses)
+            and len(log["topics"]) >= len(positions)
+            and all(not allowed or topic in allowed for topic, allowed in zip(log["topics"], positions))
+        ]
+
+    @staticmethod
+    def _count(rng: random.Random, mean: float):
+        return int(mean) + (rng.random() < mean - int(mean))
+
+    @lru_cache(maxsize=256)
+    def _generate(self, number: int):
+        rng = random.Random(f"{self.seed}:{number}")
+        block_hash = self.block_hash(number)
+        timestamp = self.timestamp(number)
+        base_fee = 10**9 + rng.randrange(10**10)
+
+        transactions, receipts, traces = [], [], []
+        cumulative_gas = 0
+        log_index = 0
+        for index in range(self.transactions_per_block):
+            sender = self._address("account", rng.randrange(10**6))
+            gas_used = 21000 + rng.randrange(300000)
+            cumulative_gas = cumulative_gas + gas_used
+            transaction_hash = self._hash("transaction", number, index)
+            target = rng.choice(self.pool_addresses) if rng.random() < self.dex_event_ratio else rng.choice(self.tokens)
+            transaction = {
+                "type": "0x2",
+                "chainId": "0x1",
+                "nonce": hex(rng.randrange(10**4)),
+                "gas": hex(gas_used * 2),
+                "maxFeePerGas": hex(base_fee * 2),
+                "maxPriorityFeePerGas": hex(10**8),
+                "to": target,
+                "value": hex(rng.randrange(10**18) if rng.random() < 0.3 else 0),
+                "accessList": [],
+                "input": "0x" + rng.randbytes(4 + 32 * rng.randrange(4)).hex(),
+                "r": self._hash("r", number, index),
+                "s": self._hash("s", number, index),
+                "yParity": hex(index % 2),
+                "v": hex(index % 2),
+                "hash": transaction_hash,
+                "blockHash": block_hash,
+                "blockNumber": hex(number),
+                "transactionIndex": hex(index),
+                "from": sender,
+                "gasPrice": hex(base_fee + 10**8),
+            }
+            transactions.append(transaction)
+
+            logs = []
+            for _ in range(self._count(rng, self.logs_per_transaction)):
+                address, topics, data = self._log(rng)
+                logs.append(
+                    {
+                        "address": address,
+                        "topics": topics,
+                        "data": data,
+                        "blockHash": block_hash,
+                        "blockNumber": hex(number),
+                        "blockTimestamp": hex(timestamp),
+                        "transactionHash": transaction_hash,
+                        "transactionIndex": hex(index),
+                        "logIndex": hex(log_index),
+                        "removed": False,
+                    }
+                )
+                log_index = log_index + 1
+
+            receipts.append(
+                {
+                    "blockHash": block_hash,
+                    "blockNumber": hex(number),
+                    "contractAddress": None,
+                    "cumulativeGasUsed": hex(cumulative_gas),
+                    "from": sender,
+                    "gasUsed": hex(gas_used),
+                    "effectiveGasPrice": hex(base_fee + 10**8),
+                    "logs": logs,
+                    "logsBloom": EMPTY_BLOOM,
+                    "status": "0x1",
+                    "to": target,
+                    "transactionHash": transaction_hash,
+                    "transactionIndex": hex(index),
+                    "type": "0x2",
+                }
+            )
+
+            num_traces = max(1, self._count(rng, self.traces_per_transaction))
+            for position in range(num_traces):
+                traces.append(
+                    {
+                        "action": {
+                            "from": sender if position == 0 else target,
+                            "callType": "call",
+                            "gas": hex(gas_used),
+                            "input": "0x" + rng.randbytes(36).hex(),
+                            "to": target if position == 0 else rng.choice(self.tokens),
+                            "value": "0x0",
+                        },
+                        "blockHash": block_hash,
+                        "blockNumber": number,
+                        "result": {"gasUsed": hex(gas_used // num_traces), "output": "0x"},
+                        "subtraces": num_traces - 1 if position == 0 else 0,
+                        "traceAddress": [] if position == 0 else [position - 1],
+                        "transactionHash": transaction_hash,
+                        "transactionPosition": index,
+                        "type": "call",
+                    }
+                )
+
+        withdrawals = [
+            {
+                "index": hex(number * self.withdrawals_per_block + i),
+                "validatorIndex": hex(rng.randrange(10**6)),
+                "address": self._address("validator", rng.randrange(10**4)),
+                "amount": hex(rng.randrange(10**7)),
+            }
+            for i in range(self.withdrawals_per_block)
+        ]
+
+        gas_used = cumulative_gas
+        block = {
+            "hash": block_hash,
+            "parentHash": self.block_hash(number - 1),
+            "sha3Uncles": self._hash("uncles", number),
+            "miner": self._address("miner", number % 50),
+            "stateRoot": self._hash("state", number),
+            "transactionsRoot": self._hash("transactions", number),
+            "receiptsRoot": self._hash("receipts", number),
+            "logsBloom": EMPTY_BLOOM,
+            "difficulty": "0x0",
+            "number": hex(number),
+            "gasLimit": hex(max(36_000_000, gas_used)),
+            "gasUsed": hex(gas_used),
+            "timestamp": hex(timestamp),
+            "extraData": "0x",
+            "mixHash": self._hash("mix", number),
+            "nonce": "0x0000000000000000",
+            "baseFeePerGas": hex(base_fee),
+            "withdrawalsRoot": self._hash("withdrawals", number),
+            "blobGasUsed": "0x0",
+            "excessBlobGas": "0x0",
+            "parentBeaconBlockRoot": self._hash("beacon", number),
+            "requestsHash": self._hash("requests", number),
+            "size": hex(1000 + 500 * len(transactions)),
+            "uncles": [],
+            "transactions": transactions,
+            "withdrawals": withdrawals,
+        }
+        return {"block": block, "receipts": receipts, "traces": traces}
+
+    # ------------------------------------------------------------------ logs
+
+    def _log(self, rng: random.Random):
+        if rng.random() >= self.dex_event_ratio:
+            values = {
+                "from": self._address("account", rng.randrange(10**6)),
+                "to": self._address("account", rng.randrange(10**6)),
+            }
+            topics = [TRANSFER_EVENT_HEX_SIGNATURE] + [
+                "0x" + encode(["address"], [values[name]]).hex() for name in ("from", "to")
+            ]
+            return rng.choice(self.tokens), topics, "0x" + encode(["uint256"], [rng.randrange(10**24)]).hex()
+
+        address = rng.choice(self.pool_addresses)
+        dex, token0, token1 = self.pools[address]
+        event = rng.choices(["swap", "mint", "burn", "created"], weights=[85, 7, 7, 1])[0]
+        amounts = [rng.randrange(10**20) for _ in range(4)]
+        account = self._address("account", rng.randrange(10**6))
+        tick_lower = rng.randrange(0, 400000, 60)
+        if dex == "uniswap_v2":
+            values = {
+                "swap": {"sender": account, "to": account, "amount0In": amounts[0], "amount1In": 0, "amount0Out": 0, "amount1Out": amounts[1]},
+                "mint": {"sender": account, "amount0": amounts[0], "amount1": amounts[1]},
+                "burn": {"sender": account, "to": account, "amount0": amounts[0], "amount1": amounts[1]},
+                "created": {"token0": token0, "token1": token1, "pair": address, "pairIndex": rng.randrange(10**5)},
+            }[event]
+            event = "pair_created" if event == "created" else event
+        else:
+            values = {
+                "swap": {"sender": account, "recipient": account, "amount0": amounts[0], "amount1": -amounts[1], "sqrtPriceX96": amounts[2], "liquidity": amounts[3], "tick": rng.randrange(-887272, 887272)},
+                "mint": {"sender": account, "owner": account, "tickLower": tick_lower, "tickUpper": tick_lower + 600, "amount": amounts[2], "amount0": amounts[0], "amount1": amounts[1]},
+                "burn": {"owner": account, "tickLower": tick_lower, "tickUpper": tick_lower + 600, "amount": amounts[2], "amount0": amounts[0], "amount1": amounts[1]},
+                "created": {"token0": token0, "token1": token1, "fee": 3000, "tickSpacing": 60, "pool": address},
+            }[event]
+            event = "pool_created" if event == "created" else event
+
+        inputs = EVENT_ABI[dex][event]["inputs"]
+        topics = [EVENT_HEX_SIGNATURES[dex][event]] + [
+            "0x" + encode([i["type"]], [values[i["name"]]]).hex() for i in inputs if i["indexed"]
+        ]
+        data = encode(
+            [i["type"] for i in inputs if not i["indexed"]],
+            [values[i["name"]] for i in inputs if not i["indexed"]],
+        )
+        return address, topics, "0x" + data.hex()
+
+    # ----------------------------------------------------------------- state
+
+    def balance(self, address: str):
+        return self._number("balance", address.lower()) % 10**22
+
+    def call(self, to: str, data: str):
+        """Return the hex output of an eth_call, raise Revert like a contract without the function."""
+        to = to.lower()
+        selector = data[:10]
+        if to == MULTICALL3_ADDRESS.lower() and selector == AGGREGATE3_SELECTOR:
+            calls = decode(["(address,bool,bytes)[]"], bytes.fromhex(data[10:]))[0]
+            results = []
+            for target, allow_failure, call_data in calls:
+                try:
+                    results.append((True, bytes.fromhex(self.call(target, "0x" + call_data.hex())[2:])))
+                except Revert:
+                    if not allow_failure:
+                        raise
+                    results.append((False, b""))
+            return "0x" + encode(["(bool,bytes)[]"], [results]).hex()
+
+        function = SELECTORS.get(selector)
+        if to in self.pools and function in ("token0", "token1"):
+            _, token0, token1 = self.pools[to]
+            return "0x" + encode(["address"], [token0 if function == "token0" else token1]).hex()
+
+        if to in self.pools and function == "getReserves":
+            reserves = [self._number("reserve", to, i) % 10**24 for i in range(2)]
+            return "0x" + encode(["uint112", "uint112", "uint32"], [*reserves, 0]).hex()
+
+        if to in self.token_info and function == "balanceOf":
+            owner = decode(["address"], bytes.fromhex(data[10:]))[0]
+            return "0x" + encode(["uint256"], [self._number("token_balance", to, owner) % 10**24]).hex()
+
+        if to in self.token_info and function in ("name", "symbol", "decimals", "totalSupply"):
+            value = self.token_info[to][function]
+            output_type = {"name": "string", "symbol": "string", "decimals": "uint8"}.get(function, "uint256")
+            return "0x" + encode([output_type], [value]).hex()
+
+        raise Revert("execution reverted")
@@ -1,6 +1,8 @@
-from eth_abi import decode
+from eth_abi import decode, encode
 from eth_utils import keccak, to_hex
 
+from src.abis.utils import get_input_type
+
 FUNCTION_ABI = {
     # https://gist.github.com/veox/8800debbf56e24718f9f483e1e40c35c
     "erc20": {
@@ -84,9 +86,42 @@ FUNCTION_ABI = {
             "stateMutability": "view",
             "type": "function",
         },
-    }
+    },
+    # https://github.com/mds1/multicall, deployed at MULTICALL3_ADDRESS on most evm chains
+    "multicall3": {
+        "aggregate3": {
+            "inputs": [
+                {
+                    "components": [
+                        {"internalType": "address", "name": "target", "type": "address"},
+                        {"internalType": "bool", "name": "allowFailure", "type": "bool"},
+                        {"internalType": "bytes", "name": "callData", "type": "bytes"},
+                    ],
+                    "internalType": "struct Multicall3.Call3[]",
+                    "name": "calls",
+                    "type": "tuple[]",
+                }
+            ],
+            "name": "aggregate3",
+            "outputs": [
+                {
+                    "components": [
+                        {"internalType": "bool", "name": "success", "type": "bool"},
+                        {"internalType": "bytes", "name": "returnData", "type": "bytes"},
+                    ],
+                    "internalType": "struct Multicall3.Result[]",
+                    "name": "returnData",
+                    "type": "tuple[]",
+                }
+            ],
+            "stateMutability": "payable",
+            "type": "function",
+        },
+    },
 }
 
+MULTICALL3_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+
 
 FUNCTION_TEXT_SIGNATURES = {}
 FUNCTION_HEX_SIGNATURES = {}
@@ -96,7 +131,7 @@ for erc in FUNCTION_ABI:
     FUNCTION_HEX_SIGNATURES[erc] = {}
 
     for func, schema in FUNCTION_ABI[erc].items():
-        input_types = [input["type"] for input in schema["inputs"]]
+        input_types = [get_input_type(input) for input in schema["inputs"]]
 
         text_signature = f"{schema['name']}({','.join(input_types)})"
         hex_signature = to_hex(keccak(text=text_signature))
@@ -110,10 +145,16 @@ def decode_function_output(erc, function_name, outputs):
 
     output_schemas = FUNCTION_ABI[erc][function_name]["outputs"]
     output_names = [i["name"] for i in output_schemas]
-    output_types = [i["type"] for i in output_schemas]
+    output_types = [get_input_type(i) for i in output_schemas]
 
     values = decode(output_types, bytes.fromhex(outputs[2:]))
     for name, val in zip(output_names, values):
         decoded[name] = val
 
     return decoded
+
+
+def encode_function_call(erc, function_name, args=()):
+    input_types = [get_input_type(i) for i in FUNCTION_ABI[erc][function_name]["inputs"]]
+    selector = FUNCTION_HEX_SIGNATURES[erc][function_name][:10]
+    return selector + encode(input_types, args).hex()
@@ -0,0 +1,161 @@
+from src.logger import logger
+
+
+class BatchSizer:
+    """Batch size per key (rpc method or sink) adapted from observed latency, payload size and errors.
+
+    Errors halve the size, slow or oversized batches shrink it in proportion to the
+    overshoot, and full batches that stayed under both targets grow it by 25%.
+    Sizes stay within [min_size, max_size].
+    """
+
+    def __init__(
+        self,
+        default_size: int,
+        min_size: int = 1,
+        max_size: int = 1000,
+        target_latency: float = 5.0,
+        max_bytes: int = 50 * 1024 * 1024,
+        initial_sizes: dict[str, int] = None,
+    ):
+        self.default_size = default_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency  # second
+        self.max_bytes = max_bytes
+        self._sizes: dict[str, float] = {
+            key: self._clamp(size) for key, size in (initial_sizes or {}).items()
+        }
+
+    def _clamp(self, size: float):
+        return min(max(size, self.min_size), self.max_size)
+
+    def size(self, key: str):
+        return int(self._sizes.get(key, self._clamp(self.default_size)))
+
+    def record(
+        self,
+        key: str,
+        size: int,
+        latency: float,
+        nbytes: int = 0,
+        error: bool = False,
+    ):
+        current = self._sizes.get(key, self._clamp(self.default_size))
+
+        if error:
+            new = current / 2
+        elif latency > self.target_latency or nbytes > self.max_bytes:
+            overshoot = max(latency / self.target_latency, nbytes / self.max_bytes)
+            new = current * max(0.5, 1 / overshoot)
+        elif size >= int(current):
+            # only a full batch tells us the current size is comfortable
+            new = max(current * 1.25, current + 1)
+        else:
+            return
+
+        new = self._clamp(new)
+        if int(new) != int(current):
+            logger.debug(
+                f"Batch size of {key}: {int(current)} -> {int(new)} (latency {latency:.2f}s, {nbytes} bytes, error {error})"
+            )
+
+        self._sizes[key] = new
+
+    def metrics(self):
+        return {key: int(size) for key, size in self._sizes.items()}
+
+
+# sink side controller, memgraph writes are shared by every dag
+memgraph_batch_sizer = BatchSizer(
+    default_size=500, min_size=50, max_size=5000, target_latency=2.0
+)
+
+
+class PayloadEstimator:
+    """Expected response bytes of a request, learned per (method, block region).
+
+    Requests whose first param is a hex block number fall into regions of
+    `region_size` blocks, so dense recent blocks and sparse old ones keep their
+    own estimate; other requests share one region per method. An unseen region
+    borrows the nearest learned region of its method. `split` cuts a batch into
+    sub-batches whose expected response stays under `max_bytes`.
+    """
+
+    def __init__(
+        self,
+        max_bytes: int = 16 * 1024 * 1024,
+        region_size: int = 100_000,
+        alpha: float = 0.3,
+    ):
+        self.max_bytes = max_bytes
+        self.region_size = region_size
+        self.alpha = alpha
+        self._estimates: dict[str, dict[int | None, float]] = {}  # method -> region -> bytes per request
+
+    def region(self, request: dict):
+        params = request.get("params") or []
+        if params and isinstance(params[0], str) and params[0].startswith("0x") and len(params[0]) <= 18:
+            return int(params[0], 16) // self.region_size
+        return None
+
+    def estimate(self, request: dict):
+        regions = self._estimates.get(request["method"])
+        if not regions:
+            return 0.0
+
+        region = self.region(request)
+        if region in regions:
+            return regions[region]
+
+        nearest = min(
+            regions,
+            key=lambda known: abs(known - region) if known is not None and region is not None else 0,
+        )
+        return regions[nearest]
+
+    def _update(self, requests: list[dict], per_request: float, floor: bool = False):
+        regions = self._estimates.setdefault(requests[0]["method"], {})
+        for region in {self.region(request) for request in requests}:
+            current = regions.get(region)
+            if current is None:
+                regions[region] = per_request
+            elif floor:
+                regions[region] = max(current, per_request)
+            else:
+                regions[region] = (1 - self.alpha) * current + self.alpha * per_request
+
+    def record(self, requests: list[dict], nbytes: int):
+        # one body for the whole batch, so every request is charged the average
+        self._update(requests, nbytes / len(requests))
+
+    def oversized(self, requests: list[dict]):
+        """The batch failed for its size, assume it was twice the budget."""
+        self._update(requests, 2 * self.max_bytes / len(requests), floor=True)
+
+    def split(self, requests: list[dict], max_count: int):
+        chunks = []
+        chunk = []
+        nbytes = 0.0
+        for request in requests:
+            estimate = self.estimate(request)
+            if chunk and (len(chunk) >= max_count or nbytes + estimate > self.max_bytes):
+                chunks.append(chunk)
+                chunk = []
+                nbytes = 0.0
+
+            chunk.append(request)
+            nbytes = nbytes + estimate
+
+        if chunk:
+            chunks.append(chunk)
+        return chunks
+
+    def metrics(self):
+        return {
+            method: {
+                (f"{region * self.region_size}+" if region is not None else "all"): int(estimate)
+                for region, estimate in regions.items()
+            }
+            for method, regions in self._estimates.items()
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import gzip
+import time
+from pathlib import Path
+
+import httpx
+import orjson
+
+from src.logger import logger
+
+
+class _Body(httpx.AsyncByteStream):
+    # a streamed body, so the client times the exchange like a network response
+    def __init__(self, content: bytes):
+        self.content = content
+
+    async def __aiter__(self):
+        yield self.content
+
+
+def _key(request: dict):
+    return orjson.dumps([request["method"], request["params"]])
+
+
+def _requests(content: bytes):
+    payload = orjson.loads(content)
+    return payload if isinstance(payload, list) else [payload]
+
+
+class RecordingTransport(httpx.AsyncBaseTransport):
+    """Pass posts through to the network and append every answered request to a cassette.
+
+    A cassette is gzip compressed json lines of {"request": [method, params],
+    "response": result or error, "elapsed": seconds of the post it came in}.
+    Requests are stored one by one rather than per batch, because batch sizes
+    and coalescing differ between runs. Retryable errors are left out so a
+    replay sees the answer the retry got.
+    """
+
+    def __init__(self, path: str | Path, transport: httpx.AsyncBaseTransport = None):
+        self.path = Path(path)
+        self.transport = transport or httpx.AsyncHTTPTransport(http2=True, verify=False)
+        self.file = gzip.open(self.path, "wb")
+        self.recorded = 0
+
+    async def handle_async_request(self, request: httpx.Request):
+        start = time.monotonic()
+        response = await self.transport.handle_async_request(request)
+        # read through an unsent Response so content-encoding is undone once, here
+        content = await httpx.Response(
+            response.status_code, headers=response.headers, stream=response.stream
+        ).aread()
+        elapsed = time.monotonic() - start
+
+        if response.status_code == 200:
+            self._record(request.content, content, elapsed)
+
+        headers = [
+            (name, value)
+            for name, value in response.headers.items()
+            if name.lower() not in ("content-encoding", "content-length", "transfer-encoding")
+        ]
+        return httpx.Response(
+            response.status_code,
+            headers=headers,
+            stream=_Body(content),
+            extensions=response.extensions,
+        )
+
+    def _record(self, request_content: bytes, content: bytes, elapsed: float):
+        # imported here, the client module imports this one
+        from src.clients.rpc_client import is_retryable
+
+        try:
+            requests = {request["id"]: request for request in _requests(request_content)}
+            responses = _requests(content)
+        except (orjson.JSONDecodeError, KeyError, TypeError):
+            return
+
+        for response in responses:
+            request = requests.get(response.get("id") if isinstance(response, dict) else None)
+            if request is None or is_retryable(response.get("error") or {}):
+                continue
+
+            answer = {key: value for key, value in response.items() if key in ("result", "error")}
+            line = {"request": [request["method"], request["params"]], "response": answer, "elapsed": elapsed}
+            self.file.write(orjson.dumps(line) + b"\n")
+            self.recorded = self.recorded + 1
+
+    async def aclose(self):
+        await self.transport.aclose()
+        if not self.file.closed:
+            self.file.close()
+            logger.info(f"Recorded {self.recorded} rpc responses to {self.path}")
+
+
+class ReplayTransport(httpx.AsyncBaseTransport):
+    """Answer posts from a cassette without touching the network.
+
+    Each request gets the recorded answer of the same (method, params) with its
+    own id. With timing="original" a post takes as long as the slowest original
+    post among its requests took, with timing="fast" it returns at once. Requests
+    missing from the cassette get a non retryable error.
+    """
+
+    def __init__(self, path: str | Path, timing: str = "original"):
+        if timing not in ("original", "fast"):
+            raise ValueError(f"Unknown replay timing: {timing}")
+
+        self.path = Path(path)
+        self.timing = timing
+        self.entries: dict[bytes, tuple[dict, float]] = {}
+        with gzip.open(self.path, "rb") as file:
+            for line in file:
+                item = orjson.loads(line)
+                self.entries[orjson.dumps(item["request"])] = (item["response"], item["elapsed"])
+
+        self.missing = 0
+        logger.info(f"Replaying {len(self.entries)} rpc responses from {self.path}")
+
+    async def handle_async_request(self, request: httpx.Request):
+        requests = _requests(await request.aread())
+        responses = []
+        delay = 0.0
+        for item in requests:
+            entry = self.entries.get(_key(item))
+            if entry is None:
+                self.missing = self.missing + 1
+                answer = {"error": {"code": -32000, "message": "missing from cassette"}}
+            else:
+                answer, elapsed = entry
+                delay = max(delay, elapsed)
+            responses.append({"jsonrpc": "2.0", "id": item.get("id"), **answer})
+
+        if self.timing == "original" and delay > 0:
+            await asyncio.sleep(delay)
+
+        return httpx.Response(
+            200,
+            headers={"content-type": "application/json"},
+            stream=_Body(orjson.dumps(responses)),
+        )
+
+    async def aclose(self):
+        if self.missing:
+            logger.warning(f"{self.missing} rpc requests were missing from {self.path}")
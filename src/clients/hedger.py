@@ -0,0 +1,63 @@
+from collections import deque
+
+
+class Hedger:
+    """Decide when a slow post gets a duplicate on a second provider.
+
+    The wall time of recent posts is kept per method, and once a post has run
+    longer than their `percentile` a hedge may go out. Every finished post earns
+    `budget` hedge tokens (holding at most `max_tokens`) and a hedge spends one,
+    so hedges stay around `budget` of all posts however slow providers get.
+    """
+
+    def __init__(
+        self,
+        percentile: float = 0.95,
+        budget: float = 0.05,
+        window: int = 200,
+        min_samples: int = 20,
+        max_tokens: float = 10,
+    ):
+        self.percentile = percentile
+        self.budget = budget
+        self.window = window
+        self.min_samples = min_samples
+        self.max_tokens = max_tokens
+        self.tokens = 0.0
+        self._latencies: dict[str, deque[float]] = {}
+        self.hedged = 0
+        self.won = 0  # hedges that answered before the original post
+
+    def delay(self, key: str):
+        """Seconds to wait before hedging a post of `key`, None until enough posts were seen."""
+        latencies = self._latencies.get(key)
+        if latencies is None or len(latencies) < self.min_samples:
+            return None
+
+        ordered = sorted(latencies)
+        return ordered[int(self.percentile * (len(ordered) - 1))]
+
+    def record(self, key: str, latency: float):
+        if key not in self._latencies:
+            self._latencies[key] = deque(maxlen=self.window)
+        self._latencies[key].append(latency)
+        self.tokens = min(self.tokens + self.budget, self.max_tokens)
+
+    def spend(self):
+        if self.tokens < 1:
+            return False
+
+        self.tokens = self.tokens - 1
+        self.hedged = self.hedged + 1
+        return True
+
+    def metrics(self):
+        return {
+            "hedged": self.hedged,
+            "won": self.won,
+            "delays": {
+                key: round(delay, 3)
+                for key in self._latencies
+                if (delay := self.delay(key)) is not None
+            },
+        }
@@ -0,0 +1,204 @@
+import asyncio
+import random
+import time
+from contextlib import asynccontextmanager
+from dataclasses import dataclass, field
+
+import httpx
+
+from src.clients.throttler import AdaptiveThrottler
+from src.logger import logger
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+
+@dataclass
+class Provider:
+    uri: str
+    client: httpx.AsyncClient
+    connection_pool: asyncio.Semaphore
+    latency: float | None = None  # second, ewma of successful posts
+    error_rate: float = 0.0  # ewma of failed posts
+    in_flight: int = 0
+    stats: dict = field(default_factory=lambda: {"requests": 0, "errors": 0})
+    # circuit breaker
+    state: str = CLOSED
+    open_until: float = 0.0
+    open_timeout: float = 0.0  # second, doubles on every failed probe
+    probe_started: float | None = None
+
+
+class ProviderPool:
+    """Spread rpc posts over every provider uri, weighted by learned rate, latency and errors.
+
+    Each provider has its own http client, connection limit and AIMD throttler
+    (starting at its configured capacity). `pick` draws a provider at random with
+    weight rate * (1 - error_rate)^2 / (latency * (in_flight + 1)), and callers pass
+    the providers a request already failed on so the retry lands somewhere else.
+
+    Each provider also has a circuit breaker. Once its error rate reaches
+    `failure_threshold` it opens and gets no traffic for `open_timeout` seconds.
+    It then turns half-open and lets a single probe through: a success closes
+    it, a failure opens it again for twice as long (up to `max_open_timeout`).
+    """
+
+    def __init__(
+        self,
+        uris: list[str],
+        rate_limit: float,
+        max_rate_limit: float,
+        capacities: dict[str, float] = None,
+        max_connections: int = 10,
+        alpha: float = 0.2,
+        failure_threshold: float = 0.5,
+        open_timeout: float = 5.0,
+        max_open_timeout: float = 120.0,
+        probe_timeout: float = 60.0,
+        headers: dict = None,
+        timeout: httpx.Timeout = None,
+        transport: httpx.AsyncBaseTransport = None,
+    ):
+        self.alpha = alpha
+        self.failure_threshold = failure_threshold
+        self.open_timeout = open_timeout
+        self.max_open_timeout = max_open_timeout
+        self.probe_timeout = probe_timeout  # a probe without an outcome by then (e.g. cancelled) is given up
+        self.throttler = AdaptiveThrottler(rate_limit=rate_limit, max_rate_limit=max_rate_limit)
+        self.providers: list[Provider] = []
+        for uri in uris:
+            self.throttler.get(uri, (capacities or {}).get(uri))
+            self.providers.append(
+                Provider(
+                    uri=uri,
+                    client=httpx.AsyncClient(
+                        headers=headers,
+                        http2=True,
+                        verify=False,
+                        timeout=timeout,
+                        transport=transport,
+                    ),
+                    connection_pool=asyncio.Semaphore(max_connections),
+                    open_timeout=open_timeout,
+                )
+            )
+
+    def _score(self, provider: Provider, default_latency: float):
+        latency = provider.latency if provider.latency is not None else default_latency
+        rate = self.throttler.rate(provider.uri)
+        # a failing provider keeps a small share so it is probed and can recover
+        health = max((1 - provider.error_rate) ** 2, 0.01)
+        return rate * health / (latency * (provider.in_flight + 1))
+
+    def _admits(self, provider: Provider, now: float):
+        if provider.state == OPEN and now >= provider.open_until:
+            provider.state = HALF_OPEN
+            provider.probe_started = None
+            logger.info(f"Circuit of {provider.uri} half-open, probing")
+
+        if provider.state == HALF_OPEN:
+            return provider.probe_started is None or now - provider.probe_started > self.probe_timeout
+
+        return provider.state == CLOSED
+
+    def available(self, exclude: list[Provider] = ()):
+        """Providers whose circuit lets a request through, minus exclude."""
+        now = time.monotonic()
+        return [
+            provider
+            for provider in self.providers
+            if provider not in exclude and self._admits(provider, now)
+        ]
+
+    def pick(self, exclude: list[Provider] = ()):
+        candidates = self.available(exclude) or self.available()
+        if not candidates:
+            # every circuit is open, try the one closest to probing rather than nothing
+            candidates = [min(self.providers, key=lambda provider: provider.open_until)]
+
+        # unmeasured providers look like an average one so they get probed
+        latencies = [provider.latency for provider in self.providers if provider.latency is not None]
+        default_latency = sum(latencies) / len(latencies) if latencies else 1.0
+
+        weights = [self._score(provider, default_latency) for provider in candidates]
+        provider = random.choices(candidates, weights=weights)[0]
+        if provider.state == HALF_OPEN:
+            provider.probe_started = time.monotonic()
+        return provider
+
+    def success(self, provider: Provider, latency: float):
+        if provider.latency is None:
+            provider.latency = latency
+        else:
+            provider.latency = (1 - self.alpha) * provider.latency + self.alpha * latency
+
+        provider.error_rate = (1 - self.alpha) * provider.error_rate
+        provider.stats["requests"] = provider.stats["requests"] + 1
+        self.throttler.success(provider.uri)
+
+        if provider.state == HALF_OPEN:
+            provider.state = CLOSED
+            provider.error_rate = 0.0
+            provider.open_timeout = self.open_timeout
+            provider.probe_started = None
+            logger.info(f"Circuit of {provider.uri} closed")
+
+    def failure(self, provider: Provider, throttled: bool = False):
+        provider.error_rate = (1 - self.alpha) * provider.error_rate + self.alpha
+        provider.stats["requests"] = provider.stats["requests"] + 1
+        provider.stats["errors"] = provider.stats["errors"] + 1
+        if throttled:
+            self.throttler.throttled(provider.uri)
+
+        if provider.state == HALF_OPEN:
+            provider.open_timeout = min(provider.open_timeout * 2, self.max_open_timeout)
+            self._open(provider)
+        elif provider.state == CLOSED and provider.error_rate >= self.failure_threshold:
+            self._open(provider)
+
+    def _open(self, provider: Provider):
+        provider.state = OPEN
+        provider.open_until = time.monotonic() + provider.open_timeout
+        provider.probe_started = None
+        logger.warning(
+            f"Circuit of {provider.uri} open for {provider.open_timeout:.1f}s (error rate {provider.error_rate:.2f})"
+        )
+
+    async def post(self, provider: Provider, payload: bytes, weight: float = 1, started: asyncio.Future = None):
+        # started gets the monotonic time the permits were granted, the rest is the http exchange
+        async with provider.connection_pool:
+            await self.throttler.get(provider.uri).acquire(weight)
+            if started is not None and not started.done():
+                started.set_result(time.monotonic())
+            provider.in_flight = provider.in_flight + 1
+            try:
+                return await provider.client.post(provider.uri, content=payload)
+            finally:
+                provider.in_flight = provider.in_flight - 1
+
+    @asynccontextmanager
+    async def stream(self, provider: Provider, payload: bytes, weight: float = 1):
+        """Like post, but the body is left unread for the caller to iterate."""
+        async with provider.connection_pool:
+            await self.throttler.get(provider.uri).acquire(weight)
+            provider.in_flight = provider.in_flight + 1
+            try:
+                async with provider.client.stream("POST", provider.uri, content=payload) as response:
+                    yield response
+            finally:
+                provider.in_flight = provider.in_flight - 1
+
+    def metrics(self):
+        return {
+            provider.uri: {
+                "rate_limit": round(self.throttler.rate(provider.uri), 2),
+                "latency": round(provider.latency, 3) if provider.latency is not None else None,
+                "error_rate": round(provider.error_rate, 3),
+                "circuit": provider.state,
+                **provider.stats,
+            }
+            for provider in self.providers
+        }
+
+    async def close(self):
+        for provider in self.providers:
+            await provider.client.aclose()
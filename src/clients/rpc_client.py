@@ -1,12 +1,110 @@
 import asyncio
 import itertools
+import math
+import time
 
 import httpx
 import orjson
 
-from src.clients.throttler import Throttler
+from src.clients.batch_sizer import BatchSizer, PayloadEstimator
+from src.clients.cassette import RecordingTransport, ReplayTransport
+from src.clients.hedger import Hedger
+from src.clients.provider_pool import Provider, ProviderPool
 from src.configs.environment import env
 from src.logger import logger
+from src.services.response_cache_service import ResponseCacheService
+from src.utils.json_stream import JsonArrayParser
+
+
+# json-rpc errors worth resending, anything else (reverts, invalid params, ...) is an answer
+RETRYABLE_ERROR_CODES = {-32005, -32603, 429}
+RETRYABLE_ERROR_MESSAGES = (
+    "rate limit",
+    "too many requests",
+    "limit exceeded",
+    "capacity",
+    "timeout",
+    "timed out",
+    "header not found",
+    "unknown block",
+    "busy",
+    "try again",
+    "internal error",
+)
+
+
+# eth_getLogs over a range with more logs than the provider returns at once, answered by splitting the range.
+# some providers send them as -32005 "limit exceeded", resending the same range would only fail again
+RANGE_ERROR_MESSAGES = (
+    "query returned more than",
+    "too many results",
+    "response size exceeded",
+    "block range",
+    "range is too large",
+    "range too large",
+)
+
+
+def is_range_error(error: dict):
+    message = str(error.get("message", "")).lower()
+    return any(pattern in message for pattern in RANGE_ERROR_MESSAGES)
+
+
+def is_retryable(error: dict):
+    if is_range_error(error):
+        return False
+
+    message = str(error.get("message", "")).lower()
+    return error.get("code") in RETRYABLE_ERROR_CODES or any(
+        pattern in message for pattern in RETRYABLE_ERROR_MESSAGES
+    )
+
+
+def is_rate_limited(error: dict):
+    if is_range_error(error):
+        return False
+
+    message = str(error.get("message", "")).lower()
+    return (
+        error.get("code") in (-32005, 429)
+        or "rate limit" in message
+        or "too many requests" in message
+    )
+
+
+# provider complaints about a batch or response being too big, answered by splitting the batch
+SIZE_ERROR_MESSAGES = (
+    "too large",
+    "response size",
+    "size limit",
+    "size exceeded",
+    "batch limit",
+    "batch size",
+    "body limit",
+)
+
+
+def is_size_error(error: dict):
+    message = str(error.get("message", "")).lower()
+    return any(pattern in message for pattern in SIZE_ERROR_MESSAGES)
+
+
+class RpcError(Exception):
+    pass
+
+
+class _Abandoned(Exception):
+    """Set on a coalesced request whose owning call was cancelled."""
+
+
+def raise_for_failed_blocks(method: str, block_numbers: list[int], responses: list[dict]):
+    failed = [
+        block_number
+        for block_number, response in zip(block_numbers, responses)
+        if "error" in response or response.get("result") is None
+    ]
+    if failed:
+        raise RpcError(f"{method} failed for blocks {failed}")
 
 
 class RpcClient:
@@ -15,6 +113,23 @@ class RpcClient:
         uris: list[str] = env.PROVIDER_URIS,
         max_retries: int = 5,
         backoff: float = 3,
+        batch_size: int = 30,
+        min_batch_size: int = 1,
+        max_batch_size: int = 1000,
+        target_latency: float = 5.0,
+        rate_limit: float = 50,
+        max_rate_limit: float = 1000,
+        method_weights: dict[str, float] = None,
+        capacities: dict[str, float] = None,
+        cache_max_bytes: int = 0,
+        cache_path: str = None,
+        stream_responses: bool = False,
+        hedge_percentile: float = None,
+        hedge_budget: float = 0.05,
+        record_cassette: str = None,
+        replay_cassette: str = None,
+        replay_timing: str = "original",
+        max_response_bytes: int = 16 * 1024 * 1024,
     ):
         self.uris = uris
         timeout = httpx.Timeout(timeout=60)
@@ -22,12 +137,37 @@ class RpcClient:
             "Content-Type": "application/json",
             "User-Agent": "Mozilla/5.0 (Linux; Android 10; K) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36",
         }
-        self.client = httpx.AsyncClient(
-            headers=headers, http2=True, verify=False, timeout=timeout
-        )
         self.request_counter = itertools.count()
-        self.throttler = Throttler(rate_limit=50, period=1)
-        self.connection_pool = asyncio.Semaphore(10)
+        # every provider posts through one transport that records to, or replays from, a cassette file
+        transport = None
+        if replay_cassette is not None:
+            transport = ReplayTransport(replay_cassette, replay_timing)
+        elif record_cassette is not None:
+            transport = RecordingTransport(record_cassette)
+        # rate_limit is the starting rate of providers without a configured capacity,
+        # the real one is learned from 429s and timeouts
+        self.providers = ProviderPool(
+            uris,
+            rate_limit=rate_limit,
+            max_rate_limit=max(rate_limit, max_rate_limit),
+            capacities=env.PROVIDER_RATE_LIMITS if capacities is None else capacities,
+            headers=headers,
+            timeout=timeout,
+            transport=transport,
+        )
+        # without weights a batch post costs one permit, with them each request in it costs its method's weight
+        self.method_weights = method_weights
+        # an eth_call of the enrichment tasks is a Multicall3 aggregate of up to 200 view calls,
+        # a batch starts at a few of them and the sizer takes it from there
+        self.batch_sizer = BatchSizer(
+            default_size=batch_size,
+            min_size=min_batch_size,
+            max_size=max_batch_size,
+            target_latency=target_latency,
+            initial_sizes={"eth_call": 4},
+        )
+        # on top of the count, batches are cut so their expected response stays under max_response_bytes
+        self.payloads = PayloadEstimator(max_bytes=max_response_bytes)
 
         self.max_retries = max_retries
         self.backoff = backoff
@@ -35,9 +175,29 @@ class RpcClient:
         self._backoff_event = asyncio.Event()
         self._backoff_event.set()
 
-    def pick_uri(self, attempt: int):
-        idx = (attempt - 1) % len(self.uris)
-        return self.uris[idx]
+        # (method, params) -> response future of the identical request already on the wire
+        self._in_flight: dict[tuple[str, bytes], asyncio.Future] = {}
+        self.coalesced = 0
+
+        # parse receipt/trace batches element by element while they download
+        self.stream_responses = stream_responses
+
+        # optional on-disk cache of finalized block data, the finalized head is refreshed every minute
+        self.cache = None
+        if cache_max_bytes > 0:
+            self.cache = ResponseCacheService(cache_path, cache_max_bytes)
+        self._finalized_block: int | None = None
+        self._finalized_checked = -math.inf
+
+        # optional duplicate of posts slower than this latency percentile, sent to a second provider
+        self.hedger = None
+        if hedge_percentile is not None:
+            self.hedger = Hedger(percentile=hedge_percentile, budget=hedge_budget)
+        # primaries beaten by their hedge, left to finish so their latency is recorded
+        self._outpaced: set[asyncio.Task] = set()
+
+        # widest eth_getLogs block range the providers answered, None until one said too many results
+        self.max_log_range: int | None = None
 
     def form_request(self, method: str, params: list):
         request_id = next(self.request_counter)
@@ -80,42 +240,483 @@ class RpcClient:
         requests = [
             self.form_request("eth_getBlockByNumber", params) for params in param_sets
         ]
-        return await self.send_and_read(requests=requests)
+        return await self.send_and_read(requests=requests, retry_null=True)
 
     async def get_receipt_by_block_number(self, block_numbers: list[int]):
         param_sets = [[hex(block_number)] for block_number in block_numbers]
         requests = [
             self.form_request("eth_getBlockReceipts", params) for params in param_sets
         ]
-        return await self.send_and_read(requests=requests)
+        return await self.send_and_read(requests=requests, retry_null=True)
+
+    def iter_receipt_by_block_number(self, block_numbers: list[int]):
+        param_sets = [[hex(block_number)] for block_number in block_numbers]
+        requests = [
+            self.form_request("eth_getBlockReceipts", params) for params in param_sets
+        ]
+        return self._iter_blocks(requests)
+
+    def iter_trace_by_block_number(self, block_numbers: list[int]):
+        param_sets = [[hex(block_number)] for block_number in block_numbers]
+        requests = [self.form_request("trace_block", params) for params in param_sets]
+        return self._iter_blocks(requests)
+
+    async def _iter_blocks(self, requests: list[dict]):
+        async for request, response in self.iter_responses(requests, retry_null=True):
+            yield int(request["params"][0], 16), response
 
     async def get_trace_by_block_number(self, block_numbers: list[int]):
         param_sets = [[hex(block_number)] for block_number in block_numbers]
         requests = [self.form_request("trace_block", params) for params in param_sets]
-        return await self.send_and_read(requests=requests)
+        return await self.send_and_read(requests=requests, retry_null=True)
+
+    async def get_logs(self, from_block: int, to_block: int, topics: list = None):
+        """Return the logs of blocks from_block to to_block, optionally filtered by topics.
+
+        The range goes out in spans of max_log_range blocks. A span the provider
+        has too many results for is halved and max_log_range shrinks with it, so
+        later calls start from a range the providers answer. Spans that keep
+        succeeding let it grow again by a quarter.
+        """
+        span = to_block - from_block + 1
+        if self.max_log_range is not None:
+            span = min(span, self.max_log_range)
+        ranges = [(start, min(start + span - 1, to_block)) for start in range(from_block, to_block + 1, span)]
+
+        logs = []
+        split = False
+        while ranges:
+            log_filter = {} if topics is None else {"topics": topics}
+            requests = [
+                self.form_request("eth_getLogs", [{"fromBlock": hex(start), "toBlock": hex(end), **log_filter}])
+                for start, end in ranges
+            ]
+            responses = await self.send_and_read(requests=requests)
+
+            failed = []
+            retry = []
+            for (start, end), response in zip(ranges, responses):
+                error = response.get("error")
+                if error is None and response.get("result") is not None:
+                    logs.extend(response["result"])
+                elif error is not None and is_range_error(error) and start < end:
+                    middle = (start + end) // 2
+                    retry.extend([(start, middle), (middle + 1, end)])
+                else:
+                    failed.append((start, end))
+
+            if failed:
+                raise RpcError(f"eth_getLogs failed for block ranges {failed}")
+
+            if retry:
+                split = True
+                span = retry[0][1] - retry[0][0] + 1
+                self.max_log_range = span if self.max_log_range is None else min(self.max_log_range, span)
+                logger.warning(f"Splitting eth_getLogs into ranges of {span} blocks, the provider had too many results")
+            ranges = retry
+
+        if not split and self.max_log_range is not None and span >= self.max_log_range:
+            self.max_log_range = self.max_log_range + max(self.max_log_range // 4, 1)
+
+        return logs
+
+    async def iter_responses(self, requests: list[dict], retry_null: bool = False):
+        """Yield (request, response) pairs as responses arrive, in no particular order.
+
+        With stream_responses, finalized blocks are answered from the cache and
+        requests already in flight from another call wait for that call, like in
+        send_and_read. The rest is parsed element by element while it downloads,
+        so only one response is held at a time. Otherwise this is send_and_read.
+        """
+        if not self.stream_responses:
+            responses = await self.send_and_read(requests, retry_null)
+            for pair in zip(requests, responses):
+                yield pair
+            return
+
+        cache_keys = {}
+        if self.cache is not None:
+            finalized_block = await self.finalized_block()
+            cache_keys = {
+                request["id"]: self.cache.key(request)
+                for request in requests
+                if self.cache.cacheable(request, finalized_block)
+            }
+            hits = await asyncio.to_thread(self.cache.get, list(cache_keys.values()))
+            missed = []
+            for request in requests:
+                cache_key = cache_keys.get(request["id"])
+                if cache_key in hits:
+                    yield request, {"jsonrpc": "2.0", "id": request["id"], "result": hits[cache_key]}
+                else:
+                    missed.append(request)
+            requests = missed
+
+        keys = [(request["method"], orjson.dumps(request["params"])) for request in requests]
+        owned, futures = self._claim(keys, requests)
+        try:
+            async for request, response, raw in self._iter_stream(list(owned.values()), retry_null):
+                key = (request["method"], orjson.dumps(request["params"]))
+                futures[key].set_result(response)
+
+                cache_key = cache_keys.get(request["id"])
+                if cache_key is not None and "error" not in response and response.get("result") is not None:
+                    # the bytes as they came off the wire, only resent requests have to be encoded
+                    await asyncio.to_thread(self.cache.put, {cache_key: raw or response})
+                yield request, response
+        except (asyncio.CancelledError, GeneratorExit):
+            # the waiters were not cancelled, they send the request again themselves
+            for key in owned:
+                if not futures[key].done():
+                    futures[key].set_exception(_Abandoned())
+            raise
+        except Exception as e:
+            for key in owned:
+                if not futures[key].done():
+                    futures[key].set_exception(e)
+            raise
+        finally:
+            for key in owned:
+                del self._in_flight[key]
+
+        # duplicates inside the call and requests another call had in flight
+        for key, request in zip(keys, requests):
+            if owned.get(key) is request:
+                continue
+
+            try:
+                response = await asyncio.shield(futures[key])
+            except _Abandoned:
+                response = (await self.send_and_read([request], retry_null))[0]
+            yield request, {**response, "id": request["id"]}
+
+    async def _iter_stream(self, requests: list[dict], retry_null: bool = False):
+        # every chunk of the batch is streamed once, the few that failed are resent by _send_and_read.
+        # Yields (request, response, raw bytes of the response), raw is None for resent requests
+        # and when there is no cache to keep them for
+        if not requests:
+            return
+
+        pending = {request["id"]: request for request in requests}
+        queue = asyncio.Queue()
+        size = self.batch_sizer.size(requests[0]["method"])
+        tasks = [
+            asyncio.create_task(self._stream(chunk, queue))
+            for chunk in self.payloads.split(requests, size)
+        ]
+        try:
+            finished = 0
+            while finished < len(tasks):
+                item = await queue.get()
+                if item is None:
+                    finished = finished + 1
+                    continue
+
+                response, raw = item
+                request = pending.get(response.get("id"))
+                if request is None:
+                    continue
+
+                error = response.get("error")
+                if error is not None and is_retryable(error):
+                    continue
+                if error is None and retry_null and response.get("result") is None:
+                    continue
+
+                del pending[request["id"]]
+                yield request, response, raw
+        finally:
+            for task in tasks:
+                task.cancel()
+
+        if pending:
+            # these keys are already in flight under the caller, so past the coalescing of send_and_read
+            retried = list(pending.values())
+            responses = await self._send_and_read(retried, retry_null)
+            for request, response in zip(retried, responses):
+                yield request, response, None
+
+    async def _stream(self, requests: list[dict], queue: asyncio.Queue):
+        # one attempt, what does not come back is resent by the caller
+        method = requests[0]["method"]
+        provider = self.providers.pick()
+        nbytes = 0
+        try:
+            await self._backoff_event.wait()
+            payload = orjson.dumps(requests)
+            async with self.providers.stream(provider, payload, self.weight(requests)) as response:
+                if response.status_code != 200:
+                    raise httpx.HTTPStatusError(
+                        f"status {response.status_code}", request=response.request, response=response
+                    )
+
+                keep_raw = self.cache is not None
+                parser = JsonArrayParser(keep_raw)
+                throttled = False
+                async for chunk in response.aiter_bytes():
+                    nbytes = nbytes + len(chunk)
+                    for item in parser.feed(chunk):
+                        element, raw = item if keep_raw else (item, None)
+                        throttled = throttled or is_rate_limited(element.get("error", {}))
+                        queue.put_nowait((element, raw))
+                parser.close()
+
+            if throttled:
+                self.providers.failure(provider, throttled=True)
+            else:
+                self.providers.success(provider, response.elapsed.total_seconds())
+            self.batch_sizer.record(method, len(requests), response.elapsed.total_seconds(), nbytes)
+            self.payloads.record(requests, nbytes)
+        except Exception as e:
+            self.batch_sizer.record(method, len(requests), 0, error=True)
+            if isinstance(e, httpx.ReadTimeout) or (
+                isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 413
+            ):
+                # the resend through send_and_read is then cut smaller
+                self.payloads.oversized(requests)
+            rate_limited = isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 429
+            self.providers.failure(
+                provider, throttled=rate_limited or isinstance(e, httpx.TimeoutException)
+            )
+            logger.warning(f"Failed to stream {len(requests)} {method} requests: {e}")
+        finally:
+            queue.put_nowait(None)
+
+    def _claim(self, keys: list[tuple[str, bytes]], requests: list[dict]):
+        """Put the requests nobody has in flight under this call, return them by key and every key's future."""
+        loop = asyncio.get_running_loop()
+        owned = {}
+        for key, request in zip(keys, requests):
+            if key not in self._in_flight:
+                future = loop.create_future()
+                # nobody may wait on it, the exception still counts as retrieved
+                future.add_done_callback(lambda f: f.cancelled() or f.exception())
+                self._in_flight[key] = future
+                owned[key] = request
+
+        self.coalesced = self.coalesced + len(requests) - len(owned)
+        return owned, {key: self._in_flight[key] for key in keys}
+
+    async def send_and_read(self, requests: list[dict], retry_null: bool = False):
+        """Send requests and return their responses in request order.
+
+        Identical requests (same method and params, block tag included) are sent
+        once: duplicates inside the call are collapsed, and a request already in
+        flight from another call waits for that call's response.
+        """
+        keys = [(request["method"], orjson.dumps(request["params"])) for request in requests]
+        owned, futures = self._claim(keys, requests)
+
+        if owned:
+            try:
+                responses = await self._cached_send_and_read(list(owned.values()), retry_null)
+                for key, response in zip(owned, responses):
+                    futures[key].set_result(response)
+            except asyncio.CancelledError:
+                # the waiters were not cancelled, they send the request again themselves
+                for key in owned:
+                    futures[key].set_exception(_Abandoned())
+                raise
+            except Exception as e:
+                for key in owned:
+                    futures[key].set_exception(e)
+                raise
+            finally:
+                for key in owned:
+                    del self._in_flight[key]
+
+        # shield, a cancelled caller must not cancel a response other calls share
+        responses = []
+        for key, request in zip(keys, requests):
+            try:
+                response = await asyncio.shield(futures[key])
+            except _Abandoned:
+                # its owner was cancelled before the answer came, the first waiter here takes over
+                response = (await self.send_and_read([request], retry_null))[0]
+            responses.append({**response, "id": request["id"]})
 
-    async def send_and_read(self, requests):
-        responses = await self.post(requests)
         return responses
 
+    async def finalized_block(self):
+        if time.monotonic() - self._finalized_checked > 60:
+            self._finalized_checked = time.monotonic()
+            request = self.form_request("eth_getBlockByNumber", ["finalized", False])
+            response = (await self._send_and_read([request]))[0]
+            if response.get("result"):
+                self._finalized_block = int(response["result"]["number"], 16)
+
+        return self._finalized_block
+
+    async def _cached_send_and_read(self, requests: list[dict], retry_null: bool = False):
+        if self.cache is None:
+            return await self._send_and_read(requests, retry_null)
+
+        finalized_block = await self.finalized_block()
+        keys = {
+            request["id"]: self.cache.key(request)
+            for request in requests
+            if self.cache.cacheable(request, finalized_block)
+        }
+        hits = await asyncio.to_thread(self.cache.get, list(keys.values()))
+
+        misses = [request for request in requests if keys.get(request["id"]) not in hits]
+        fresh = {}
+        if misses:
+            responses = await self._send_and_read(misses, retry_null)
+            fresh = {request["id"]: response for request, response in zip(misses, responses)}
+
+        await asyncio.to_thread(
+            self.cache.put,
+            {
+                keys[request_id]: response
+                for request_id, response in fresh.items()
+                if request_id in keys
+                and "error" not in response
+                and response.get("result") is not None
+            },
+        )
+
+        return [
+            fresh[request["id"]]
+            if request["id"] in fresh
+            else {"jsonrpc": "2.0", "id": request["id"], "result": hits[keys[request["id"]]]}
+            for request in requests
+        ]
+
+    async def _send_and_read(self, requests: list[dict], retry_null: bool = False):
+        """Send requests and return their responses in request order.
+
+        Responses are matched by id. Missing ones, retryable errors and, with
+        retry_null, null results (a block the provider has not seen yet) are
+        resent alone with exponential backoff. Whatever still fails after
+        max_retries rounds comes back as an error response.
+        """
+        method = requests[0]["method"]
+        pending = {request["id"]: request for request in requests}
+        answered = {}
+        for attempt in range(1, self.max_retries + 1):
+            if attempt > 1:
+                await asyncio.sleep(min(self.backoff * 2 ** (attempt - 2), 30))
+
+            # requests of one call share a method, split them by its current batch size and their expected bytes
+            batch = list(pending.values())
+            size = self.batch_sizer.size(method)
+            chunks = await asyncio.gather(
+                *(self.post(chunk) for chunk in self.payloads.split(batch, size))
+            )
+
+            for response in (response for chunk in chunks if chunk for response in chunk):
+                if response.get("id") not in pending:
+                    continue
+
+                error = response.get("error")
+                if error is not None and is_retryable(error):
+                    answered[response["id"]] = response
+                    continue
+
+                if error is None and retry_null and response.get("result") is None:
+                    answered[response["id"]] = response
+                    continue
+
+                answered[response["id"]] = response
+                del pending[response["id"]]
+
+            if not pending or attempt == self.max_retries:
+                break
+
+            logger.warning(
+                f"[Attempt {attempt}/{self.max_retries}] Resending {len(pending)}/{len(requests)} {method} requests"
+            )
+
+        if pending:
+            logger.error(
+                f"Giving up on {len(pending)} {method} requests: {[request['params'] for request in pending.values()]}"
+            )
+
+        return [
+            answered.get(
+                request["id"],
+                {
+                    "jsonrpc": "2.0",
+                    "id": request["id"],
+                    "error": {"code": -32603, "message": "no response"},
+                },
+            )
+            for request in requests
+        ]
+
     async def post(self, requests: str):
         payload = orjson.dumps(requests)
-        # network error retry
+        method = requests[0]["method"]
+        # network error retry, every attempt goes to a provider this request has not failed on yet
+        tried: list[Provider] = []
         for attempt in range(1, self.max_retries + 1):
             await self._backoff_event.wait()
 
+            provider = self.providers.pick(exclude=tried)
+            tried.append(provider)
             try:
-                responses = await self._post(payload)
+                provider, response = await self._post(
+                    payload, provider, self.weight(requests), method
+                )
+                if response.status_code == 429:
+                    # the throttler slows this provider down, no need to stall everyone
+                    self.providers.failure(provider, throttled=True)
+                    self.batch_sizer.record(method, len(requests), 0, error=True)
+                    logger.warning(
+                        f"[Attempt {attempt}/{self.max_retries}] Rate limited on {len(requests)} requests"
+                    )
+                    continue
+
+                if response.status_code == 413 and len(requests) > 1:
+                    self.batch_sizer.record(method, len(requests), 0, error=True)
+                    return await self._bisect(requests)
+
                 responses = orjson.loads(
-                    responses.content
+                    response.content
                 )  # b'<html><body><h1>429 Too Many Requests</h1>\nYou have sent too many requests in a given amount of time.\n</body></html>\n'
+                if isinstance(responses, dict):
+                    # one error for the whole batch instead of a response per request
+                    error = responses.get("error") or {}
+                    if is_size_error(error) and len(requests) > 1:
+                        self.batch_sizer.record(method, len(requests), 0, error=True)
+                        return await self._bisect(requests)
+                    raise RpcError(f"Batch rejected: {error}")
+
+                if len(requests) > 1 and any(is_size_error(item.get("error") or {}) for item in responses):
+                    self.batch_sizer.record(method, len(requests), 0, error=True)
+                    return await self._bisect(requests)
+
                 responses = sorted(responses, key=lambda response: response["id"])
+                if any(is_rate_limited(item.get("error", {})) for item in responses):
+                    self.providers.failure(provider, throttled=True)
+                else:
+                    self.providers.success(provider, response.elapsed.total_seconds())
+                # elapsed covers only the http exchange, not the throttler wait
+                self.batch_sizer.record(
+                    method,
+                    len(requests),
+                    response.elapsed.total_seconds(),
+                    len(response.content),
+                )
+                self.payloads.record(requests, len(response.content))
                 logger.debug(f"Successfully processed {len(requests)} requests")
                 return responses
             except Exception as e:
+                self.batch_sizer.record(method, len(requests), 0, error=True)
                 logger.warning(
                     f"[Attempt {attempt}/{self.max_retries}] Failed to process {len(requests)} requests: {e}"
                 )
+                timeout = isinstance(e, httpx.TimeoutException)
+                self.providers.failure(provider, throttled=timeout)
+                # a body that did not arrive in time is most likely too big, halve it instead of resending it whole
+                if isinstance(e, httpx.ReadTimeout) and len(requests) > 1:
+                    return await self._bisect(requests)
+                # only back off once no provider with a closed (or probing) circuit is left to try
+                if timeout or self.providers.available(exclude=tried):
+                    continue
+
+                tried.clear()
                 if self._backoff_event.is_set():
                     async with self._lock:
                         if self._backoff_event.is_set():  # Double-checked locking (safe in Python because of GIL) https://en.wikipedia.org/wiki/Double-checked_locking
@@ -129,12 +730,100 @@ class RpcClient:
         )
         return None
 
-    async def _post(self, payload: str, attempt: int = 1):
-        async with self.connection_pool:
-            async with self.throttler:
-                responses = await self.client.post(self.pick_uri(attempt), content=payload)
+    async def _bisect(self, requests: list[dict]):
+        self.payloads.oversized(requests)
+        half = len(requests) // 2
+        logger.warning(f"Splitting {len(requests)} {requests[0]['method']} requests that were too big for the provider")
+        halves = await asyncio.gather(self.post(requests[:half]), self.post(requests[half:]))
+        return [response for responses in halves if responses for response in responses]
 
-        return responses
+    def weight(self, requests: list[dict]):
+        if self.method_weights is None:
+            return 1
+
+        return sum(self.method_weights.get(request["method"], 1) for request in requests)
+
+    async def _post(
+        self, payload: bytes, provider: Provider, weight: float = 1, method: str = None
+    ):
+        """Post to provider and return the provider that answered with its response.
+
+        With hedging, a post still running after the hedger's delay is duplicated
+        on another provider if the budget allows. The first good response wins, a
+        losing hedge is cancelled and a beaten primary finishes in the background.
+        """
+        if self.hedger is None or len(self.providers.providers) < 2:
+            return provider, await self.providers.post(provider, payload, weight)
+
+        # the hedge clock runs from when the primary post got its permit and went on the wire,
+        # a post queued behind the local throttler or connection limit is not slow yet
+        started = asyncio.get_running_loop().create_future()
+        primary = asyncio.create_task(self.providers.post(provider, payload, weight, started))
+        tasks = {primary: provider}
+
+        # only the primary post's own time is recorded, a hedge that won is faster than the
+        # provider really was and recording it would pull the percentile down with every win
+        def record(task: asyncio.Task):
+            if not task.cancelled() and task.exception() is None and started.done():
+                self.hedger.record(method, time.monotonic() - started.result())
+
+        primary.add_done_callback(record)
+        try:
+            await asyncio.wait({primary, started}, return_when=asyncio.FIRST_COMPLETED)
+
+            delay = self.hedger.delay(method)
+            if delay is not None and not primary.done():
+                await asyncio.wait(tasks, timeout=delay)
+            if delay is not None and not primary.done() and self.hedger.spend():
+                hedge = self.providers.pick(exclude=[provider])
+                logger.debug(f"Hedging {method} post after {delay:.2f}s: {provider.uri} -> {hedge.uri}")
+                tasks[asyncio.create_task(self.providers.post(hedge, payload, weight))] = hedge
+
+            pending = set(tasks)
+            answered = None
+            error = None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is not None:
+                        error = error or task.exception()
+                        continue
+
+                    answered = task
+                    if task.result().status_code == 200:
+                        pending = set()
+                        break
+
+            if answered is None:
+                raise error
+
+            if tasks[answered] is not provider:
+                self.hedger.won = self.hedger.won + 1
+                # its request is on the wire already, waiting for the answer costs a connection slot
+                if not primary.done():
+                    del tasks[primary]
+                    self._outpaced.add(primary)
+                    primary.add_done_callback(self._outpaced.discard)
+            return tasks[answered], answered.result()
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def metrics(self):
+        return {
+            "providers": self.providers.metrics(),
+            "batch_sizes": self.batch_sizer.metrics(),
+            "response_bytes": self.payloads.metrics(),
+            "coalesced_requests": self.coalesced,
+            "cache": self.cache.metrics() if self.cache is not None else None,
+            "hedging": self.hedger.metrics() if self.hedger is not None else None,
+            "max_log_range": self.max_log_range,
+        }
 
     async def close(self):
-        await self.client.aclose()
+        logger.info(f"Rpc client metrics: {self.metrics()}")
+        for task in list(self._outpaced):
+            task.cancel()
+        await self.providers.close()
+        if self.cache is not None:
+            self.cache.close()
@@ -1,61 +1,121 @@
 import asyncio
 import time
-from collections import deque
-from typing import Deque
 
 from src.logger import logger
 
 
 class Throttler:
+    """Token bucket that refills `rate_limit` permits per `period`, holding at most `burst`.
+
+    Acquiring reserves permits up front by moving the time the bucket is paid
+    off, so it is O(1), callers are served in call order and nobody holds a lock
+    while sleeping. A request may take several permits (weight) at once; it starts
+    as soon as the earlier reservations fit in the burst and its own cost delays
+    the next caller. A cancelled waiter gives its permits back.
+    """
+
     def __init__(
         self,
-        rate_limit: int,
+        rate_limit: float,
         period: float,
-        spacing: float = None,
+        burst: float = 1,
         padding: float = 0.0,
     ):
-        self.rate_limit = rate_limit
         self.period = period  # second
+        self.burst = burst
         self.padding = padding
-        self.spacing = spacing or (period / rate_limit)
+        self.set_rate_limit(rate_limit)
 
-        self._lock = asyncio.Lock()
-        self._task_logs: Deque[float] = deque()
+        self._paid_off = time.monotonic()  # when every reserved permit has been refilled
 
-    def flush(self):
-        """Remove timestamps older than the period window."""
+    def set_rate_limit(self, rate_limit: float):
+        self.rate_limit = rate_limit
+        self.interval = self.period / rate_limit  # refill time of one permit
+
+    async def acquire(self, weight: float = 1):
+        """Wait until it's safe to proceed with a request costing `weight` permits."""
         now = time.monotonic()
-        while self._task_logs and now - self._task_logs[0] > self.period:
-            self._task_logs.popleft()
-
-    async def acquire(self):
-        """Wait until it's safe to proceed with another request."""
-        while True:
-            self.flush()
-
-            if len(self._task_logs) < self.rate_limit:
-                # spacing request
-                if self._task_logs:
-                    duration = self.spacing - (time.monotonic() - self._task_logs[-1])
-                    if duration > 0:
-                        await asyncio.sleep(duration)
-
-                self._task_logs.append(time.monotonic())
-                break
-
-            # Wait until the oldest timestamp exits the time window
-            sleep_duration = self._task_logs[0] + self.period - time.monotonic()
-            if sleep_duration > 0:
-                logger.debug(
-                    f"Throttler sleeping for {sleep_duration + self.padding:.3f} seconds..."
-                )
-                await asyncio.sleep(sleep_duration + self.padding)
+        start = max(self._paid_off - (self.burst - 1) * self.interval, now)
+        cost = weight * self.interval
+        self._paid_off = max(self._paid_off, now) + cost
 
-    async def __aenter__(self):
-        async with self._lock:
-            await self.acquire()
+        sleep_duration = start - now
+        if sleep_duration <= 0:
+            return
+
+        logger.debug(f"Throttler sleeping for {sleep_duration + self.padding:.3f} seconds...")
+        try:
+            await asyncio.sleep(sleep_duration + self.padding)
+        except asyncio.CancelledError:
+            self._paid_off = self._paid_off - cost
+            raise
 
+    async def __aenter__(self):
+        await self.acquire()
         return self
 
     async def __aexit__(self, exc_type, exc, tb):
         pass
+
+
+class AdaptiveThrottler:
+    """One throttler per key (provider uri) whose rate is found by additive increase, multiplicative decrease.
+
+    Every success raises the rate by `increase / rate`, about `increase` req/s per
+    second at full use. A rate limit or timeout multiplies it by `decrease`, at most
+    once per `cooldown` seconds so one burst of rejected in-flight requests counts once.
+    """
+
+    def __init__(
+        self,
+        rate_limit: float,
+        min_rate_limit: float = 1,
+        max_rate_limit: float = 1000,
+        increase: float = 1,
+        decrease: float = 0.5,
+        cooldown: float = 1,
+    ):
+        self.rate_limit = rate_limit
+        self.min_rate_limit = min_rate_limit
+        self.max_rate_limit = max_rate_limit
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown  # second
+
+        self.throttlers: dict[str, Throttler] = {}
+        self._rates: dict[str, float] = {}
+        self._last_decrease: dict[str, float] = {}
+
+    def get(self, key: str, rate_limit: float = None):
+        # rate_limit overrides the starting rate of a key seen for the first time
+        if key not in self.throttlers:
+            rate_limit = rate_limit or self.rate_limit
+            self.throttlers[key] = Throttler(rate_limit=rate_limit, period=1)
+            self._rates[key] = rate_limit
+            self._last_decrease[key] = 0
+
+        return self.throttlers[key]
+
+    def rate(self, key: str):
+        return self._rates.get(key, self.rate_limit)
+
+    def _set(self, key: str, rate: float):
+        self._rates[key] = min(max(rate, self.min_rate_limit), self.max_rate_limit)
+        self.get(key).set_rate_limit(self._rates[key])
+
+    def success(self, key: str):
+        rate = self.rate(key)
+        self._set(key, rate + self.increase / rate)
+
+    def throttled(self, key: str):
+        now = time.monotonic()
+        if now - self._last_decrease.get(key, 0) < self.cooldown:
+            return
+
+        rate = self.rate(key)
+        self._last_decrease[key] = now
+        self._set(key, rate * self.decrease)
+        logger.info(f"Rate limit of {key}: {rate:.1f} -> {self._rates[key]:.1f} req/s")
+
+    def metrics(self):
+        return {key: round(rate, 2) for key, rate in self._rates.items()}
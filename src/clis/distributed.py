@@ -0,0 +1,186 @@
+import argparse
+import asyncio
+import os
+import socket
+from concurrent.futures import ThreadPoolExecutor
+
+import uvloop
+
+from src.clis.historical import create_progress
+from src.configs.connection_manager import connection_manager
+from src.logger import logger
+from src.services.lease_service import NatsLeaseService, SqliteLeaseService
+from src.tasks.dag import compile_dag, create_node
+from src.tasks.graph import Graph, create_process_pool
+from src.utils.common import parse_resource_limits
+from src.utils.enumeration import Exporter
+
+asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
+
+
+def parse_arg():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--start-block", type=int)
+    parser.add_argument("--end-block", type=int)
+    parser.add_argument("--request-batch-size", type=int, default=30)
+    parser.add_argument("--pending-queue-size", type=int, default=1000)
+    parser.add_argument("--running-queue-size", type=int, default=1000)
+    parser.add_argument(
+        "--resource-limits",
+        type=parse_resource_limits,
+        default={},
+        help="per resource class concurrency, e.g. rpc=8,cpu=4,sqlite=1,memgraph=4,nats=16",
+    )
+    parser.add_argument("--entities", type=str, default=None)
+    parser.add_argument("--exporters", type=str, default=None)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument("--num-processes", type=int, default=0)
+    parser.add_argument(
+        "--coordinator",
+        type=str,
+        default="sqlite",
+        choices=["sqlite", "nats"],
+        help="where the range leases live, a local sqlite file or a JetStream KV bucket",
+    )
+    parser.add_argument("--lease-file", type=str, default=None)
+    parser.add_argument("--lease-bucket", type=str, default=None)
+    parser.add_argument(
+        "--lease-ttl",
+        type=float,
+        default=60,
+        help="seconds a range stays leased without heartbeat before another worker takes it over",
+    )
+    parser.add_argument(
+        "--max-leases",
+        type=int,
+        default=4,
+        help="ranges a worker holds at once, the rest stays in the queue for the other workers",
+    )
+    parser.add_argument("--worker-id", type=str, default=None)
+    return parser.parse_args()
+
+
+async def heartbeat(lease_service: SqliteLeaseService | NatsLeaseService, interval: float):
+    while True:
+        await asyncio.sleep(interval)
+        await lease_service.heartbeat()
+
+
+async def main(
+    start_block: int,
+    end_block: int,
+    request_batch_size: int,
+    pending_queue_size: int,
+    running_queue_size: int,
+    resource_limits: dict[str, int],
+    entities: list[str],
+    exporters: list[str],
+    num_workers: int,
+    num_processes: int,
+    coordinator: str,
+    lease_file: str,
+    lease_bucket: str,
+    lease_ttl: float,
+    max_leases: int,
+    worker_id: str,
+):
+    connections = exporters + ["rpc"]
+    if "pool" in entities:
+        connections.append("memgraph")
+    if coordinator == "nats" and Exporter.NATS not in connections:
+        connections.append(Exporter.NATS)
+    await connection_manager.init(connections)
+
+    if coordinator == "nats":
+        lease_service = NatsLeaseService(
+            connection_manager["jetstream"], worker_id, lease_ttl, lease_bucket
+        )
+    else:
+        lease_service = SqliteLeaseService(worker_id, lease_ttl, lease_file)
+    await lease_service.init(start_block, end_block, request_batch_size)
+    logger.info(f"Worker {worker_id} leasing blocks {start_block}-{end_block}")
+
+    template = compile_dag(entities, exporters)
+    graph = Graph(running_queue_size, resource_limits)
+
+    with (
+        ThreadPoolExecutor(max_workers=num_workers) as pool,
+        create_process_pool(num_processes) as process_pool,
+    ):
+        async with asyncio.TaskGroup() as tg:
+            heartbeat_task = tg.create_task(
+                heartbeat(lease_service, lease_ttl / 3), name="lease_heartbeat"
+            )
+
+            with create_progress() as progress:
+                # only the ranges this worker completes are counted
+                task_id = progress.add_task(
+                    description=f"Block ({worker_id}): ",
+                    total=end_block - start_block + 1,
+                )
+
+                graph.run(tg, pool, process_pool)
+                while True:
+                    # a few ranges at a time, leasing everything the graph could queue
+                    # would starve the other machines and cost a heartbeat per held range
+                    if len(lease_service.held) < max_leases and graph.pending_count < pending_queue_size:
+                        block_range = await lease_service.acquire()
+                        if block_range is not None:
+                            new_nodes = create_node(
+                                template,
+                                progress,
+                                task_id,
+                                connection_manager["rpc"],
+                                connection_manager.get("memgraph"),
+                                *block_range,
+                                lease_service=lease_service,
+                            )
+                            graph.add_nodes(new_nodes)
+                            continue
+
+                        if not graph.nodes:
+                            if await lease_service.remaining() == 0:
+                                break
+
+                            # the rest is leased by other workers, one of them may still die
+                            await asyncio.sleep(lease_ttl / 3)
+                            continue
+
+                    await graph.wait()
+
+            heartbeat_task.cancel()
+
+    lease_service.close()
+    await connection_manager.close()
+
+
+if __name__ == "__main__":
+    args = parse_arg()
+    entities = args.entities.split(",") if args.entities else []
+    exporters = args.exporters.split(",") if args.exporters else []
+    with asyncio.Runner() as runner:
+        runner.run(
+            main(
+                start_block=args.start_block,
+                end_block=args.end_block,
+                request_batch_size=args.request_batch_size,
+                pending_queue_size=args.pending_queue_size,
+                running_queue_size=args.running_queue_size,
+                resource_limits=args.resource_limits,
+                entities=entities,
+                exporters=exporters,
+                num_workers=args.num_workers,
+                num_processes=args.num_processes,
+                coordinator=args.coordinator,
+                lease_file=args.lease_file,
+                lease_bucket=args.lease_bucket,
+                lease_ttl=args.lease_ttl,
+                max_leases=args.max_leases,
+                worker_id=args.worker_id or f"{socket.gethostname()}-{os.getpid()}",
+            )
+        )
+
+# every worker is started with the same span, batch size and coordinator
+# python -m src.clis.distributed --start-block 23170000 --end-block 23170300 \
+# --request-batch-size 30 --coordinator nats \
+# --entities raw_block,block,transaction --exporters nats
@@ -1,6 +1,14 @@
 import argparse
 import asyncio
+import functools
+import multiprocessing
+import queue
+import sys
+from collections.abc import Callable
 from concurrent.futures import ThreadPoolExecutor
+from contextlib import nullcontext
+from multiprocessing.queues import Queue
+from pathlib import Path
 
 import uvloop
 from rich.progress import (
@@ -12,9 +20,18 @@ from rich.progress import (
     TimeRemainingColumn,
 )
 
+from src.clients.rpc_client import RpcClient
 from src.configs.connection_manager import connection_manager
-from src.tasks.dag import create_node
-from src.tasks.graph import Graph
+from src.configs.environment import env
+from src.logger import logger
+from src.schemas.dag import DagTemplate
+from src.services.checkpoint_service import CheckpointService
+from src.tasks.dag import compile_dag, create_node
+from src.tasks.graph import Graph, create_process_pool
+from src.tasks.prefetch import Prefetcher
+from src.tasks.profiler import Profiler
+from src.utils.common import parse_mapping, parse_resource_limits
+from src.utils.progress import QueueProgress
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
@@ -24,93 +41,394 @@ def parse_arg():
     parser.add_argument("--start-block", type=int)
     parser.add_argument("--end-block", type=int)
     parser.add_argument("--request-batch-size", type=int, default=30)
+    parser.add_argument("--min-request-batch-size", type=int, default=1)
+    parser.add_argument("--max-request-batch-size", type=int, default=1000)
+    parser.add_argument(
+        "--target-request-latency",
+        type=float,
+        default=5.0,
+        help="rpc batches slower than this (second) shrink, faster full batches grow",
+    )
     parser.add_argument("--pending-queue-size", type=int, default=1000)
     parser.add_argument("--running-queue-size", type=int, default=1000)
+    parser.add_argument(
+        "--resource-limits",
+        type=parse_resource_limits,
+        default={},
+        help="per resource class concurrency, e.g. rpc=8,cpu=4,sqlite=1,memgraph=4,nats=16",
+    )
     parser.add_argument("--entities", type=str, default=None)
     parser.add_argument("--exporters", type=str, default=None)
-    parser.add_argument("--num-workers", type=str, default=4)
-    return parser.parse_args()
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument(
+        "--num-processes",
+        type=int,
+        default=0,
+        help="worker processes for cpu bound extractors, 0 keeps them on the thread pool",
+    )
+    parser.add_argument(
+        "--prefetch-depth",
+        type=int,
+        default=0,
+        help="block ranges fetched ahead of extraction, 0 fetches inside the dag",
+    )
+    parser.add_argument("--prefetch-memory-mb", type=int, default=512)
+    parser.add_argument(
+        "--resume",
+        default=False,
+        action="store_true",
+        help="skip block ranges the checkpoint ledger already has for every entity/exporter",
+    )
+    parser.add_argument("--checkpoint-file", type=str, default=None)
+    parser.add_argument(
+        "--rpc-rate-limit",
+        type=float,
+        default=50,
+        help="starting requests per second per provider for the whole run, split evenly between shards; "
+        "the rate then grows while requests succeed and halves on 429s or timeouts",
+    )
+    parser.add_argument(
+        "--max-rpc-rate-limit",
+        type=float,
+        default=1000,
+        help="ceiling of the learned requests per second per provider, split evenly between shards",
+    )
+    parser.add_argument(
+        "--rpc-method-weights",
+        type=lambda text: parse_mapping(text, float),
+        default=None,
+        help="permits each request of a method costs, e.g. trace_block=10,eth_getBlockReceipts=5; "
+        "when set, rate limits count permits instead of http posts",
+    )
+    parser.add_argument(
+        "--rpc-cache-mb",
+        type=int,
+        default=0,
+        help="keep finalized blocks, receipts and traces in an on-disk cache of this size, 0 disables it",
+    )
+    parser.add_argument("--rpc-cache-file", type=str, default=None)
+    parser.add_argument(
+        "--max-response-mb",
+        type=int,
+        default=16,
+        help="cut rpc batches so their expected response stays under this size, learned per method and block region",
+    )
+    parser.add_argument(
+        "--stream-responses",
+        default=False,
+        action="store_true",
+        help="parse receipt and trace batches block by block while they download, "
+        "bounding memory per block at some extra cpu; first attempts skip coalescing and the cache",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="duplicate rpc posts still running after this latency percentile (e.g. 0.95) on a second provider, "
+        "the first answer wins; off by default",
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=float,
+        default=0.05,
+        help="hedged posts allowed per rpc post",
+    )
+    parser.add_argument(
+        "--record-cassette",
+        type=str,
+        default=None,
+        help="write every rpc response of the run to this gzip cassette file, for replaying the range later",
+    )
+    parser.add_argument("--replay-cassette", type=str, default=None, help="answer rpc requests from a recorded cassette, offline")
+    parser.add_argument(
+        "--replay-timing",
+        choices=["original", "fast"],
+        default="original",
+        help="replay posts with their recorded latency or as fast as possible",
+    )
+    parser.add_argument(
+        "--profile-output",
+        type=str,
+        default=None,
+        help="write per node timings as a chrome trace json here, plus a <name>_summary.json of each batch's critical path",
+    )
+    parser.add_argument(
+        "--num-shards",
+        type=int,
+        default=1,
+        help="worker processes, each running its own event loop, graph and connections",
+    )
+    args = parser.parse_args()
+    if args.record_cassette and args.num_shards > 1:
+        parser.error("--record-cassette needs a single shard, shards would write the same file")
+    return args
+
+
+def split_ranges(block_ranges: list[tuple[int, int]], batch_size: int | Callable[[], int]):
+    """Cut block ranges into batches, a callable batch size is asked again before every cut."""
+    for start_block, end_block in block_ranges:
+        batch_start_block = start_block
+        while batch_start_block <= end_block:
+            size = batch_size() if callable(batch_size) else batch_size
+            batch_end_block = min(batch_start_block + size - 1, end_block)
+            yield batch_start_block, batch_end_block
+            batch_start_block = batch_end_block + 1
+
+
+def shard_ranges(block_ranges: list[tuple[int, int]], batch_size: int, shard: int, num_shards: int):
+    """Every num_shards-th batch starting at shard, so dense and sparse regions spread evenly."""
+    return list(split_ranges(block_ranges, batch_size))[shard::num_shards]
+
+
+def range_size(template: DagTemplate, rpc_client: RpcClient, default: int):
+    # a range becomes one batch per block fetch method, so it is as long as the smallest learned batch
+    if not template.fetch_methods:
+        return default
+    return min(rpc_client.batch_sizer.size(method) for method in template.fetch_methods)
 
 
 async def main(
     start_block: int,
     end_block: int,
     request_batch_size: int,
+    rpc_options: dict,
     pending_queue_size: int,
     running_queue_size: int,
+    resource_limits: dict[str, int],
     entities: list[str],
     exporters: list[str],
     num_workers: int,
+    num_processes: int,
+    prefetch_depth: int,
+    prefetch_memory_mb: int,
+    resume: bool,
+    checkpoint_file: str,
+    profile_output: str = None,
+    shard: int = 0,
+    num_shards: int = 1,
+    progress_queue: Queue = None,
 ):
+    options = {"rpc": rpc_options}
     if "pool" in entities:
-        await connection_manager.init(exporters+ ["rpc", "memgraph"])
+        await connection_manager.init(exporters+ ["rpc", "memgraph"], options)
     else:
-         await connection_manager.init(exporters+ ["rpc"])
+         await connection_manager.init(exporters+ ["rpc"], options)
+
+    template = compile_dag(entities, exporters)
+    profiler = Profiler() if profile_output else None
+    graph = Graph(running_queue_size, resource_limits, profiler)
 
-    graph = Graph(running_queue_size)
+    checkpoint_service = CheckpointService(checkpoint_file)
+    block_ranges = [(start_block, end_block)]
+    if resume:
+        block_ranges = checkpoint_service.missing_ranges(
+            start_block, end_block, entities, exporters
+        )
+        logger.info(f"Resume with {len(block_ranges)} incomplete block ranges")
 
-    with ThreadPoolExecutor(max_workers=num_workers) as pool:
+    with (
+        ThreadPoolExecutor(max_workers=num_workers) as pool,
+        create_process_pool(num_processes) as process_pool,
+    ):
         async with asyncio.TaskGroup() as tg:
-            with Progress(
-                TextColumn("[bold blue]{task.description}"),
-                BarColumn(),
-                MofNCompleteColumn(),
-                TimeElapsedColumn(),
-                TimeRemainingColumn(),
-            ) as progress:
+            if progress_queue is None:
+                progress_context = create_progress()
+            else:
+                progress_context = nullcontext(QueueProgress(progress_queue, shard))
+
+            with progress_context as progress:
                 task_id = progress.add_task(
                     description="Block: ",
                     total=end_block - start_block + 1,
                 )
-                batch_start_block = start_block
-
-                while progress.tasks[task_id].completed < end_block - start_block + 1:
-                    if (
-                        graph.pending_count < pending_queue_size
-                        and batch_start_block <= end_block
-                    ):
-                        batch_end_block = min(
-                            batch_start_block + request_batch_size - 1, end_block
-                        )
+                if shard == 0:
+                    progress.advance(
+                        task_id=task_id,
+                        advance=end_block - start_block + 1 - sum(e - s + 1 for s, e in block_ranges),
+                    )
+                if num_shards > 1:
+                    # the batches are cut up front and keep request_batch_size
+                    ranges = iter(shard_ranges(block_ranges, request_batch_size, shard, num_shards))
+                else:
+                    # cut when needed, sparse blocks grow into larger ranges as the rpc batch sizes grow
+                    ranges = split_ranges(
+                        block_ranges,
+                        functools.partial(range_size, template, connection_manager["rpc"], request_batch_size),
+                    )
+
+                prefetcher = None
+                if prefetch_depth > 0:
+                    prefetcher = Prefetcher(
+                        template,
+                        connection_manager["rpc"],
+                        ranges,
+                        prefetch_depth,
+                        prefetch_memory_mb * 1024 * 1024,
+                    )
+                    tg.create_task(prefetcher.run(tg), name="prefetcher")
+
+                graph.run(tg, pool, process_pool)
+                exhausted = False
+                while not exhausted or graph.nodes:
+                    if graph.pending_count < pending_queue_size and not exhausted:
+                        results, prefetched = None, ()
+                        if prefetcher is not None:
+                            fetched = await prefetcher.get()
+                            if fetched is not None:
+                                batch_start_block, batch_end_block, results = fetched
+                                prefetched = template.fetch_ids
+                        else:
+                            fetched = next(ranges, None)
+                            if fetched is not None:
+                                batch_start_block, batch_end_block = fetched
+
+                        if fetched is None:
+                            exhausted = True
+                            continue
+
                         new_nodes = create_node(
+                            template,
                             progress,
                             task_id,
                             connection_manager["rpc"],
                             connection_manager.get("memgraph"),
                             batch_start_block,
                             batch_end_block,
-                            entities,
-                            exporters,
+                            results=results,
+                            prefetched=prefetched,
+                            checkpoint_service=checkpoint_service,
                         )
-                        batch_start_block = batch_start_block + request_batch_size
-
                         graph.add_nodes(new_nodes)
+                        continue
 
-                    graph.run(tg, pool)
+                    await graph.wait()
 
-                    await asyncio.sleep(0.1)
+    if profiler is not None:
+        if num_shards > 1:
+            profile_output = f"{Path(profile_output).with_suffix('')}_shard_{shard}.json"
+        profiler.export(profile_output)
 
+    checkpoint_service.close()
     await connection_manager.close()
 
 
-if __name__ == "__main__":
-    args = parse_arg()
-    entities = args.entities.split(",") if args.entities else []
-    exporters = args.exporters.split(",") if args.exporters else []
+def create_progress():
+    return Progress(
+        TextColumn("[bold blue]{task.description}"),
+        BarColumn(),
+        MofNCompleteColumn(),
+        TimeElapsedColumn(),
+        TimeRemainingColumn(),
+    )
+
+
+def run_shard(kwargs: dict, shard: int, num_shards: int, progress_queue: Queue):
     with asyncio.Runner() as runner:
         runner.run(
             main(
-                args.start_block,
-                args.end_block,
-                args.request_batch_size,
-                args.pending_queue_size,
-                args.running_queue_size,
-                entities,
-                exporters,
-                args.num_workers,
+                **kwargs,
+                shard=shard,
+                num_shards=num_shards,
+                progress_queue=progress_queue,
             )
         )
 
+
+def launch(kwargs: dict, num_shards: int):
+    # every shard gets an equal part of the provider budget
+    for option in ("rate_limit", "max_rate_limit"):
+        kwargs["rpc_options"][option] = kwargs["rpc_options"][option] / num_shards
+    kwargs["rpc_options"]["capacities"] = {
+        uri: rate_limit / num_shards for uri, rate_limit in env.PROVIDER_RATE_LIMITS.items()
+    }
+
+    context = multiprocessing.get_context("spawn")
+    progress_queue = context.Queue()
+    processes = [
+        context.Process(
+            target=run_shard,
+            args=(kwargs, shard, num_shards, progress_queue),
+            name=f"shard_{shard}",
+        )
+        for shard in range(num_shards)
+    ]
+    for process in processes:
+        process.start()
+
+    with create_progress() as progress:
+        total_id = progress.add_task(
+            description="Block: ",
+            total=kwargs["end_block"] - kwargs["start_block"] + 1,
+        )
+        shard_ids = [
+            progress.add_task(description=f"Shard {shard}: ", total=None)
+            for shard in range(num_shards)
+        ]
+        while any(process.is_alive() for process in processes) or not progress_queue.empty():
+            try:
+                shard, advance = progress_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+
+            progress.advance(task_id=total_id, advance=advance)
+            progress.advance(task_id=shard_ids[shard], advance=advance)
+
+    failed = []
+    for process in processes:
+        process.join()
+        if process.exitcode != 0:
+            failed.append(process.name)
+
+    if failed:
+        logger.error(f"{', '.join(failed)} failed, rerun with --resume to finish their ranges")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    args = parse_arg()
+    entities = args.entities.split(",") if args.entities else []
+    exporters = args.exporters.split(",") if args.exporters else []
+    kwargs = {
+        "start_block": args.start_block,
+        "end_block": args.end_block,
+        "request_batch_size": args.request_batch_size,
+        "rpc_options": {
+            "batch_size": args.request_batch_size,
+            "min_batch_size": args.min_request_batch_size,
+            "max_batch_size": args.max_request_batch_size,
+            "target_latency": args.target_request_latency,
+            "rate_limit": args.rpc_rate_limit,
+            "max_rate_limit": args.max_rpc_rate_limit,
+            "method_weights": args.rpc_method_weights,
+            "cache_max_bytes": args.rpc_cache_mb * 1024 * 1024,
+            "cache_path": args.rpc_cache_file,
+            "stream_responses": args.stream_responses,
+            "hedge_percentile": args.hedge_percentile,
+            "hedge_budget": args.hedge_budget,
+            "record_cassette": args.record_cassette,
+            "replay_cassette": args.replay_cassette,
+            "replay_timing": args.replay_timing,
+            "max_response_bytes": args.max_response_mb * 1024 * 1024,
+        },
+        "pending_queue_size": args.pending_queue_size,
+        "running_queue_size": args.running_queue_size,
+        "resource_limits": args.resource_limits,
+        "entities": entities,
+        "exporters": exporters,
+        "num_workers": args.num_workers,
+        "num_processes": args.num_processes,
+        "prefetch_depth": args.prefetch_depth,
+        "prefetch_memory_mb": args.prefetch_memory_mb,
+        "resume": args.resume,
+        "checkpoint_file": args.checkpoint_file,
+        "profile_output": args.profile_output,
+    }
+    if args.num_shards > 1:
+        launch(kwargs, args.num_shards)
+    else:
+        with asyncio.Runner() as runner:
+            runner.run(main(**kwargs))
+
 # python -m src.clis.historical --start-block 23170000 --end-block 23170030 \
 # --pending-queue-size 1000 --running-queue-size 5 --request-batch-size 30 \
 # --entities raw_block,block,transaction,withdrawal,raw_receipt,receipt,log,transfer,event,account,pool,token,raw_trace,trace \
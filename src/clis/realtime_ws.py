@@ -19,8 +19,10 @@ from rich.progress import (
 from src.configs.connection_manager import connection_manager
 from src.configs.environment import env
 from src.logger import logger
-from src.tasks.dag import create_node
-from src.tasks.graph import Graph
+from src.schemas.dag import DagTemplate
+from src.tasks.dag import compile_dag, create_node
+from src.tasks.graph import Graph, create_process_pool
+from src.utils.common import parse_resource_limits
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
@@ -28,13 +30,40 @@ asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 def parse_arg():
     parser = argparse.ArgumentParser()
     parser.add_argument("--running-queue-size", type=int, default=10)
+    parser.add_argument(
+        "--resource-limits",
+        type=parse_resource_limits,
+        default={},
+        help="per resource class concurrency, e.g. rpc=8,cpu=4,sqlite=1,memgraph=4,nats=16",
+    )
     parser.add_argument("--entities", type=str, default=None)
     parser.add_argument("--exporters", type=str, default=None)
-    parser.add_argument("--num-workers", type=str, default=4)
+    parser.add_argument("--num-workers", type=int, default=4)
+    parser.add_argument(
+        "--num-processes",
+        type=int,
+        default=0,
+        help="worker processes for cpu bound extractors, 0 keeps them on the thread pool",
+    )
+    parser.add_argument(
+        "--hedge-percentile",
+        type=float,
+        default=None,
+        help="duplicate rpc posts still running after this latency percentile (e.g. 0.95) on a second provider, "
+        "the first answer wins; off by default",
+    )
+    parser.add_argument(
+        "--hedge-budget",
+        type=float,
+        default=0.05,
+        help="hedged posts allowed per rpc post",
+    )
     return parser.parse_args()
 
 
-async def websocket_listener(graph: Graph, progress: Progress, task_id: TaskID):
+async def websocket_listener(
+    graph: Graph, template: DagTemplate, progress: Progress, task_id: TaskID
+):
     ws_client = httpx.AsyncClient()
     async with aconnect_ws(env.WEBSOCKET_URL, ws_client) as ws:
         await ws.send_json(
@@ -58,14 +87,13 @@ async def websocket_listener(graph: Graph, progress: Progress, task_id: TaskID):
                 logger.info(f"Start process block number: {block_number}")
 
                 new_nodes = create_node(
+                    template,
                     progress,
                     task_id,
                     connection_manager["rpc"],
                     connection_manager.get("memgraph"),
                     block_number,
                     block_number,
-                    entities,
-                    exporters,
                 )
                 graph.add_nodes(new_nodes)
 
@@ -86,18 +114,26 @@ async def websocket_listener(graph: Graph, progress: Progress, task_id: TaskID):
 
 async def main(
     running_queue_size: int,
+    resource_limits: dict[str, int],
     entities: list[str],
     exporters: list[str],
     num_workers: int,
+    num_processes: int,
+    rpc_options: dict = None,
 ):
+    options = {"rpc": rpc_options or {}}
     if "pool" in entities:
-        await connection_manager.init(exporters + ["rpc", "memgraph"])
+        await connection_manager.init(exporters + ["rpc", "memgraph"], options)
     else:
-        await connection_manager.init(exporters + ["rpc"])
+        await connection_manager.init(exporters + ["rpc"], options)
 
-    graph = Graph(running_queue_size)
+    template = compile_dag(entities, exporters)
+    graph = Graph(running_queue_size, resource_limits)
     async with asyncio.TaskGroup() as tg:
-        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+        with (
+            ThreadPoolExecutor(max_workers=num_workers) as pool,
+            create_process_pool(num_processes) as process_pool,
+        ):
             with Progress(
                 TextColumn("[bold blue]{task.description}"),
                 BarColumn(),
@@ -109,10 +145,8 @@ async def main(
                     description="Block: ",
                     total=1000000,
                 )
-                tg.create_task(websocket_listener(graph, progress, task_id))
-                while True:
-                    graph.run(tg, pool)
-                    await asyncio.sleep(0.1)
+                graph.run(tg, pool, process_pool)
+                await websocket_listener(graph, template, progress, task_id)
 
     await connection_manager.close()
 
@@ -125,9 +159,15 @@ if __name__ == "__main__":
         runner.run(
             main(
                 args.running_queue_size,
+                args.resource_limits,
                 entities,
                 exporters,
                 args.num_workers,
+                args.num_processes,
+                {
+                    "hedge_percentile": args.hedge_percentile,
+                    "hedge_budget": args.hedge_budget,
+                },
             )
         )
 
@@ -25,8 +25,10 @@ class ConnectionManager:
 
         return None
 
-    async def init(self, exporters):
+    async def init(self, exporters, options: dict[str, dict] = None):
+        # options holds constructor kwargs per connection, e.g. {"rpc": {"batch_size": 30}}
         self.exporters = exporters
+        self.options = options or {}
         for exporter in self.exporters:
             result = self.mapper[exporter]()
             if inspect.isawaitable(result):
@@ -79,7 +81,7 @@ class ConnectionManager:
     async def init_rpc(self):
         from src.clients.rpc_client import RpcClient
 
-        self.conn["rpc"] = RpcClient()
+        self.conn["rpc"] = RpcClient(**self.options.get("rpc", {}))
         res = await self.conn["rpc"].get_web3_client_version()
         logger.info(f"Web3 Client Version: {res[0]['result']}")
 
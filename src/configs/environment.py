@@ -27,6 +27,8 @@ class EnvironmentSettings(BaseSettings):
     NATS_SERVER: str
 
     PROVIDER_URIS: list
+    # optional requests/s per provider uri, providers not listed start at the client's rate_limit
+    PROVIDER_RATE_LIMITS: dict[str, float] = Field(default_factory=dict)
     WEBSOCKET_URL: str
 
     ENVIRONMENT_NAME: str
@@ -0,0 +1,19 @@
+from dataclasses import dataclass
+from typing import Callable
+
+
+@dataclass(frozen=True)
+class DagTemplate:
+    entities: tuple[str, ...]
+    exporters: tuple[str, ...]
+    names: tuple[str, ...]
+    funcs: tuple[Callable, ...]
+    resources: tuple[str, ...]
+    reads: tuple[tuple[str, ...], ...]  # entities each node reads from results
+    writes: tuple[tuple[str, ...], ...]  # entities each node writes to results
+    in_process: tuple[bool, ...]  # may run in the process pool
+    deps: tuple[tuple[int, ...], ...]  # node ids each node waits for
+    order: tuple[int, ...]  # topological order of node ids
+    fetch_ids: tuple[int, ...]  # rpc nodes without dependencies, can run ahead of the rest
+    include_transaction: bool
+    fetch_methods: tuple[str, ...] = ()  # rpc methods the fetch nodes send one request per block of
@@ -6,10 +6,17 @@ from typing import Callable, Optional
 @dataclass
 class Node:
     dag_id: str
+    node_id: int
     name: str
     func: Callable
+    resource: str
     kwargs: dict
     task: Optional[Task]
-    dep_nodes: list[str]
+    dep_nodes: list[tuple[str, int]]
     dep_data: list[str]
     status: str
+    reads: tuple[str, ...] = ()
+    writes: tuple[str, ...] = ()
+    in_process: bool = False
+    unmet: int = 0
+    release: Optional[Callable] = None
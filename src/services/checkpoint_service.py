@@ -0,0 +1,90 @@
+import sqlite3
+from itertools import product
+from pathlib import Path
+
+from src.configs.environment import env
+from src.logger import logger
+
+
+class CheckpointService:
+    """Durable ledger of completed (block range, entity, exporter) tuples, kept in a local sqlite file."""
+
+    def __init__(self, path: str | Path = None):
+        self.path = path or env._local_database_folder / f"{env.DATABASE_NAME}_checkpoint.sqlite"
+        self.db = sqlite3.connect(self.path)
+        self.db.execute("PRAGMA journal_mode=WAL;")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS completed_range
+            (
+                start_block INTEGER,
+                end_block INTEGER,
+                entity TEXT,
+                exporter TEXT,
+
+                completed_time DATETIME DEFAULT CURRENT_TIMESTAMP,
+                PRIMARY KEY (start_block, end_block, entity, exporter)
+            );
+            """
+        )
+        self.db.commit()
+        logger.info(f"CHECKPOINT DATABASE PATH: {self.path}")
+
+    @staticmethod
+    def _pairs(entities: list[str], exporters: list[str]):
+        # a run without exporter still completes its entities
+        return list(product(entities, exporters or [""]))
+
+    def mark_done(
+        self, start_block: int, end_block: int, entities: list[str], exporters: list[str]
+    ):
+        rows = [
+            (start_block, end_block, entity, exporter)
+            for entity, exporter in self._pairs(entities, exporters)
+        ]
+        # one transaction, the range is either fully recorded or not at all
+        with self.db:
+            self.db.executemany(
+                """
+                INSERT OR REPLACE INTO completed_range (start_block, end_block, entity, exporter)
+                VALUES (?, ?, ?, ?);
+                """,
+                rows,
+            )
+
+    def missing_ranges(
+        self, start_block: int, end_block: int, entities: list[str], exporters: list[str]
+    ):
+        """Sub ranges of [start_block, end_block] not yet completed for every entity/exporter pair."""
+        gaps = []
+        for entity, exporter in self._pairs(entities, exporters):
+            rows = self.db.execute(
+                """
+                SELECT start_block, end_block FROM completed_range
+                WHERE entity = ? AND exporter = ? AND end_block >= ? AND start_block <= ?
+                ORDER BY start_block;
+                """,
+                (entity, exporter, start_block, end_block),
+            ).fetchall()
+
+            cursor = start_block
+            for done_start, done_end in rows:
+                if done_start > cursor:
+                    gaps.append((cursor, done_start - 1))
+                cursor = max(cursor, done_end + 1)
+
+            if cursor <= end_block:
+                gaps.append((cursor, end_block))
+
+        # union of the gaps of every pair
+        missing = []
+        for gap_start, gap_end in sorted(gaps):
+            if missing and gap_start <= missing[-1][1] + 1:
+                missing[-1] = (missing[-1][0], max(missing[-1][1], gap_end))
+            else:
+                missing.append((gap_start, gap_end))
+
+        return missing
+
+    def close(self):
+        self.db.close()
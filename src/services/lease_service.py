@@ -0,0 +1,274 @@
+import sqlite3
+import time
+from pathlib import Path
+
+import orjson
+
+from src.configs.environment import env
+from src.logger import logger
+
+# A block range is pending, leased by one owner until expires_at, or done.
+# Expiry uses wall clock time, so the lease ttl has to be well above the clock skew between machines.
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+
+
+def split_block_range(start_block: int, end_block: int, batch_size: int):
+    return [
+        (batch_start_block, min(batch_start_block + batch_size - 1, end_block))
+        for batch_start_block in range(start_block, end_block + 1, batch_size)
+    ]
+
+
+class SqliteLeaseService:
+    """Lease queue of block ranges in a sqlite file shared by the workers of one machine."""
+
+    def __init__(self, owner: str, ttl: float = 60, path: str | Path = None):
+        self.owner = owner
+        self.ttl = ttl
+        self.path = path or env._local_database_folder / f"{env.DATABASE_NAME}_lease.sqlite"
+        self.held: set[tuple[int, int]] = set()
+
+        # autocommit mode, transactions are opened explicitly with BEGIN IMMEDIATE
+        self.db = sqlite3.connect(self.path, isolation_level=None, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL;")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS lease
+            (
+                start_block INTEGER,
+                end_block INTEGER,
+                status TEXT,
+                owner TEXT,
+                expires_at REAL,
+
+                PRIMARY KEY (start_block, end_block)
+            );
+            """
+        )
+        logger.info(f"LEASE DATABASE PATH: {self.path}")
+
+    async def init(self, start_block: int, end_block: int, batch_size: int):
+        # acquire looks up the lowest range of a status, remaining counts by status
+        self.db.execute("CREATE INDEX IF NOT EXISTS lease_status ON lease (status, start_block);")
+        rows = [
+            (block_start, block_end, PENDING)
+            for block_start, block_end in split_block_range(start_block, end_block, batch_size)
+        ]
+        self.db.execute("BEGIN IMMEDIATE;")
+        self.db.executemany(
+            "INSERT OR IGNORE INTO lease (start_block, end_block, status) VALUES (?, ?, ?);",
+            rows,
+        )
+        self.db.execute("COMMIT;")
+
+    async def acquire(self):
+        """Lease the next pending or expired range, None when nothing is available right now."""
+        now = time.time()
+        self.db.execute("BEGIN IMMEDIATE;")
+        try:
+            # ranges of a dead worker first, they are older than every pending one
+            row = self.db.execute(
+                """
+                SELECT start_block, end_block FROM lease
+                WHERE status = ? AND expires_at < ?
+                ORDER BY start_block LIMIT 1;
+                """,
+                (LEASED, now),
+            ).fetchone()
+            if row is None:
+                row = self.db.execute(
+                    """
+                    SELECT start_block, end_block FROM lease
+                    WHERE status = ?
+                    ORDER BY start_block LIMIT 1;
+                    """,
+                    (PENDING,),
+                ).fetchone()
+            if row is not None:
+                self.db.execute(
+                    """
+                    UPDATE lease SET status = ?, owner = ?, expires_at = ?
+                    WHERE start_block = ? AND end_block = ?;
+                    """,
+                    (LEASED, self.owner, now + self.ttl, *row),
+                )
+            self.db.execute("COMMIT;")
+        except Exception:
+            self.db.execute("ROLLBACK;")
+            raise
+
+        if row is None:
+            return None
+
+        self.held.add(row)
+        return row
+
+    async def heartbeat(self):
+        expires_at = time.time() + self.ttl
+        for block_range in list(self.held):
+            cursor = self.db.execute(
+                """
+                UPDATE lease SET expires_at = ?
+                WHERE start_block = ? AND end_block = ? AND owner = ? AND status = ?;
+                """,
+                (expires_at, *block_range, self.owner, LEASED),
+            )
+            if cursor.rowcount == 0:
+                logger.warning(f"Lost lease on blocks {block_range[0]}-{block_range[1]}")
+                self.held.discard(block_range)
+
+    async def complete(self, start_block: int, end_block: int):
+        self.db.execute(
+            "UPDATE lease SET status = ?, owner = ? WHERE start_block = ? AND end_block = ?;",
+            (DONE, self.owner, start_block, end_block),
+        )
+        self.held.discard((start_block, end_block))
+
+    async def remaining(self):
+        row = self.db.execute(
+            "SELECT COUNT(*) FROM lease WHERE status IN (?, ?);", (PENDING, LEASED)
+        ).fetchone()
+        return row[0]
+
+    def close(self):
+        self.db.close()
+
+
+class NatsLeaseService:
+    """Lease queue of block ranges in a JetStream KV bucket shared by every machine.
+
+    The whole queue is one key: the index of the next range nobody has leased
+    yet plus the ranges leased right now, with owner and expiry. Every change is
+    a compare-and-set on the key revision, so claiming, renewing and completing
+    cost one read and one write whatever the number of ranges, and a finished
+    range simply leaves the lease map. Every worker has to be started with the
+    same block span and batch size, a mismatch with the bucket raises.
+    """
+
+    key = "queue"
+
+    def __init__(self, jetstream, owner: str, ttl: float = 60, bucket: str = None):
+        self.jetstream = jetstream
+        self.owner = owner
+        self.ttl = ttl
+        self.bucket = bucket or f"{env.DATABASE_NAME}_lease"
+        self.held: set[tuple[int, int]] = set()
+
+        self.kv = None
+        self.start_block = 0
+        self.end_block = -1
+        self.batch_size = 1
+
+    @property
+    def num_ranges(self):
+        return (self.end_block - self.start_block) // self.batch_size + 1
+
+    def _range(self, index: int):
+        start_block = self.start_block + index * self.batch_size
+        return start_block, min(start_block + self.batch_size - 1, self.end_block)
+
+    def _index(self, block_range: tuple[int, int]):
+        return str((block_range[0] - self.start_block) // self.batch_size)
+
+    async def init(self, start_block: int, end_block: int, batch_size: int):
+        from nats.js.errors import KeyWrongLastSequenceError
+
+        self.start_block = start_block
+        self.end_block = end_block
+        self.batch_size = batch_size
+        span = [start_block, end_block, batch_size]
+
+        self.kv = await self.jetstream.create_key_value(bucket=self.bucket)
+        try:
+            await self.kv.create(self.key, orjson.dumps({"span": span, "next": 0, "leases": {}}))
+        except KeyWrongLastSequenceError:
+            # created by another worker, it has to cut the same ranges
+            queue = orjson.loads((await self.kv.get(self.key)).value)
+            if queue["span"] != span:
+                raise ValueError(f"Lease bucket {self.bucket} holds blocks/batch size {queue['span']}, not {span}")
+
+        logger.info(f"LEASE BUCKET: {self.bucket}")
+
+    async def _transact(self, change):
+        """Apply change(queue) -> result with compare-and-set, retrying while other workers win."""
+        from nats.js.errors import KeyWrongLastSequenceError
+
+        while True:
+            entry = await self.kv.get(self.key)
+            queue = orjson.loads(entry.value)
+            result = change(queue)
+            if result is None:
+                return None
+
+            try:
+                await self.kv.update(self.key, orjson.dumps(queue), last=entry.revision)
+                return result
+            except KeyWrongLastSequenceError:
+                continue
+
+    async def acquire(self):
+        now = time.time()
+
+        def claim(queue: dict):
+            # ranges of a dead worker first, a restarted worker with the same id included,
+            # then the next range nobody had yet
+            index = next(
+                (index for index, lease in queue["leases"].items() if lease["expires_at"] < now),
+                None,
+            )
+            if index is None:
+                if queue["next"] >= self.num_ranges:
+                    return None
+                index = str(queue["next"])
+                queue["next"] = queue["next"] + 1
+
+            queue["leases"][index] = {"owner": self.owner, "expires_at": now + self.ttl}
+            return self._range(int(index))
+
+        block_range = await self._transact(claim)
+        if block_range is not None:
+            self.held.add(block_range)
+        return block_range
+
+    async def heartbeat(self):
+        if not self.held:
+            return
+
+        expires_at = time.time() + self.ttl
+        lost = []
+
+        def renew(queue: dict):
+            lost.clear()
+            for block_range in self.held:
+                lease = queue["leases"].get(self._index(block_range))
+                if lease is None or lease["owner"] != self.owner:
+                    lost.append(block_range)
+                else:
+                    lease["expires_at"] = expires_at
+            return True
+
+        await self._transact(renew)
+        for block_range in lost:
+            logger.warning(f"Lost lease on blocks {block_range[0]}-{block_range[1]}")
+            self.held.discard(block_range)
+
+    async def complete(self, start_block: int, end_block: int):
+        block_range = (start_block, end_block)
+
+        def finish(queue: dict):
+            # a range taken over after this worker's lease expired is done all the same
+            if queue["leases"].pop(self._index(block_range), None) is None:
+                return None
+            return True
+
+        await self._transact(finish)
+        self.held.discard(block_range)
+
+    async def remaining(self):
+        queue = orjson.loads((await self.kv.get(self.key)).value)
+        return self.num_ranges - queue["next"] + len(queue["leases"])
+
+    def close(self):
+        pass
@@ -0,0 +1,94 @@
+from eth_abi.exceptions import DecodingError
+
+from src.abis.function import (
+    MULTICALL3_ADDRESS,
+    decode_function_output,
+    encode_function_call,
+)
+from src.clients.rpc_client import RpcClient
+from src.logger import logger
+
+
+def output_field(output: dict | None, name: str):
+    """One decoded output of a call result, None when the call reverted or had nothing to decode."""
+    return (output or {}).get(name)
+
+
+class MulticallService:
+    """Pack view calls into Multicall3 aggregate3 eth_calls and decode each result.
+
+    A call is (target, function, args) of a FUNCTION_ABI[erc] function. Every
+    sub-call allows failure, so one reverting contract does not fail its
+    neighbours. Each call comes back as its decoded outputs, {} when it succeeded
+    without decodable data (no code at the target, a bytes32 name, ...) or None
+    when it reverted. Aggregates that fail as a whole (Multicall3 not deployed,
+    out of gas) are resent as plain eth_calls.
+    """
+
+    def __init__(self, client: RpcClient, calls_per_multicall: int = 200):
+        self.client = client
+        self.calls_per_multicall = calls_per_multicall
+
+    async def call(self, calls: list[tuple[str, str, tuple]], erc="erc20"):
+        if not calls:
+            return []
+
+        datas = [encode_function_call(erc, function, args) for _, function, args in calls]
+        chunks = [
+            range(i, min(i + self.calls_per_multicall, len(calls)))
+            for i in range(0, len(calls), self.calls_per_multicall)
+        ]
+        param_sets = [
+            [
+                {
+                    "to": MULTICALL3_ADDRESS,
+                    "data": encode_function_call(
+                        "multicall3",
+                        "aggregate3",
+                        ([(calls[j][0], True, bytes.fromhex(datas[j][2:])) for j in chunk],),
+                    ),
+                }
+            ]
+            for chunk in chunks
+        ]
+        responses = await self.client.eth_call(param_sets=param_sets)
+
+        outcomes: list[tuple[bool, bytes]] = [None] * len(calls)
+        fallback = []
+        for chunk, response in zip(chunks, responses):
+            if "error" in response or response.get("result") in (None, "0x"):
+                fallback.extend(chunk)
+                continue
+
+            return_data = decode_function_output("multicall3", "aggregate3", response["result"])
+            for j, (success, data) in zip(chunk, return_data["returnData"]):
+                outcomes[j] = (success, data)
+
+        if fallback:
+            logger.warning(f"Multicall failed, resending {len(fallback)} calls one by one")
+            responses = await self.client.eth_call(
+                param_sets=[[{"to": calls[j][0], "data": datas[j]}] for j in fallback]
+            )
+            for j, response in zip(fallback, responses):
+                if "error" in response or response.get("result") is None:
+                    outcomes[j] = (False, b"")
+                else:
+                    outcomes[j] = (True, bytes.fromhex(response["result"][2:]))
+
+        return [
+            self._decode(erc, function, success, data)
+            for (_, function, _), (success, data) in zip(calls, outcomes)
+        ]
+
+    @staticmethod
+    def _decode(erc, function, success, data):
+        if not success:
+            return None
+
+        if not data:
+            return {}
+
+        try:
+            return decode_function_output(erc, function, "0x" + data.hex())
+        except (DecodingError, UnicodeDecodeError):
+            return {}
@@ -1,51 +1,33 @@
-from src.abis.function import FUNCTION_HEX_SIGNATURES, decode_function_output
 from src.clients.rpc_client import RpcClient
+from src.services.multicall_service import MulticallService, output_field
 
 
 class PoolService:
     def __init__(self, client: RpcClient):
         self.client = client
+        self.multicall = MulticallService(client)
+
+    async def get_token_addresses(self, pool_address, erc="erc20"):
+        """token0 and token1 of the pool in one aggregated eth_call, None for the ones that failed."""
+        token0, token1 = await self.multicall.call(
+            [(pool_address, "token0", ()), (pool_address, "token1", ())], erc
+        )
+        return output_field(token0, "token_address"), output_field(token1, "token_address")
 
     async def get_token0_address(self, pool_address, erc="erc20"):
-        param_set = [
-            {"to": pool_address, "data": FUNCTION_HEX_SIGNATURES[erc]["token0"][:10]}
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = res[0]
-        print(res)
-        res = decode_function_output(erc, "token0", res["result"])
-        return res["token_address"]
+        res = await self.multicall.call([(pool_address, "token0", ())], erc)
+        return output_field(res[0], "token_address")
 
     async def get_token1_address(self, pool_address, erc="erc20"):
-        param_set = [
-            {"to": pool_address, "data": FUNCTION_HEX_SIGNATURES[erc]["token1"]}
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = res[0]
-        res = decode_function_output(erc, "token1", res["result"])
-        return res["token_address"]
+        res = await self.multicall.call([(pool_address, "token1", ())], erc)
+        return output_field(res[0], "token_address")
 
     async def get_token_balance(self, pool_address, token_address, erc="erc20"):
-        param_set = [
-            {
-                "to": token_address,
-                "data": FUNCTION_HEX_SIGNATURES[erc]["balanceOf"][:10]
-                + pool_address.lower().replace("0x", "").rjust(64, "0"),
-            }
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = res[0]
-        res = decode_function_output(erc, "balanceOf", res["result"])
-        return res["balance"]
+        res = await self.multicall.call(
+            [(token_address, "balanceOf", (pool_address.lower(),))], erc
+        )
+        return output_field(res[0], "balance")
 
     async def get_reserve(self, pool_address, erc="erc20"):
-        param_set = [
-            {
-                "to": pool_address,
-                "data": FUNCTION_HEX_SIGNATURES[erc]["getReserves"],
-            }
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = res[0]
-        res = decode_function_output(erc, "getReserves", res["result"])
-        return res["reserve0"], res["reserve1"]
+        res = await self.multicall.call([(pool_address, "getReserves", ())], erc)
+        return output_field(res[0], "reserve0"), output_field(res[0], "reserve1")
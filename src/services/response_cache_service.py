@@ -0,0 +1,139 @@
+import hashlib
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import orjson
+
+from src.configs.environment import env
+from src.logger import logger
+
+# methods whose result never changes once their block is finalized, block number is params[0]
+CACHEABLE_METHODS = {"eth_getBlockByNumber", "eth_getBlockReceipts", "trace_block"}
+
+
+class ResponseCacheService:
+    """zlib compressed rpc responses of finalized blocks in a local sqlite file, evicted least recently used first.
+
+    A value is a whole json-rpc response, stored as the bytes it arrived as when
+    the caller still has them (streamed batches) and encoded here otherwise.
+    """
+
+    def __init__(self, path: str | Path = None, max_bytes: int = 10 * 1024**3):
+        self.path = path or env._local_database_folder / f"{env.NETWORK}_rpc_cache.sqlite"
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        # shared by the threads cache calls are offloaded to
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False, timeout=30)
+        self.db.execute("PRAGMA journal_mode=WAL;")
+        self.db.execute(
+            """
+            CREATE TABLE IF NOT EXISTS rpc_response
+            (
+                key BLOB PRIMARY KEY,
+                value BLOB,
+                size INTEGER,
+                accessed_time REAL
+            );
+            """
+        )
+        self.db.execute("CREATE INDEX IF NOT EXISTS rpc_response_accessed ON rpc_response (accessed_time);")
+        self.db.commit()
+        self.total_bytes = self._stored_bytes()
+        logger.info(f"RPC CACHE DATABASE PATH: {self.path}")
+
+    @staticmethod
+    def key(request: dict):
+        return hashlib.sha256(
+            request["method"].encode() + orjson.dumps(request["params"])
+        ).digest()
+
+    @staticmethod
+    def cacheable(request: dict, finalized_block: int):
+        if request["method"] not in CACHEABLE_METHODS or finalized_block is None:
+            return False
+
+        block_tag = request["params"][0]
+        return block_tag.startswith("0x") and int(block_tag, 16) <= finalized_block
+
+    def _stored_bytes(self):
+        return self.db.execute("SELECT COALESCE(SUM(size), 0) FROM rpc_response;").fetchone()[0]
+
+    def get(self, keys: list[bytes]):
+        """Return {key: result} of the keys found."""
+        if not keys:
+            return {}
+
+        with self._lock:
+            placeholders = ",".join("?" * len(keys))
+            rows = self.db.execute(
+                f"SELECT key, value FROM rpc_response WHERE key IN ({placeholders});", keys
+            ).fetchall()
+            if rows:
+                with self.db:
+                    self.db.execute(
+                        f"UPDATE rpc_response SET accessed_time = ? WHERE key IN ({placeholders});",
+                        (time.time(), *keys),
+                    )
+
+        self.hits = self.hits + len(rows)
+        self.misses = self.misses + len(keys) - len(rows)
+        return {key: orjson.loads(zlib.decompress(value))["result"] for key, value in rows}
+
+    def put(self, items: dict[bytes, bytes | dict]):
+        """Store responses by key, either their raw bytes or the parsed response."""
+        if not items:
+            return
+
+        now = time.time()
+        rows = []
+        for key, response in items.items():
+            value = zlib.compress(response if isinstance(response, bytes) else orjson.dumps(response))
+            rows.append((key, value, len(value), now))
+
+        with self._lock:
+            with self.db:
+                self.db.executemany(
+                    "INSERT OR REPLACE INTO rpc_response (key, value, size, accessed_time) VALUES (?, ?, ?, ?);",
+                    rows,
+                )
+
+            self.total_bytes = self.total_bytes + sum(row[2] for row in rows)
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+
+    def _evict(self):
+        # other processes may share the file, so the real size is read back before deleting
+        self.total_bytes = self._stored_bytes()
+        target = int(self.max_bytes * 0.9)
+        if self.total_bytes <= target:
+            return
+
+        with self.db:
+            cursor = self.db.execute(
+                "SELECT key, size FROM rpc_response ORDER BY accessed_time;"
+            )
+            evicted = []
+            freed = 0
+            for key, size in cursor:
+                if self.total_bytes - freed <= target:
+                    break
+
+                evicted.append((key,))
+                freed = freed + size
+
+            self.db.executemany("DELETE FROM rpc_response WHERE key = ?;", evicted)
+
+        self.total_bytes = self.total_bytes - freed
+        logger.info(f"Evicted {len(evicted)} cached rpc responses ({freed} bytes)")
+
+    def metrics(self):
+        return {"hits": self.hits, "misses": self.misses, "bytes": self.total_bytes}
+
+    def close(self):
+        self.db.close()
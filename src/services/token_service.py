@@ -1,39 +1,32 @@
-from src.abis.function import FUNCTION_HEX_SIGNATURES, decode_function_output
 from src.clients.rpc_client import RpcClient
+from src.services.multicall_service import MulticallService, output_field
 
 
 class TokenService:
     def __init__(self, client: RpcClient):
         self.client = client
+        self.multicall = MulticallService(client)
+
+    async def get_token_info(self, token_address, erc="erc20"):
+        """name, symbol, decimals and totalSupply in one aggregated eth_call, None for the ones that failed."""
+        functions = ["name", "symbol", "decimals", "totalSupply"]
+        res = await self.multicall.call(
+            [(token_address, function, ()) for function in functions], erc
+        )
+        return {function: output_field(output, function) for function, output in zip(functions, res)}
 
     async def get_token_name(self, token_address, erc="erc20"):
-        param_set = [
-            {"to": token_address, "data": FUNCTION_HEX_SIGNATURES[erc]["name"]}
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = decode_function_output(erc, "name", res["result"])
-        return res["name"]
+        res = await self.multicall.call([(token_address, "name", ())], erc)
+        return output_field(res[0], "name")
 
     async def get_token_symbol(self, token_address, erc="erc20"):
-        param_set = [
-            {"to": token_address, "data": FUNCTION_HEX_SIGNATURES[erc]["symbol"]}
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = decode_function_output(erc, "symbol", res["result"])
-        return res["symbol"]
+        res = await self.multicall.call([(token_address, "symbol", ())], erc)
+        return output_field(res[0], "symbol")
 
     async def get_token_decimals(self, token_address, erc="erc20"):
-        param_set = [
-            {"to": token_address, "data": FUNCTION_HEX_SIGNATURES[erc]["decimals"]}
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = decode_function_output(erc, "decimals", res["result"])
-        return res["decimals"]
+        res = await self.multicall.call([(token_address, "decimals", ())], erc)
+        return output_field(res[0], "decimals")
 
     async def get_token_total_supply(self, token_address, erc="erc20"):
-        param_set = [
-            {"to": token_address, "data": FUNCTION_HEX_SIGNATURES[erc]["totalSupply"]}
-        ]
-        res = await self.client.eth_call(param_sets=[param_set])
-        res = decode_function_output(erc, "totalSupply", res["result"])
-        return res["totalSupply"]
+        res = await self.multicall.call([(token_address, "totalSupply", ())], erc)
+        return output_field(res[0], "totalSupply")
@@ -1,7 +1,10 @@
-from collections import defaultdict
+import asyncio
+import functools
+from collections import Counter, defaultdict, deque
 
 from rich.progress import Progress, TaskID
 
+from src.schemas.dag import DagTemplate
 from src.schemas.node import Node
 
 from src.tasks.fetch.raw_block import raw_block_init
@@ -10,6 +13,7 @@ from src.tasks.extract.transaction import transaction_init
 from src.tasks.extract.withdrawal import withdrawal_init
 
 from src.tasks.fetch.raw_receipt import raw_receipt_init
+from src.tasks.fetch.log import log_fetch_init
 from src.tasks.extract.receipt import receipt_init
 from src.tasks.extract.log import log_init
 from src.tasks.extract.transfer import transfer_init
@@ -27,7 +31,7 @@ from src.tasks.finish import finish
 from src.tasks.export.nats import entity_func as nats_entity_func
 from src.tasks.export.sqlite import entity_func as sqlite_entity_func
 
-from src.utils.enumeration import Entity, Exporter
+from src.utils.enumeration import Entity, Exporter, Resource
 
 entity_func = {
     Entity.RAW_BLOCK: [raw_block_init],
@@ -41,7 +45,7 @@ entity_func = {
     Entity.TRANSFER: [transfer_init],
     Entity.EVENT: [uniswap_v2_event_init, uniswap_v3_event_init],
     Entity.ACCOUNT: [account_init_address, account_enrich_balance],
-    Entity.POOL: [pool_init_address, pool_enrich_token_address, pool_enrich_token_balance, pool_enrich_token_balance, pool_update_graph, pool_enrich_token_price],
+    Entity.POOL: [pool_init_address, pool_enrich_token_address, pool_enrich_token_balance, pool_update_graph, pool_enrich_token_price],
     Entity.TOKEN: [token_init_address, token_enrich_info, token_update_graph],
 
     Entity.RAW_TRACE: [raw_trace_init],
@@ -72,7 +76,95 @@ func_func = {
     token_update_graph: [token_enrich_info],
 
     raw_trace_init: [],
-    trace_init: [raw_trace_init]
+    trace_init: [raw_trace_init],
+
+    log_fetch_init: [],
+}
+
+# runs that only want logs fetch them with eth_getLogs instead of extracting them from whole receipts
+logs_only_entities = {Entity.LOG, Entity.TRANSFER, Entity.EVENT}
+logs_only_substitutes = {log_init: log_fetch_init}
+
+func_resource = {
+    raw_block_init: Resource.RPC,
+    block_init: Resource.CPU,
+    transaction_init: Resource.CPU,
+    withdrawal_init: Resource.CPU,
+
+    raw_receipt_init: Resource.RPC,
+    receipt_init: Resource.CPU,
+    log_init: Resource.CPU,
+    transfer_init: Resource.CPU,
+    uniswap_v2_event_init: Resource.CPU,
+    uniswap_v3_event_init: Resource.CPU,
+    account_init_address: Resource.CPU,
+    account_enrich_balance: Resource.RPC,
+    pool_init_address: Resource.CPU,
+    pool_enrich_token_address: Resource.RPC,
+    pool_enrich_token_balance: Resource.RPC,
+    pool_update_graph: Resource.MEMGRAPH,
+    pool_enrich_token_price: Resource.MEMGRAPH,
+
+    token_init_address: Resource.CPU,
+    token_enrich_info: Resource.RPC,
+    token_update_graph: Resource.MEMGRAPH,
+
+    raw_trace_init: Resource.RPC,
+    trace_init: Resource.CPU,
+
+    log_fetch_init: Resource.RPC,
+
+    finish: Resource.CONTROL,
+}
+
+# rpc method a fetch function sends one request per block of, its batch size is the range length
+func_method = {
+    raw_block_init: "eth_getBlockByNumber",
+    raw_receipt_init: "eth_getBlockReceipts",
+    raw_trace_init: "trace_block",
+}
+
+# entities each function reads and writes in the shared results dict
+func_io = {
+    raw_block_init: ([], [Entity.RAW_BLOCK]),
+    block_init: ([Entity.RAW_BLOCK], [Entity.BLOCK]),
+    transaction_init: ([Entity.RAW_BLOCK], [Entity.TRANSACTION]),
+    withdrawal_init: ([Entity.RAW_BLOCK], [Entity.WITHDRAWAL]),
+
+    raw_receipt_init: ([], [Entity.RAW_RECEIPT]),
+    receipt_init: ([Entity.RAW_RECEIPT], [Entity.RECEIPT]),
+    log_init: ([Entity.RAW_RECEIPT], [Entity.LOG]),
+    transfer_init: ([Entity.LOG], [Entity.TRANSFER]),
+    uniswap_v2_event_init: ([Entity.LOG], [Entity.EVENT]),
+    uniswap_v3_event_init: ([Entity.LOG], [Entity.EVENT]),
+    account_init_address: ([Entity.RAW_RECEIPT], [Entity.ACCOUNT]),
+    account_enrich_balance: ([Entity.ACCOUNT], [Entity.ACCOUNT]),
+    pool_init_address: ([Entity.EVENT], [Entity.POOL]),
+    pool_enrich_token_address: ([Entity.POOL], [Entity.POOL]),
+    pool_enrich_token_balance: ([Entity.POOL], [Entity.POOL]),
+    pool_update_graph: ([Entity.POOL], []),
+    pool_enrich_token_price: ([Entity.POOL, Entity.TOKEN], [Entity.POOL]),
+
+    token_init_address: ([Entity.POOL], [Entity.TOKEN]),
+    token_enrich_info: ([Entity.TOKEN], [Entity.TOKEN]),
+    token_update_graph: ([Entity.TOKEN], []),
+
+    raw_trace_init: ([], [Entity.RAW_TRACE]),
+    trace_init: ([Entity.RAW_TRACE], [Entity.TRACE]),
+
+    log_fetch_init: ([], [Entity.LOG]),
+
+    finish: ([], []),
+}
+
+# pure extractors that only append to their outputs, safe to run in a worker process
+process_funcs = {
+    transaction_init,
+    log_init,
+    transfer_init,
+    uniswap_v2_event_init,
+    uniswap_v3_event_init,
+    trace_init,
 }
 
 exporter_entity_func = {
@@ -80,85 +172,193 @@ exporter_entity_func = {
     Exporter.SQLITE: sqlite_entity_func
 }
 
+exporter_resource = {
+    Exporter.NATS: Resource.NATS,
+    Exporter.SQLITE: Resource.SQLITE
+}
+
+
+
+def compile_dag(entities: list[str], exporters: list[str]) -> DagTemplate:
+    """Resolve the functions needed for entities/exporters once, the result is reused for every block range."""
+    for entity in entities:
+        if entity not in entity_func:
+            raise ValueError(f"Unknown entity: {entity}")
+
+    for exporter in exporters:
+        if exporter not in exporter_entity_func:
+            raise ValueError(f"Unknown exporter: {exporter}")
+
+    substitutes = {}
+    if entities and set(entities) <= logs_only_entities:
+        substitutes = logs_only_substitutes
+
+    def resolve(funcs):
+        return [substitutes.get(func, func) for func in funcs]
+
+    # dependency closure, dict keeps the first-seen order and drops duplicates
+    required_funcs = dict.fromkeys(
+        func for entity in entities for func in resolve(entity_func[entity])
+    )
+    stack = list(required_funcs)
+    while stack:
+        for dep in resolve(func_func[stack.pop()]):
+            if dep not in required_funcs:
+                required_funcs[dep] = None
+                stack.append(dep)
+
+    # node key -> (name, func, resource, (reads, writes), dependency keys)
+    specs = {}
+    for func in required_funcs:
+        specs[func] = (
+            func.__name__,
+            func,
+            func_resource[func],
+            func_io[func],
+            resolve(func_func[func]),
+        )
+
+    for exporter in exporters:
+        for entity in entities:
+            func = exporter_entity_func[exporter][entity]
+            specs[(exporter, entity)] = (
+                f"{exporter}_{func.__name__}",
+                func,
+                exporter_resource[exporter],
+                ([entity], []),
+                resolve(entity_func[entity]),
+            )
+
+    specs["finish"] = ("finish", finish, func_resource[finish], func_io[finish], [])
+
+    node_ids = {key: node_id for node_id, key in enumerate(specs)}
+    names = tuple(spec[0] for spec in specs.values())
+    funcs = tuple(spec[1] for spec in specs.values())
+    deps = [
+        tuple(dict.fromkeys(node_ids[dep] for dep in spec[4]))
+        for spec in specs.values()
+    ]
+
+    # finish only has to wait for the sinks, everything else is upstream of them
+    has_dependents = {dep for node_deps in deps for dep in node_deps}
+    deps[-1] = tuple(i for i in range(len(deps) - 1) if i not in has_dependents)
+
+    resources = tuple(spec[2] for spec in specs.values())
+    return DagTemplate(
+        entities=tuple(entities),
+        exporters=tuple(exporters),
+        names=names,
+        funcs=funcs,
+        resources=resources,
+        reads=tuple(tuple(spec[3][0]) for spec in specs.values()),
+        writes=tuple(tuple(spec[3][1]) for spec in specs.values()),
+        in_process=tuple(func in process_funcs for func in funcs),
+        deps=tuple(deps),
+        order=_topological_order(deps),
+        fetch_ids=tuple(
+            node_id
+            for node_id, node_deps in enumerate(deps)
+            if not node_deps and resources[node_id] == Resource.RPC
+        ),
+        include_transaction=Entity.TRANSACTION in entities,
+        fetch_methods=tuple(func_method[func] for func in funcs if func in func_method),
+    )
+
+
+def _topological_order(deps: list[tuple[int, ...]]) -> tuple[int, ...]:
+    dependents = [[] for _ in deps]
+    unmet = [len(node_deps) for node_deps in deps]
+    for node_id, node_deps in enumerate(deps):
+        for dep in node_deps:
+            dependents[dep].append(node_id)
+
+    order = []
+    ready = deque(node_id for node_id, count in enumerate(unmet) if count == 0)
+    while ready:
+        node_id = ready.popleft()
+        order.append(node_id)
+        for dependent in dependents[node_id]:
+            unmet[dependent] = unmet[dependent] - 1
+            if unmet[dependent] == 0:
+                ready.append(dependent)
+
+    if len(order) != len(deps):
+        raise ValueError("Dag has a dependency cycle")
+
+    return tuple(order)
+
 
 def create_node(
+    template: DagTemplate,
     progress: Progress,
     task_id: TaskID,
     rpc_client,
     graph_client,
     start_block: int,
     end_block: int,
-    entities: list[str],
-    exporters: list[str],
+    results: dict[str, list] = None,
+    prefetched: tuple[int, ...] = (),
+    **kwargs,
 ):
-    nodes = {}
+    # prefetched nodes already filled results, they are left out and count as done.
+    # extra kwargs (e.g. checkpoint_service) are passed to every node
     dag_id = f"{start_block}_{end_block}"
+    node_ids = [node_id for node_id in template.order if node_id not in prefetched]
+    touches = {
+        node_id: tuple(dict.fromkeys(template.reads[node_id] + template.writes[node_id]))
+        for node_id in node_ids
+    }
+    # an entity buffer is dropped once every node reading or writing it is done
+    refcounts = Counter(entity for node_id in node_ids for entity in touches[node_id])
+
     params = {
+        **kwargs,
         "progress": progress,
         "task_id": task_id,
-        "results": defaultdict(list),
+        "results": results if results is not None else defaultdict(list),
         "rpc_client": rpc_client,
         "graph_client": graph_client,
         "block_numbers": range(start_block, end_block + 1),
         "batch_size": end_block - start_block + 1,
-        "include_transaction": Entity.TRANSACTION in entities
+        "include_transaction": template.include_transaction,
+        "entities": template.entities,
+        "exporters": template.exporters,
+        # orjson bytes of entities already sent to the process pool, shared by their process readers
+        "encoded": {},
     }
 
-    required_funcs = set()
-    for entity in entities:
-        required_funcs.update(entity_func[entity])
-
-    required_funcs = list(required_funcs)
-
-    all_node_names = []
-    for func in required_funcs:
-        dep_funcs = func_func[func]
-        dep_names = [f"{dag_id}_{dep.__name__}" for dep in dep_funcs]
-        for dep in dep_funcs:
-            if dep not in required_funcs:
-                required_funcs.append(dep)
-
-        node_name = f"{dag_id}_{func.__name__}"
-        all_node_names.append(node_name)
-        nodes[node_name] = Node(
+    nodes = {}
+    for node_id in node_ids:
+        nodes[(dag_id, node_id)] = Node(
             dag_id=dag_id,
-            name=node_name,
-            func=func,
+            node_id=node_id,
+            name=template.names[node_id],
+            func=template.funcs[node_id],
+            resource=template.resources[node_id],
+            reads=template.reads[node_id],
+            writes=template.writes[node_id],
+            in_process=template.in_process[node_id],
             kwargs=params,
             task=None,
-            dep_nodes=dep_names,
+            dep_nodes=[(dag_id, dep) for dep in template.deps[node_id]],
             dep_data=[],
             status="pending",
+            release=functools.partial(
+                release_buffers, params["results"], params["encoded"], refcounts, touches[node_id]
+            ),
         )
 
-    for exporter in exporters:
-        for entity in entities:
-            func = exporter_entity_func[exporter][entity]
-            dep_funcs = entity_func[entity]
-            dep_names = [f"{dag_id}_{dep.__name__}" for dep in dep_funcs]
-
-            node_name = f"{dag_id}_{exporter}_{func.__name__}"
-            all_node_names.append(node_name)
-            nodes[node_name] = Node(
-                dag_id=dag_id,
-                name=node_name,
-                func=func,
-                kwargs=params,
-                task=None,
-                dep_nodes=dep_names,
-                dep_data=[],
-                status="pending",
-            )
+    return nodes
 
-    nodes[f"{dag_id}_finish"] = Node(
-        dag_id=dag_id,
-        name=f"{dag_id}_finish",
-        func=finish,
-        kwargs=params,
-        task=None,
-        dep_nodes=all_node_names,
-        dep_data=[],
-        status="pending",
-    )
 
-    return nodes
+def release_buffers(
+    results: dict[str, list],
+    encoded: dict[str, bytes | asyncio.Future],
+    refcounts: Counter,
+    entities: tuple[str, ...],
+):
+    for entity in entities:
+        refcounts[entity] = refcounts[entity] - 1
+        if refcounts[entity] == 0:
+            results.pop(entity, None)
+            encoded.pop(entity, None)
@@ -44,6 +44,7 @@ async def account_enrich_balance(
             account["balance"] = hex_to_dec(response["result"])
 
     tasks = []
+    batch_size = rpc_client.batch_sizer.size("eth_getBalance")
     for i in range(0, len(results[Entity.ACCOUNT]), batch_size):
         batch = results[Entity.ACCOUNT][i : i + batch_size]
         task = asyncio.create_task(_run(rpc_client, batch))
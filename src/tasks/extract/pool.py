@@ -1,10 +1,12 @@
 import asyncio
+import time
 
 from neo4j import AsyncDriver
 
-from src.abis.function import FUNCTION_HEX_SIGNATURES
+from src.clients.batch_sizer import memgraph_batch_sizer
 from src.clients.rpc_client import RpcClient
 from src.logger import logger
+from src.services.multicall_service import MulticallService
 from src.utils.enumeration import Entity
 
 
@@ -23,110 +25,53 @@ def pool_init_address(results: dict[str, list], **kwargs):
 
 
 async def pool_enrich_token_address(
-    results: dict[str, list], rpc_client: RpcClient, batch_size: int, **kwargs
+    results: dict[str, list], rpc_client: RpcClient, **kwargs
 ):
-    def _form_param_set(pools: list[dict]):
-        param_sets = []
-        for pool in pools:
-            for func in ["token0", "token1"]:
-                param_set = [
-                    {
-                        "to": pool["address"].lower()[:42],
-                        "data": FUNCTION_HEX_SIGNATURES["erc20"][func],
-                    }
-                ]
-                param_sets.append(param_set)
-
-        return param_sets
-
-    async def _run(rpc_client: RpcClient, pools: list[dict]):
-        param_sets = _form_param_set(pools)
-        responses = await rpc_client.eth_call(param_sets=param_sets)
-
-        num_enrich_field = 2
-        for i in range(len(pools)):
-            pool = pools[i]
-            if any(
-                "error" in i
-                for i in responses[i * num_enrich_field : (i + 1) * num_enrich_field]
-            ):
-                results[Entity.POOL].remove(pool)  # TODO: fix this to hold error pool?
-                continue
-
-            token0, token1 = responses[
-                i * num_enrich_field : (i + 1) * num_enrich_field
-            ]
+    pools = results[Entity.POOL]
+    calls = [
+        (pool["address"].lower()[:42], func, ())
+        for pool in pools
+        for func in ["token0", "token1"]
+    ]
+    outputs = await MulticallService(rpc_client).call(calls)
 
-            if token0["result"]=="0x" and token0["result"]=="0x": # the pool address actually a token address
-                results[Entity.POOL].remove(pool)
-                continue
+    enriched = []
+    for i, pool in enumerate(pools):
+        token0, token1 = outputs[i * 2 : (i + 1) * 2]
+        if token0 is None or token1 is None:
+            continue  # TODO: fix this to hold error pool?
 
-            pool["token0_address"] = "0x" + token0["result"][-40:]
-            pool["token1_address"] = "0x" + token1["result"][-40:]
+        if not token0 or not token1:  # the pool address actually a token address
+            continue
 
+        pool["token0_address"] = token0["token_address"].lower()
+        pool["token1_address"] = token1["token_address"].lower()
+        enriched.append(pool)
 
-    tasks = []
-    batch_size = 10
-    for i in range(0, len(results[Entity.POOL]), batch_size):
-        batch = results[Entity.POOL][i : i + batch_size]
-        task = asyncio.create_task(_run(rpc_client, batch))
-        tasks.append(task)
-
-    await asyncio.gather(*tasks)
+    results[Entity.POOL] = enriched
 
 
 # -------------------------------------------
 
 
 async def pool_enrich_token_balance(
-    results: dict[str, list], rpc_client: RpcClient, batch_size: int, **kwargs
+    results: dict[str, list], rpc_client: RpcClient, **kwargs
 ):
-    def _form_param_set(pools: list[dict]):
-        param_sets = []
-        for pool in pools:
-            for token in ["token0_address", "token1_address"]:
-                param_set = [
-                    {
-                        "to": "0x" + pool[token].lower()[-40:],
-                        "data": FUNCTION_HEX_SIGNATURES["erc20"]["balanceOf"][:10]
-                        + pool["address"].lower().replace("0x", "").rjust(64, "0"),
-                    }
-                ]
-                param_sets.append(param_set)
-
-        return param_sets
-
-    async def _run(rpc_client: RpcClient, pools: list[dict]):
-        param_sets = _form_param_set(pools)
-        responses = await rpc_client.eth_call(param_sets=param_sets)
-
-        num_enrich_field = 2
-        for i in range(len(pools)):
-            pool = pools[i]
-            if any(
-                "error" in i
-                for i in responses[i * num_enrich_field : (i + 1) * num_enrich_field]
-            ):
-                continue
-
-            balance0, balance1 = responses[
-                i * num_enrich_field : (i + 1) * num_enrich_field
-            ]
-            pool["token0_balance"] = (
-                int(balance0["result"], 16) if balance0["result"] != "0x" else 0
-            )
-            pool["token1_balance"] = (
-                int(balance1["result"], 16) if balance1["result"] != "0x" else 0
-            )
+    pools = results[Entity.POOL]
+    calls = [
+        (pool[token].lower(), "balanceOf", (pool["address"].lower(),))
+        for pool in pools
+        for token in ["token0_address", "token1_address"]
+    ]
+    outputs = await MulticallService(rpc_client).call(calls)
 
-    tasks = []
-    batch_size = 10
-    for i in range(0, len(results[Entity.POOL]), batch_size):
-        batch = results[Entity.POOL][i : i + batch_size]
-        task = asyncio.create_task(_run(rpc_client, batch))
-        tasks.append(task)
+    for i, pool in enumerate(pools):
+        balance0, balance1 = outputs[i * 2 : (i + 1) * 2]
+        if balance0 is None or balance1 is None:
+            continue
 
-    await asyncio.gather(*tasks)
+        pool["token0_balance"] = balance0.get("balance", 0)
+        pool["token1_balance"] = balance1.get("balance", 0)
 
 
 # -----------------------------------------
@@ -167,12 +112,14 @@ async def pool_update_graph(
                 p_t1_t0.tgt_balance = pool.token0_balance
         """
 
+        start = time.monotonic()
         await graph_client.execute_query(query, **params)
+        memgraph_batch_sizer.record("pool_update_graph", len(pools), time.monotonic() - start)
 
     tasks = []
-    BATCH_SIZE = 500
-    for i in range(0, len(results[Entity.POOL]), BATCH_SIZE):
-        batch = results[Entity.POOL][i:i+BATCH_SIZE]
+    batch_size = memgraph_batch_sizer.size("pool_update_graph")
+    for i in range(0, len(results[Entity.POOL]), batch_size):
+        batch = results[Entity.POOL][i:i+batch_size]
         task = asyncio.create_task(_run(batch))
         tasks.append(task)
 
@@ -213,7 +160,9 @@ async def pool_enrich_token_price(
         """
 
         # if there no path, the number of record != number of pool
+        start = time.monotonic()
         records, _, _ = await client.execute_query(query, **params)
+        memgraph_batch_sizer.record("pool_enrich_token_price", len(pools), time.monotonic() - start)
 
         price_map = {}
         for record in records:
@@ -281,9 +230,9 @@ async def pool_enrich_token_price(
     }
     token_decimals[USDT_ADDRESS] = 6
     tasks = []
-    BATCH_SIZE = 500
-    for i in range(0, len(results[Entity.POOL]), BATCH_SIZE):
-        batch = results[Entity.POOL][i:i+BATCH_SIZE]
+    batch_size = memgraph_batch_sizer.size("pool_enrich_token_price")
+    for i in range(0, len(results[Entity.POOL]), batch_size):
+        batch = results[Entity.POOL][i:i+batch_size]
         task = asyncio.create_task(_run(graph_client, batch, token_decimals, weth_usdt_ratio))
         tasks.append(task)
 
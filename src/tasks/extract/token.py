@@ -1,9 +1,11 @@
 import asyncio
+import time
 
 from neo4j import AsyncDriver
 
-from src.abis.function import FUNCTION_HEX_SIGNATURES
+from src.clients.batch_sizer import memgraph_batch_sizer
 from src.clients.rpc_client import RpcClient
+from src.services.multicall_service import MulticallService
 from src.utils.enumeration import Entity
 
 
@@ -21,61 +23,32 @@ def token_init_address(results: dict[str, list], **kwargs):
 
 
 async def token_enrich_info(
-    results: dict[str, list], rpc_client: RpcClient, batch_size: int, **kwargs
+    results: dict[str, list], rpc_client: RpcClient, **kwargs
 ):
-    def decode(hex_string):
-        data = bytes.fromhex(hex_string[2:])
-
-        # string length is at byte 32..64
-        length = int.from_bytes(data[32:64], "big")
-
-        # string content is at byte 64..64+length
-        string_bytes = data[64 : 64 + length]
-        decoded = string_bytes.decode()
-        return decoded
-
-    def _form_param_set(tokens):
-        param_sets = []
-        for token in tokens:
-            for func in ["name", "symbol", "decimals", "totalSupply"]:
-                param_set = [
-                    {
-                        "to": "0x" + token["address"].lower()[-40:],
-                        "data": FUNCTION_HEX_SIGNATURES["erc20"][func],
-                    }
-                ]
-                param_sets.append(param_set)
-
-        return param_sets
-
-    async def _run(rpc_client: RpcClient, tokens: list[dict]):
-        param_sets = _form_param_set(tokens)
-        responses = await rpc_client.eth_call(param_sets=param_sets)
-
-        for i in range(0, len(tokens)):
-            token = tokens[i]
-            if any("error" in i for i in responses[i * 4 : (i + 1) * 4]):
-                results[Entity.TOKEN].remove(token)  # TODO: fix this to hold error token?
-                continue
-
-            name, symbol, decimals, total_supply = responses[i * 4 : (i + 1) * 4]
-            token["name"] = decode(name["result"])
-            token["symbol"] = decode(symbol["result"])
-            token["decimals"] = (
-                int(decimals["result"], 16) if decimals["result"] != "0x" else 0
-            )
-            token["total_supply"] = (
-                int(total_supply["result"], 16) if total_supply["result"] != "0x" else 0
-            )
+    functions = ["name", "symbol", "decimals", "totalSupply"]
+    tokens = results[Entity.TOKEN]
+    calls = [
+        ("0x" + token["address"].lower()[-40:], func, ())
+        for token in tokens
+        for func in functions
+    ]
+    outputs = await MulticallService(rpc_client).call(calls)
 
-    tasks = []
-    batch_size = 5
-    for i in range(0, len(results[Entity.TOKEN]), batch_size):
-        batch = results[Entity.TOKEN][i : i + batch_size]
-        task = asyncio.create_task(_run(rpc_client, batch))
-        tasks.append(task)
+    enriched = []
+    for i, token in enumerate(tokens):
+        name, symbol, decimals, total_supply = outputs[
+            i * len(functions) : (i + 1) * len(functions)
+        ]
+        if any(output is None for output in (name, symbol, decimals, total_supply)):
+            continue  # TODO: fix this to hold error token?
 
-    await asyncio.gather(*tasks)
+        token["name"] = name.get("name", "")
+        token["symbol"] = symbol.get("symbol", "")
+        token["decimals"] = decimals.get("decimals", 0)
+        token["total_supply"] = total_supply.get("totalSupply", 0)
+        enriched.append(token)
+
+    results[Entity.TOKEN] = enriched
 
 
 async def token_update_graph(
@@ -102,12 +75,14 @@ async def token_update_graph(
                 t.decimals = token.decimals
         """
 
+        start = time.monotonic()
         await graph_client.execute_query(query, **params)
+        memgraph_batch_sizer.record("token_update_graph", len(tokens), time.monotonic() - start)
 
     tasks = []
-    BATCH_SIZE = 500
-    for i in range(0, len(results[Entity.TOKEN]), BATCH_SIZE):
-        batch = results[Entity.TOKEN][i : i + BATCH_SIZE]
+    batch_size = memgraph_batch_sizer.size("token_update_graph")
+    for i in range(0, len(results[Entity.TOKEN]), batch_size):
+        batch = results[Entity.TOKEN][i : i + batch_size]
         task = asyncio.create_task(_run(batch))
         tasks.append(task)
 
@@ -0,0 +1,46 @@
+from src.abis.event import EVENT_HEX_SIGNATURES
+from src.clients.rpc_client import RpcClient, raise_for_failed_blocks
+from src.tasks.extract.log import _extract
+from src.tasks.extract.transfer import TRANSFER_EVENT_HEX_SIGNATURE
+from src.utils.common import hex_to_dec
+from src.utils.enumeration import Entity
+
+
+def log_topics(entities: tuple[str, ...]):
+    """topic0 filter of eth_getLogs, None when every log is wanted."""
+    if Entity.LOG in entities:
+        return None
+
+    signatures = []
+    if Entity.TRANSFER in entities:
+        signatures.append(TRANSFER_EVENT_HEX_SIGNATURE)
+    if Entity.EVENT in entities:
+        signatures.extend(
+            signature for events in EVENT_HEX_SIGNATURES.values() for signature in events.values()
+        )
+    return [signatures]
+
+
+async def log_fetch_init(
+    results: dict[str, list],
+    rpc_client: RpcClient,
+    block_numbers: list[int],
+    entities: tuple[str, ...],
+    **kwargs
+):
+    # the logs of the whole range in one eth_getLogs instead of every receipt of every block
+    raw_logs = await rpc_client.get_logs(block_numbers[0], block_numbers[-1], log_topics(entities))
+
+    # blockTimestamp is a recent addition to eth_getLogs, older providers leave it out
+    missing = sorted({raw_log["blockNumber"] for raw_log in raw_logs if "blockTimestamp" not in raw_log})
+    if missing:
+        missing_numbers = [hex_to_dec(block_number) for block_number in missing]
+        responses = await rpc_client.get_block_by_number(block_numbers=missing_numbers, include_transaction=False)
+        raise_for_failed_blocks("eth_getBlockByNumber", missing_numbers, responses)
+        timestamps = {block_number: response["result"]["timestamp"] for block_number, response in zip(missing, responses)}
+        for raw_log in raw_logs:
+            raw_log.setdefault("blockTimestamp", timestamps.get(raw_log["blockNumber"]))
+
+    # ranges split for too many results come back out of order
+    logs = sorted((_extract(raw_log) for raw_log in raw_logs), key=lambda log: (log["block_number"], log["log_index"]))
+    results[Entity.LOG].extend(logs)
@@ -1,4 +1,4 @@
-from src.clients.rpc_client import RpcClient
+from src.clients.rpc_client import RpcClient, raise_for_failed_blocks
 from src.utils.enumeration import Entity
 
 
@@ -12,10 +12,8 @@ async def raw_block_init(
     responses = await rpc_client.get_block_by_number(
         block_numbers=block_numbers, include_transaction=include_transaction
     )
-    while "error" in responses[0] or responses[0]["result"] is None:
-        responses = await rpc_client.get_block_by_number(
-            block_numbers=block_numbers, include_transaction=include_transaction
-        )
+    # the client already resent failed blocks, whatever is left is a real failure
+    raise_for_failed_blocks("eth_getBlockByNumber", block_numbers, responses)
 
     raw_blocks = [
         {
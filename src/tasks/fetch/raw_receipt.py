@@ -1,15 +1,20 @@
-from src.clients.rpc_client import RpcClient
+from src.clients.rpc_client import RpcClient, RpcError
 from src.utils.enumeration import Entity
 
 
 async def raw_receipt_init(
     results: dict[str, list], rpc_client: RpcClient, block_numbers: list[int], **kwargs
 ):
-    responses = await rpc_client.get_receipt_by_block_number(block_numbers=block_numbers)
-    while "error" in responses[0] or responses[0]["result"] is None:
-        responses = await rpc_client.get_receipt_by_block_number(block_numbers=block_numbers)
+    # blocks are handled as their response arrives, the client already resent failed ones,
+    # and are added in block order whatever order the responses came in
+    failed = []
+    by_block = {}
+    async for block_number, response in rpc_client.iter_receipt_by_block_number(block_numbers):
+        if "error" in response or response.get("result") is None:
+            failed.append(block_number)
+            continue
 
-    for block_number, response in zip(block_numbers, responses):
+        by_block[block_number] = block_results = []
         for data in response["result"]:
             transaction_hash = data["transactionHash"]
             raw_receipt = {
@@ -17,4 +22,10 @@ async def raw_receipt_init(
                 "transaction_hash": transaction_hash,
                 "data": data,
             }
-            results[Entity.RAW_RECEIPT].append(raw_receipt)
\ No newline at end of file
+            block_results.append(raw_receipt)
+
+    if failed:
+        raise RpcError(f"eth_getBlockReceipts failed for blocks {sorted(failed)}")
+
+    for block_number in block_numbers:
+        results[Entity.RAW_RECEIPT].extend(by_block.pop(block_number))
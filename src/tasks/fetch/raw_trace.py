@@ -1,16 +1,20 @@
-from src.clients.rpc_client import RpcClient
+from src.clients.rpc_client import RpcClient, RpcError
 from src.utils.enumeration import Entity
 
 
 async def raw_trace_init(
     results: dict[str, list], rpc_client: RpcClient, block_numbers: list[int], **kwargs
 ):
-    responses = await rpc_client.get_trace_by_block_number(block_numbers=block_numbers)
+    # blocks are handled as their response arrives, the client already resent failed ones,
+    # and are added in block order whatever order the responses came in
+    failed = []
+    by_block = {}
+    async for block_number, response in rpc_client.iter_trace_by_block_number(block_numbers):
+        if "error" in response or response.get("result") is None:
+            failed.append(block_number)
+            continue
 
-    while "error" in responses[0] or responses[0]["result"] is None:
-        responses = await rpc_client.get_trace_by_block_number(block_numbers=block_numbers)
-
-    for block_number, response in zip(block_numbers, responses):
+        by_block[block_number] = block_results = []
         for data in response["result"]:
             transaction_hash = data.get("transactionHash")
             if transaction_hash:
@@ -19,4 +23,10 @@ async def raw_trace_init(
                     "transaction_hash": transaction_hash,
                     "data": data,
                 }
-                results[Entity.RAW_TRACE].append(raw_trace)
+                block_results.append(raw_trace)
+
+    if failed:
+        raise RpcError(f"trace_block failed for blocks {sorted(failed)}")
+
+    for block_number in block_numbers:
+        results[Entity.RAW_TRACE].extend(by_block.pop(block_number))
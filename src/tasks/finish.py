@@ -1,5 +1,26 @@
 from rich.progress import Progress, TaskID
 
+from src.services.checkpoint_service import CheckpointService
+from src.services.lease_service import NatsLeaseService, SqliteLeaseService
+
+
+async def finish(
+    progress: Progress,
+    task_id: TaskID,
+    batch_size: int,
+    block_numbers: range,
+    entities: tuple[str, ...],
+    exporters: tuple[str, ...],
+    checkpoint_service: CheckpointService = None,
+    lease_service: SqliteLeaseService | NatsLeaseService = None,
+    **kwargs,
+):
+    if checkpoint_service is not None:
+        checkpoint_service.mark_done(
+            block_numbers[0], block_numbers[-1], entities, exporters
+        )
+
+    if lease_service is not None:
+        await lease_service.complete(block_numbers[0], block_numbers[-1])
 
-def finish(progress: Progress, task_id: TaskID, batch_size: int, **kwargs):
     progress.advance(task_id=task_id, advance=batch_size)
@@ -2,10 +2,19 @@ import asyncio
 import contextvars
 import functools
 import inspect
-from asyncio import TaskGroup
-from concurrent.futures import ThreadPoolExecutor
+import math
+import multiprocessing
+import pickle
+from asyncio import Task, TaskGroup
+from collections import defaultdict, deque
+from contextlib import nullcontext
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import orjson
 
 from src.schemas.node import Node
+from src.tasks.profiler import Profiler
+from src.utils.enumeration import Resource
 
 
 async def to_thread(func, /, *args, executor=None, **kwargs):
@@ -16,50 +25,228 @@ async def to_thread(func, /, *args, executor=None, **kwargs):
     return await loop.run_in_executor(executor, func_call)
 
 
+async def to_process(
+    func,
+    /,
+    results: dict[str, list],
+    reads: tuple[str, ...],
+    writes: tuple[str, ...],
+    executor: ProcessPoolExecutor,
+    encoded: dict[str, bytes | asyncio.Future] = None,
+    thread_pool: ThreadPoolExecutor = None,
+):
+    # an entity crosses to the workers as orjson bytes built once per range and shared
+    # by every process node reading it (log feeds transfer and both event extractors).
+    # Outputs come back as orjson bytes too and are kept for the next process reader,
+    # unless they hold integers beyond 64 bits (uint256 amounts), those come back pickled.
+    # Encoding and decoding run on the thread pool, the event loop only hands bytes around
+    if encoded is None:
+        encoded = {}
+
+    loop = asyncio.get_running_loop()
+    inputs = {}
+    for entity in reads:
+        # the writers of an input are done, nothing appends to it while it is encoded.
+        # The future goes in first so process nodes started together share one encoding
+        if entity not in encoded:
+            encoded[entity] = loop.run_in_executor(thread_pool, orjson.dumps, results[entity])
+        inputs[entity] = encoded[entity]
+    for entity, payload in inputs.items():
+        if isinstance(payload, asyncio.Future):
+            inputs[entity] = await payload
+
+    outputs = await loop.run_in_executor(executor, _extract, func, inputs, writes)
+    decoded = await loop.run_in_executor(thread_pool, _decode, outputs)
+
+    for entity, (is_json, payload) in outputs.items():
+        # the bytes stand for the whole entity only when this node is its first writer
+        if is_json and not results[entity]:
+            encoded[entity] = payload
+        else:
+            encoded.pop(entity, None)
+        results[entity].extend(decoded[entity])
+
+
+def _extract(func, inputs: dict[str, bytes], writes: tuple[str, ...]):
+    results = defaultdict(list)
+    for entity, payload in inputs.items():
+        results[entity] = orjson.loads(payload)
+
+    func(results=results)
+    outputs = {}
+    for entity in writes:
+        try:
+            outputs[entity] = (True, orjson.dumps(results[entity]))
+        except orjson.JSONEncodeError:
+            outputs[entity] = (False, pickle.dumps(results[entity], protocol=pickle.HIGHEST_PROTOCOL))
+    return outputs
+
+
+def _decode(outputs: dict[str, tuple[bool, bytes]]):
+    return {
+        entity: orjson.loads(payload) if is_json else pickle.loads(payload)
+        for entity, (is_json, payload) in outputs.items()
+    }
+
+
+def create_process_pool(num_processes: int):
+    # context manager yielding None when extraction stays on the thread pool
+    if num_processes <= 0:
+        return nullcontext()
+
+    return ProcessPoolExecutor(
+        max_workers=num_processes, mp_context=multiprocessing.get_context("spawn")
+    )
+
+
 class Graph:
-    def __init__(self, running_queue_size: int):
-        self.nodes: dict[str, Node] = {}
+    def __init__(
+        self,
+        running_queue_size: int,
+        resource_limits: dict[str, int] = None,
+        profiler: Profiler = None,
+    ):
+        self.nodes: dict[tuple[str, int], Node] = {}
+        self.dependents: dict[tuple[str, int], list[tuple[str, int]]] = defaultdict(list)
+        self.ready: dict[str, deque[tuple[str, int]]] = defaultdict(deque)
 
-        # self.running_sync_count = 0
-        # self.running_async_count = 0
+        # running_queue_size is the limit of every resource class without its own limit
         self.running_queue_size = running_queue_size
+        self.resource_limits = {Resource.CONTROL: math.inf, **(resource_limits or {})}
+        self.running: dict[str, int] = defaultdict(int)
         self.pending_count = 0
         self.running_count = 0
 
-    def add_nodes(self, new_nodes):
+        self.task_group: TaskGroup | None = None
+        self.thread_pool: ThreadPoolExecutor | None = None
+        self.process_pool: ProcessPoolExecutor | None = None
+        self._changed = asyncio.Event()
+        self.profiler = profiler
+        self.error: Exception | None = None
+
+    def add_nodes(self, new_nodes: dict[tuple[str, int], Node]):
         self.nodes.update(new_nodes)
         self.pending_count = self.pending_count + len(new_nodes)
 
-    def run(self, task_group: TaskGroup, thread_pool: ThreadPoolExecutor):
-        for name, node in list(self.nodes.items()):
-            if node.status == "running" and node.task.done():
-                node.status = "done"
-                self.running_count = self.running_count - 1
-                if "finish" in name:
-                    for i in node.dep_nodes:
-                        del self.nodes[i]
-
-                    del self.nodes[name]
-
-        for name, node in self.nodes.items():
-            if self.running_count >= self.running_queue_size:
-                break
-
-            if node.status != "pending":
-                continue
-            
-            if not all(
-                self.nodes[node_name].status == "done" for node_name in node.dep_nodes
-            ):
-                continue
-
-            if inspect.iscoroutinefunction(node.func):
-                coro = node.func(**node.kwargs)
-            else:
-                coro = to_thread(node.func, executor=thread_pool, **node.kwargs)
-
-            node.task = task_group.create_task(coro, name=name)
-
-            node.status = "running"
-            self.pending_count = self.pending_count - 1
-            self.running_count = self.running_count + 1
+        resources = set()
+        for key, node in new_nodes.items():
+            if self.profiler is not None:
+                self.profiler.queued(key, node)
+
+            # finished nodes are dropped from self.nodes, so a missing dependency is a satisfied one
+            node.unmet = 0
+            for dep_key in node.dep_nodes:
+                if dep_key in self.nodes:
+                    self.dependents[dep_key].append(key)
+                    node.unmet = node.unmet + 1
+
+            if node.unmet == 0:
+                self._mark_ready(key, node.resource)
+                resources.add(node.resource)
+
+        for resource in resources:
+            self._dispatch(resource)
+
+    def run(
+        self,
+        task_group: TaskGroup,
+        thread_pool: ThreadPoolExecutor,
+        process_pool: ProcessPoolExecutor = None,
+    ):
+        # Nodes are started from completion callbacks, so this only needs to be called once
+        self.task_group = task_group
+        self.thread_pool = thread_pool
+        self.process_pool = process_pool
+        for resource in list(self.ready):
+            self._dispatch(resource)
+
+    async def wait(self):
+        """Wait until at least one node finished since the previous call, raise if a node was cancelled."""
+        await self._changed.wait()
+        self._changed.clear()
+        if self.error is not None:
+            raise self.error
+
+    def _limit(self, resource: str):
+        return self.resource_limits.get(resource, self.running_queue_size)
+
+    def _mark_ready(self, key: tuple[str, int], resource: str):
+        self.ready[resource].append(key)
+        if self.profiler is not None:
+            self.profiler.ready(key)
+
+    def _dispatch(self, resource: str):
+        if self.task_group is None:
+            return
+
+        ready = self.ready[resource]
+        limit = self._limit(resource)
+        while ready and self.running[resource] < limit:
+            self._start(ready.popleft())
+
+    def _start(self, key: tuple[str, int]):
+        node = self.nodes[key]
+        if inspect.iscoroutinefunction(node.func):
+            coro = node.func(**node.kwargs)
+        elif node.in_process and self.process_pool is not None:
+            coro = to_process(
+                node.func,
+                results=node.kwargs["results"],
+                reads=node.reads,
+                writes=node.writes,
+                executor=self.process_pool,
+                encoded=node.kwargs.get("encoded"),
+                thread_pool=self.thread_pool,
+            )
+        else:
+            coro = to_thread(node.func, executor=self.thread_pool, **node.kwargs)
+
+        node.task = self.task_group.create_task(coro, name=node.name)
+        node.task.add_done_callback(functools.partial(self._on_done, key))
+
+        node.status = "running"
+        if self.profiler is not None:
+            self.profiler.started(key)
+        self.pending_count = self.pending_count - 1
+        self.running_count = self.running_count + 1
+        self.running[node.resource] = self.running[node.resource] + 1
+
+    def _on_done(self, key: tuple[str, int], task: Task):
+        node = self.nodes.pop(key)
+        dependent_keys = self.dependents.pop(key, [])
+        self.running_count = self.running_count - 1
+        self.running[node.resource] = self.running[node.resource] - 1
+
+        # a failed node tears down the whole task group, its dependents never run.
+        # A node cancelled from inside does not, wait() raises instead of leaving the run hanging
+        if task.cancelled() or task.exception() is not None:
+            if task.cancelled() and self.error is None:
+                self.error = RuntimeError(
+                    f"Node {node.name} of blocks {node.dag_id} was cancelled, its dependents cannot run"
+                )
+                self._changed.set()
+            return
+
+        node.status = "done"
+        if self.profiler is not None:
+            self.profiler.finished(key, node)
+        # bytes of an entity a node outside the pool changed are stale, to_process keeps its own up to date
+        encoded = node.kwargs.get("encoded")
+        if encoded is not None and not (node.in_process and self.process_pool is not None):
+            for entity in node.writes:
+                encoded.pop(entity, None)
+        if node.release is not None:
+            node.release()
+
+        resources = {node.resource}
+        for dependent_key in dependent_keys:
+            dependent = self.nodes[dependent_key]
+            dependent.unmet = dependent.unmet - 1
+            if dependent.unmet == 0:
+                self._mark_ready(dependent_key, dependent.resource)
+                resources.add(dependent.resource)
+
+        for resource in resources:
+            self._dispatch(resource)
+
+        self._changed.set()
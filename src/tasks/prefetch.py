@@ -0,0 +1,127 @@
+import asyncio
+from asyncio import Task, TaskGroup
+from collections import defaultdict, deque
+from collections.abc import Iterable
+
+import orjson
+
+from src.clients.rpc_client import RpcClient
+from src.logger import logger
+from src.schemas.dag import DagTemplate
+
+
+class Prefetcher:
+    """Run the fetch nodes of upcoming block ranges ahead of the graph.
+
+    At most `depth` ranges are fetched or waiting to be picked up, within
+    `memory_budget` bytes. A range is measured by the json size of the results
+    it holds, so blocks served from the rpc cache or shared with another
+    request in flight count like downloaded ones. Before a fetch starts it
+    reserves its expected size from the bytes per block of the ranges already
+    measured, the first range runs alone until there is a measure. Ranges are
+    handed out in the order they were given, a lazy iterable is only advanced
+    when a fetch starts.
+    """
+
+    def __init__(
+        self,
+        template: DagTemplate,
+        rpc_client: RpcClient,
+        ranges: Iterable[tuple[int, int]],
+        depth: int,
+        memory_budget: int,
+    ):
+        self.template = template
+        self.rpc_client = rpc_client
+        self.ranges = ranges
+        self.depth = depth
+        self.memory_budget = memory_budget
+
+        # measured size of the fetched ranges plus the reservations of the running ones
+        self.buffered_bytes = 0
+        self.bytes_per_block: float | None = None
+        self._fetches: deque[Task] = deque()
+        self._exhausted = False
+        self._condition = asyncio.Condition()
+
+    def _reservation(self, num_blocks: int):
+        if self.bytes_per_block is None:
+            return self.memory_budget
+        return int(self.bytes_per_block * num_blocks)
+
+    def _has_room(self, reservation: int):
+        # one range always fits, a budget below a single range still makes progress
+        if not self._fetches:
+            return True
+        return len(self._fetches) < self.depth and self.buffered_bytes + reservation <= self.memory_budget
+
+    async def run(self, task_group: TaskGroup):
+        for start_block, end_block in self.ranges:
+            async with self._condition:
+                await self._condition.wait_for(
+                    lambda: self._has_room(self._reservation(end_block - start_block + 1))
+                )
+                reservation = self._reservation(end_block - start_block + 1)
+                self.buffered_bytes = self.buffered_bytes + reservation
+                task = task_group.create_task(
+                    self._fetch(start_block, end_block, reservation),
+                    name=f"prefetch_{start_block}_{end_block}",
+                )
+                self._fetches.append(task)
+                self._condition.notify_all()
+
+        async with self._condition:
+            self._exhausted = True
+            self._condition.notify_all()
+
+    async def get(self):
+        """Return (start_block, end_block, results) of the next range, None once all ranges were handed out."""
+        async with self._condition:
+            await self._condition.wait_for(lambda: self._fetches or self._exhausted)
+            if not self._fetches:
+                return None
+
+            task = self._fetches[0]
+
+        start_block, end_block, results, size = await task
+
+        async with self._condition:
+            self._fetches.popleft()
+            self.buffered_bytes = self.buffered_bytes - size
+            self._condition.notify_all()
+
+        return start_block, end_block, results
+
+    async def _fetch(self, start_block: int, end_block: int, reservation: int):
+        params = {
+            "results": defaultdict(list),
+            "rpc_client": self.rpc_client,
+            "block_numbers": range(start_block, end_block + 1),
+            "batch_size": end_block - start_block + 1,
+            "include_transaction": self.template.include_transaction,
+            "entities": self.template.entities,
+        }
+
+        await asyncio.gather(
+            *(self.template.funcs[node_id](**params) for node_id in self.template.fetch_ids)
+        )
+        size = await asyncio.to_thread(results_size, params["results"])
+
+        async with self._condition:
+            self.buffered_bytes = self.buffered_bytes - reservation + size
+            per_block = size / (end_block - start_block + 1)
+            if self.bytes_per_block is None:
+                self.bytes_per_block = per_block
+            else:
+                self.bytes_per_block = 0.7 * self.bytes_per_block + 0.3 * per_block
+            self._condition.notify_all()
+
+        logger.debug(
+            f"Prefetched blocks {start_block}-{end_block}: {size} bytes, {self.buffered_bytes} buffered"
+        )
+        return start_block, end_block, params["results"], size
+
+
+def results_size(results: dict[str, list]):
+    """Json size of the fetched entities, a stand-in for the memory they hold."""
+    return sum(len(orjson.dumps(items)) for items in results.values())
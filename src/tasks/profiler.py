@@ -0,0 +1,185 @@
+import time
+from collections import Counter, defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from src.logger import logger
+from src.schemas.node import Node
+from src.utils.common import dump_json
+
+
+@dataclass
+class NodeTiming:
+    dag_id: str
+    name: str
+    resource: str
+    deps: list[tuple[str, int]]
+    queued: float
+    ready: float = None
+    started: float = None
+    finished: float = None
+    output_size: int = 0  # items in the entities the node writes
+
+
+class Profiler:
+    """Record queued/ready/started/finished times of every graph node.
+
+    `export` writes a Chrome trace (open in chrome://tracing or ui.perfetto.dev),
+    one process per resource class, and a summary of each batch's critical path.
+    """
+
+    def __init__(self):
+        self.origin = time.perf_counter()
+        self.timings: dict[tuple[str, int], NodeTiming] = {}
+
+    def _now(self):
+        return time.perf_counter() - self.origin
+
+    def queued(self, key: tuple[str, int], node: Node):
+        self.timings[key] = NodeTiming(
+            dag_id=node.dag_id,
+            name=node.name,
+            resource=node.resource,
+            deps=list(node.dep_nodes),
+            queued=self._now(),
+        )
+
+    def ready(self, key: tuple[str, int]):
+        self.timings[key].ready = self._now()
+
+    def started(self, key: tuple[str, int]):
+        self.timings[key].started = self._now()
+
+    def finished(self, key: tuple[str, int], node: Node):
+        timing = self.timings[key]
+        timing.finished = self._now()
+
+        results = node.kwargs["results"]
+        timing.output_size = sum(len(results.get(entity, ())) for entity in node.writes)
+
+    def critical_paths(self):
+        """Per batch, the chain of nodes ending at finish where each node waited on its slowest dependency."""
+        paths = {}
+        for key, timing in self.timings.items():
+            if timing.name != "finish" or timing.finished is None:
+                continue
+
+            path = []
+            while key is not None:
+                timing = self.timings[key]
+                path.append(key)
+                finished_deps = [
+                    dep
+                    for dep in timing.deps
+                    if dep in self.timings and self.timings[dep].finished is not None
+                ]
+                key = max(finished_deps, key=lambda dep: self.timings[dep].finished, default=None)
+
+            paths[timing.dag_id] = path[::-1]
+
+        return paths
+
+    def summary(self):
+        paths = self.critical_paths()
+        on_path = Counter()
+        path_run_time = defaultdict(float)
+        path_wait_time = defaultdict(float)
+        for path in paths.values():
+            for key in path:
+                timing = self.timings[key]
+                on_path[timing.name] = on_path[timing.name] + 1
+                path_run_time[timing.name] += timing.finished - timing.started
+                path_wait_time[timing.name] += timing.started - timing.ready
+
+        batches = {}
+        for dag_id, path in paths.items():
+            first, last = self.timings[path[0]], self.timings[path[-1]]
+            batches[dag_id] = {
+                "duration": last.finished - first.queued,
+                "path": [
+                    {
+                        "name": self.timings[key].name,
+                        "resource": self.timings[key].resource,
+                        "wait": self.timings[key].started - self.timings[key].ready,
+                        "run": self.timings[key].finished - self.timings[key].started,
+                        "output_size": self.timings[key].output_size,
+                    }
+                    for key in path
+                ],
+            }
+
+        # nodes that most often bound a batch, with the time they spent running and waiting for a slot
+        bottlenecks = [
+            {
+                "name": name,
+                "batches": count,
+                "run": path_run_time[name],
+                "wait": path_wait_time[name],
+            }
+            for name, count in on_path.most_common()
+        ]
+        bottlenecks.sort(key=lambda item: item["run"] + item["wait"], reverse=True)
+        return {"bottlenecks": bottlenecks, "batches": batches}
+
+    def trace_events(self):
+        events = []
+        pids = {}
+        lanes: dict[str, list[float]] = defaultdict(list)  # resource -> finish time of each lane
+
+        done = [timing for timing in self.timings.values() if timing.finished is not None]
+        for timing in sorted(done, key=lambda timing: timing.started):
+            if timing.resource not in pids:
+                pids[timing.resource] = len(pids) + 1
+                events.append(
+                    {
+                        "name": "process_name",
+                        "ph": "M",
+                        "pid": pids[timing.resource],
+                        "args": {"name": timing.resource},
+                    }
+                )
+
+            # first lane that is free again, so slices of one thread never overlap
+            resource_lanes = lanes[timing.resource]
+            lane = next(
+                (i for i, end in enumerate(resource_lanes) if end <= timing.started),
+                len(resource_lanes),
+            )
+            if lane == len(resource_lanes):
+                resource_lanes.append(timing.finished)
+            else:
+                resource_lanes[lane] = timing.finished
+
+            events.append(
+                {
+                    "name": timing.name,
+                    "cat": timing.resource,
+                    "ph": "X",
+                    "ts": timing.started * 1e6,
+                    "dur": (timing.finished - timing.started) * 1e6,
+                    "pid": pids[timing.resource],
+                    "tid": lane,
+                    "args": {
+                        "dag_id": timing.dag_id,
+                        "queued_to_ready": timing.ready - timing.queued,
+                        "ready_to_started": timing.started - timing.ready,
+                        "output_size": timing.output_size,
+                    },
+                }
+            )
+
+        return events
+
+    def export(self, path: str | Path):
+        path = Path(path)
+        summary_path = path.with_name(f"{path.stem}_summary.json")
+        dump_json(path, {"traceEvents": self.trace_events(), "displayTimeUnit": "ms"})
+
+        summary = self.summary()
+        dump_json(summary_path, summary)
+
+        for item in summary["bottlenecks"][:5]:
+            logger.info(
+                f"Critical path: {item['name']} on {item['batches']} batches, {item['run']:.2f}s running, {item['wait']:.2f}s waiting"
+            )
+        logger.info(f"Trace written to {path}, critical path summary to {summary_path}")
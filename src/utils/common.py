@@ -1,5 +1,9 @@
+import argparse
+
 import orjson
 
+from src.utils.enumeration import Resource
+
 
 def dump_json(path, data):
     with open(path, "wb") as f:
@@ -14,6 +18,25 @@ def serialize_dict_value(d: dict):
     return text
 
 
+def parse_mapping(text: str, value_type=int):
+    """Parse 'key=value,key=value' command line options into a dict."""
+    mapping = {}
+    for item in filter(None, text.split(",")):
+        key, value = item.split("=")
+        mapping[key.strip()] = value_type(value)
+
+    return mapping
+
+
+def parse_resource_limits(text: str):
+    limits = parse_mapping(text)
+    for resource in limits:
+        if resource not in Resource.values():
+            raise argparse.ArgumentTypeError(f"Unknown resource class: {resource}")
+
+    return limits
+
+
 def hex_to_dec(hex, signed=False):
     if not signed:
         return int(hex, 16)
@@ -47,3 +47,20 @@ class Exporter:
             for k, v in cls.__dict__.items()
             if not k.startswith("__") and not isinstance(v, classmethod)
         ]
+
+
+class Resource:
+    RPC = "rpc"
+    CPU = "cpu"
+    SQLITE = "sqlite"
+    MEMGRAPH = "memgraph"
+    NATS = "nats"
+    CONTROL = "control"  # bookkeeping nodes like finish, unlimited by default
+
+    @classmethod
+    def values(cls):
+        return [
+            v
+            for k, v in cls.__dict__.items()
+            if not k.startswith("__") and not isinstance(v, classmethod)
+        ]
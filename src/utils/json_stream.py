@@ -0,0 +1,85 @@
+import re
+
+import orjson
+
+# structural bytes outside strings, strings are skipped with bytes.find
+STRUCTURAL = re.compile(rb'["{}\[\]]')
+QUOTE, BACKSLASH = ord('"'), ord("\\")
+OPENERS, CLOSERS = b"{[", b"}]"
+
+
+class JsonArrayParser:
+    """Incrementally split a top level json array into its elements.
+
+    `feed` takes raw bytes as they come off the wire and returns the elements
+    completed so far, each decoded on its own, so only the element being read is
+    buffered instead of the whole array. With keep_raw the elements come as
+    (element, its bytes as received) pairs.
+    """
+
+    def __init__(self, keep_raw: bool = False):
+        self.keep_raw = keep_raw
+        self.buffer = bytearray()
+        self.pos = 0  # next byte to scan
+        self.depth = 0
+        self.in_string = False
+        self.element_start = None
+
+    def feed(self, chunk: bytes):
+        self.buffer += chunk
+        buffer = self.buffer
+        elements = []
+
+        i = self.pos
+        n = len(buffer)
+        while i < n:
+            if self.in_string:
+                j = buffer.find(b'"', i)
+                if j == -1:
+                    i = n
+                    break
+
+                # a quote preceded by an odd number of backslashes is escaped
+                k = j - 1
+                while buffer[k] == BACKSLASH:
+                    k = k - 1
+                if (j - 1 - k) % 2 == 0:
+                    self.in_string = False
+                i = j + 1
+                continue
+
+            match = STRUCTURAL.search(buffer, i)
+            if match is None:
+                i = n
+                break
+
+            byte = buffer[match.start()]
+            i = match.end()
+            if byte == QUOTE:
+                self.in_string = True
+            elif byte in OPENERS:
+                if self.depth == 0 and byte != OPENERS[1]:
+                    raise ValueError(f"Expected a json array, got {bytes(buffer[:200])!r}")
+
+                self.depth = self.depth + 1
+                if self.depth == 2:
+                    self.element_start = match.start()
+            elif byte in CLOSERS:
+                self.depth = self.depth - 1
+                if self.depth == 1:
+                    raw = buffer[self.element_start : i]
+                    elements.append((orjson.loads(raw), bytes(raw)) if self.keep_raw else orjson.loads(raw))
+                    self.element_start = None
+
+        # drop everything before the element being read
+        keep = self.element_start if self.element_start is not None else i
+        del buffer[:keep]
+        self.pos = i - keep
+        if self.element_start is not None:
+            self.element_start = 0
+
+        return elements
+
+    def close(self):
+        if self.depth != 0 or self.in_string:
+            raise ValueError("Truncated json array")
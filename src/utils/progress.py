@@ -0,0 +1,15 @@
+from multiprocessing.queues import Queue
+
+
+class QueueProgress:
+    """Stand-in for rich Progress in worker processes, advances are forwarded to the parent."""
+
+    def __init__(self, queue: Queue, shard: int):
+        self.queue = queue
+        self.shard = shard
+
+    def add_task(self, description: str, total: int):
+        return self.shard
+
+    def advance(self, task_id: int, advance: float = 1):
+        self.queue.put((task_id, advance))
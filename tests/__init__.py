@@ -0,0 +1,19 @@
+import os
+
+# src.configs.environment validates these on import, the tests never reach the services behind them
+for name, value in {
+    "NETWORK": "ethereum",
+    "DATABASE_NAME": "test",
+    "CLICKHOUSE_SERVER": "localhost",
+    "CLICKHOUSE_USERNAME": "",
+    "CLICKHOUSE_PASSWORD": "",
+    "MEMGRAPH_SERVER": "bolt://localhost:7687",
+    "MEMGRAPH_USERNAME": "",
+    "MEMGRAPH_PASSWORD": "",
+    "NATS_SERVER": "nats://localhost:4222",
+    "PROVIDER_URIS": '["http://127.0.0.1:8545"]',
+    "WEBSOCKET_URL": "ws://127.0.0.1:8545",
+    "ENVIRONMENT_NAME": "_test",
+    "DEBUG_MODE": "false",
+}.items():
+    os.environ.setdefault(name, value)
@@ -0,0 +1,33 @@
+from scripts.benchmark.rpc_server import MockRpcServer
+from scripts.benchmark.synthetic_chain import SyntheticChain
+from src.clients.rpc_client import RpcClient
+from src.schemas.node import Node
+from src.utils.enumeration import Resource
+
+
+async def start_mock_server(head: int = 10_000, **kwargs):
+    """A MockRpcServer with a fixed head on a free local port, and its url."""
+    chain = SyntheticChain(transactions_per_block=kwargs.pop("transactions_per_block", 5))
+    server = await MockRpcServer(chain, head=head, block_time=0, **kwargs).start(port=0)
+    port = server.server.sockets[0].getsockname()[1]
+    return server, f"http://127.0.0.1:{port}"
+
+
+def create_client(url: str, **kwargs):
+    # no learned rate limit or backoff to wait for against a local server
+    return RpcClient(uris=[url], rate_limit=1000, backoff=0.01, **kwargs)
+
+
+def make_node(node_id: int, func, deps: tuple[int, ...] = ()):
+    return Node(
+        dag_id="0_9",
+        node_id=node_id,
+        name=func.__name__,
+        func=func,
+        resource=Resource.CPU,
+        kwargs={},
+        task=None,
+        dep_nodes=[("0_9", dep) for dep in deps],
+        dep_data=[],
+        status="pending",
+    )
@@ -0,0 +1,113 @@
+import functools
+import unittest
+
+import orjson
+
+from src.clients.batch_sizer import BatchSizer, PayloadEstimator
+from src.clis.historical import range_size, split_ranges
+from src.tasks.dag import compile_dag
+from tests.helpers import create_client, start_mock_server
+
+
+class BatchSizerTest(unittest.TestCase):
+    def test_full_fast_batches_grow(self):
+        sizer = BatchSizer(default_size=30)
+        sizer.record("eth_getBlockByNumber", 30, latency=0.1)
+        self.assertEqual(sizer.size("eth_getBlockByNumber"), 37)
+
+    def test_partial_batches_keep_the_size(self):
+        sizer = BatchSizer(default_size=30)
+        sizer.record("eth_getBlockByNumber", 10, latency=0.1)
+        self.assertEqual(sizer.size("eth_getBlockByNumber"), 30)
+
+    def test_errors_halve(self):
+        sizer = BatchSizer(default_size=30)
+        sizer.record("eth_getBlockByNumber", 30, latency=0, error=True)
+        self.assertEqual(sizer.size("eth_getBlockByNumber"), 15)
+
+
+def receipts_request(block_number: int):
+    return {"method": "eth_getBlockReceipts", "params": [hex(block_number)]}
+
+
+class PayloadEstimatorTest(unittest.TestCase):
+    def test_batches_are_cut_by_expected_bytes(self):
+        estimator = PayloadEstimator(max_bytes=1000, region_size=100)
+        estimator.record([receipts_request(n) for n in range(10)], 10 * 300)
+        estimator.record([receipts_request(n) for n in range(500, 510)], 10 * 50)
+
+        dense = estimator.split([receipts_request(n) for n in range(10, 20)], max_count=100)
+        self.assertEqual([len(chunk) for chunk in dense], [3, 3, 3, 1])
+        sparse = estimator.split([receipts_request(n) for n in range(510, 530)], max_count=100)
+        self.assertEqual([len(chunk) for chunk in sparse], [20])
+        # the count limit still applies
+        self.assertEqual([len(chunk) for chunk in estimator.split(sparse[0], max_count=8)], [8, 8, 4])
+
+    def test_unseen_regions_borrow_the_nearest(self):
+        estimator = PayloadEstimator(region_size=100)
+        estimator.record([receipts_request(50)], 300)
+        estimator.record([receipts_request(950)], 50)
+        self.assertEqual(estimator.estimate(receipts_request(250)), 300)
+        self.assertEqual(estimator.estimate(receipts_request(800)), 50)
+        self.assertEqual(estimator.estimate({"method": "trace_block", "params": ["0x1"]}), 0)
+
+    def test_oversized_batches_are_split_next_time(self):
+        estimator = PayloadEstimator(max_bytes=1000)
+        batch = [receipts_request(n) for n in range(8)]
+        estimator.record(batch, 80)
+        estimator.oversized(batch)
+        # twice the budget, so at least two posts
+        self.assertEqual(len(estimator.split(batch, max_count=100)), 2)
+
+
+class OversizedBatchTest(unittest.IsolatedAsyncioTestCase):
+    async def test_too_large_batches_are_bisected(self):
+        server, url = await start_mock_server()
+        handle_post = server.handle_post
+        posted = []
+
+        async def limited(body: bytes):
+            count = len(orjson.loads(body))
+            posted.append(count)
+            if count > 4:
+                return 413, b"request entity too large"
+            return await handle_post(body)
+
+        server.handle_post = limited
+        client = create_client(url, batch_size=16)
+        responses = await client.get_block_by_number(list(range(100, 116)), False)
+        await client.close()
+        await server.close()
+
+        self.assertEqual([int(response["result"]["number"], 16) for response in responses], list(range(100, 116)))
+        # 16 is halved until the halves fit, nothing is sent twice once accepted
+        self.assertEqual(sorted(posted, reverse=True), [16, 8, 8, 4, 4, 4, 4])
+
+
+class SplitRangesTest(unittest.IsolatedAsyncioTestCase):
+    def test_fixed_size(self):
+        self.assertEqual(list(split_ranges([(0, 9), (20, 24)], 4)), [(0, 3), (4, 7), (8, 9), (20, 23), (24, 24)])
+
+    async def test_ranges_grow_past_request_batch_size(self):
+        server, url = await start_mock_server()
+        client = create_client(url, batch_size=30)
+        try:
+            template = compile_dag(["raw_block", "block"], [])
+            ranges = split_ranges([(0, 3000)], functools.partial(range_size, template, client, 30))
+            lengths = []
+            for start_block, end_block in ranges:
+                responses = await client.get_block_by_number(range(start_block, end_block + 1), False)
+                self.assertTrue(all(response.get("result") for response in responses))
+                lengths.append(end_block - start_block + 1)
+        finally:
+            await client.close()
+            await server.close()
+
+        self.assertEqual(lengths[0], 30)
+        self.assertGreater(max(lengths), 30)
+        self.assertEqual(lengths[:5], sorted(lengths[:5]))
+        self.assertEqual(sum(lengths), 3001)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,46 @@
+import tempfile
+import time
+import unittest
+from pathlib import Path
+
+from tests.helpers import create_client, start_mock_server
+
+
+class CassetteTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "run.jsonl.gz"
+
+        server, url = await start_mock_server(latency=0.1)
+        client = create_client(url, record_cassette=self.path)
+        self.recorded = await client.get_receipt_by_block_number(list(range(100, 105)))
+        await client.close()
+        await server.close()
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    async def test_replay_answers_without_a_provider(self):
+        client = create_client("http://127.0.0.1:1", replay_cassette=self.path, replay_timing="fast")
+        started = time.monotonic()
+        # another batch split and order, the answers are matched per request
+        replayed = await client.get_receipt_by_block_number([104, 102, 100, 101, 103])
+        self.assertLess(time.monotonic() - started, 0.1)
+
+        by_block = {int(response["result"][0]["blockNumber"], 16): response["result"] for response in replayed}
+        self.assertEqual(by_block, {100 + i: response["result"] for i, response in enumerate(self.recorded)})
+
+        missing = await client.get_receipt_by_block_number([200])
+        self.assertEqual(missing[0]["error"]["message"], "missing from cassette")
+        await client.close()
+
+    async def test_original_timing_keeps_the_recorded_latency(self):
+        client = create_client("http://127.0.0.1:1", replay_cassette=self.path, replay_timing="original")
+        started = time.monotonic()
+        await client.get_receipt_by_block_number([100])
+        self.assertGreaterEqual(time.monotonic() - started, 0.1)
+        await client.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,57 @@
+import tempfile
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from src.services.checkpoint_service import CheckpointService
+from src.tasks.finish import finish
+
+
+class CheckpointServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = Path(self.directory.name) / "checkpoint.sqlite"
+
+    async def asyncTearDown(self):
+        self.directory.cleanup()
+
+    async def test_missing_ranges_survive_a_restart(self):
+        service = CheckpointService(self.path)
+        service.mark_done(0, 9, ["block"], ["sqlite"])
+        service.mark_done(20, 29, ["block"], ["sqlite"])
+        service.close()
+
+        # a new run over the same file only has the gaps left
+        service = CheckpointService(self.path)
+        self.assertEqual(service.missing_ranges(0, 39, ["block"], ["sqlite"]), [(10, 19), (30, 39)])
+        self.assertEqual(service.missing_ranges(0, 9, ["block"], ["sqlite"]), [])
+        service.close()
+
+    async def test_a_range_is_done_only_for_every_entity_and_exporter(self):
+        service = CheckpointService(self.path)
+        service.mark_done(0, 9, ["block", "transaction"], ["sqlite"])
+        service.mark_done(10, 19, ["block"], ["sqlite"])
+
+        self.assertEqual(service.missing_ranges(0, 19, ["block"], ["sqlite"]), [])
+        self.assertEqual(service.missing_ranges(0, 19, ["block", "transaction"], ["sqlite"]), [(10, 19)])
+        self.assertEqual(service.missing_ranges(0, 19, ["block"], ["sqlite", "nats"]), [(0, 19)])
+        service.close()
+
+    async def test_finish_records_its_range(self):
+        service = CheckpointService(self.path)
+        progress = SimpleNamespace(advance=lambda task_id, advance: None)
+        await finish(
+            progress,
+            None,
+            batch_size=10,
+            block_numbers=range(50, 60),
+            entities=("block",),
+            exporters=(),
+            checkpoint_service=service,
+        )
+        self.assertEqual(service.missing_ranges(40, 69, ["block"], []), [(40, 49), (60, 69)])
+        service.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
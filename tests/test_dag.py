@@ -0,0 +1,94 @@
+import unittest
+from collections import defaultdict
+
+from src.tasks.dag import compile_dag, create_node
+from src.utils.enumeration import Entity, Exporter
+
+
+class CompileDagTest(unittest.TestCase):
+    def test_order_puts_every_node_after_its_dependencies(self):
+        template = compile_dag(
+            [Entity.BLOCK, Entity.TRANSACTION, Entity.LOG, Entity.TRANSFER, Entity.TRACE], [Exporter.SQLITE]
+        )
+        position = {node_id: i for i, node_id in enumerate(template.order)}
+        self.assertEqual(sorted(position), list(range(len(template.names))))
+        for node_id, deps in enumerate(template.deps):
+            for dep in deps:
+                self.assertLess(position[dep], position[node_id])
+
+        # finish waits for the sinks only, the exporters here
+        finish = template.names.index("finish")
+        self.assertEqual(
+            {template.names[dep] for dep in template.deps[finish]},
+            {name for name in template.names if name.startswith("sqlite_")},
+        )
+
+    def test_dependencies_are_pulled_in(self):
+        template = compile_dag([Entity.RECEIPT, Entity.TRANSFER], [])
+        self.assertIn("raw_receipt_init", template.names)
+        self.assertIn("log_init", template.names)
+        self.assertNotIn("raw_trace_init", template.names)
+
+    def test_logs_only_runs_use_get_logs(self):
+        for entities in ([Entity.LOG], [Entity.TRANSFER], [Entity.LOG, Entity.EVENT]):
+            names = compile_dag(entities, []).names
+            self.assertIn("log_fetch_init", names)
+            self.assertNotIn("raw_receipt_init", names)
+            self.assertNotIn("log_init", names)
+
+        # anything needing whole receipts keeps extracting logs from them
+        names = compile_dag([Entity.RECEIPT, Entity.LOG], []).names
+        self.assertIn("log_init", names)
+        self.assertNotIn("log_fetch_init", names)
+
+    def test_unknown_names_raise(self):
+        with self.assertRaises(ValueError):
+            compile_dag(["blocks"], [])
+        with self.assertRaises(ValueError):
+            compile_dag([Entity.BLOCK], ["kafka"])
+
+
+class CreateNodeTest(unittest.TestCase):
+    def test_nodes_of_a_range_share_their_params(self):
+        template = compile_dag([Entity.BLOCK, Entity.TRANSACTION], [])
+        nodes = create_node(template, None, None, None, None, 100, 109)
+
+        self.assertEqual(len(nodes), len(template.names))
+        self.assertEqual({key[0] for key in nodes}, {"100_109"})
+        params = {id(node.kwargs) for node in nodes.values()}
+        self.assertEqual(len(params), 1)
+        node = next(iter(nodes.values()))
+        self.assertEqual(list(node.kwargs["block_numbers"]), list(range(100, 110)))
+
+    def test_prefetched_nodes_are_left_out(self):
+        template = compile_dag([Entity.BLOCK], [])
+        nodes = create_node(template, None, None, None, None, 0, 9, prefetched=template.fetch_ids)
+        names = {node.name for node in nodes.values()}
+        self.assertNotIn("raw_block_init", names)
+        self.assertIn("block_init", names)
+        # the missing dependency counts as done in the graph
+        block = next(node for node in nodes.values() if node.name == "block_init")
+        self.assertEqual(block.dep_nodes, [("0_9", template.names.index("raw_block_init"))])
+
+
+class ReleaseBuffersTest(unittest.TestCase):
+    def test_an_entity_is_dropped_after_its_last_node(self):
+        template = compile_dag([Entity.BLOCK, Entity.TRANSACTION], [])
+        results = defaultdict(list)
+        nodes = create_node(template, None, None, None, None, 0, 9, results=results)
+        by_name = {node.name: node for node in nodes.values()}
+        results[Entity.RAW_BLOCK].append({"block_number": 0})
+        results[Entity.BLOCK].append({"number": 0})
+
+        # raw_block is read by block_init and transaction_init
+        by_name["raw_block_init"].release()
+        by_name["block_init"].release()
+        self.assertIn(Entity.RAW_BLOCK, results)
+        by_name["transaction_init"].release()
+        self.assertNotIn(Entity.RAW_BLOCK, results)
+        # block has no reader left either, its writer was its only node
+        self.assertNotIn(Entity.BLOCK, results)
+
+
+if __name__ == "__main__":
+    unittest.main()
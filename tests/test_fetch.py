@@ -0,0 +1,98 @@
+import unittest
+from collections import defaultdict
+
+from src.abis.event import EVENT_HEX_SIGNATURES
+from src.tasks.extract.log import log_init
+from src.tasks.extract.transfer import TRANSFER_EVENT_HEX_SIGNATURE
+from src.tasks.fetch.log import log_fetch_init, log_topics
+from src.tasks.fetch.raw_receipt import raw_receipt_init
+from src.tasks.fetch.raw_trace import raw_trace_init
+from src.utils.enumeration import Entity
+from tests.helpers import create_client, start_mock_server
+
+
+class OutOfOrderClient:
+    """Streams block responses last block first, as a provider answering out of order would."""
+
+    async def _iter(self, block_numbers: list[int]):
+        for block_number in reversed(block_numbers):
+            yield block_number, {"result": [{"transactionHash": f"0x{block_number:x}{i}"} for i in range(2)]}
+
+    def iter_receipt_by_block_number(self, block_numbers: list[int]):
+        return self._iter(block_numbers)
+
+    def iter_trace_by_block_number(self, block_numbers: list[int]):
+        return self._iter(block_numbers)
+
+
+class StreamedFetchTest(unittest.IsolatedAsyncioTestCase):
+    async def test_blocks_are_added_in_block_order(self):
+        block_numbers = [10, 11, 12]
+        for init, entity in [(raw_receipt_init, Entity.RAW_RECEIPT), (raw_trace_init, Entity.RAW_TRACE)]:
+            results = defaultdict(list)
+            await init(results, OutOfOrderClient(), block_numbers)
+            self.assertEqual(
+                [row["block_number"] for row in results[entity]], [10, 10, 11, 11, 12, 12]
+            )
+
+
+class LogFetchTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server, url = await start_mock_server(max_logs=40)
+        self.client = create_client(url)
+        self.block_numbers = list(range(100, 120))
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def receipt_logs(self):
+        results = defaultdict(list)
+        await raw_receipt_init(results, self.client, self.block_numbers)
+        log_init(results)
+        return results[Entity.LOG]
+
+    async def fetch_logs(self, entities):
+        results = defaultdict(list)
+        await log_fetch_init(results, self.client, self.block_numbers, entities)
+        return results[Entity.LOG]
+
+    def test_topics_cover_the_decoded_events(self):
+        self.assertIsNone(log_topics((Entity.LOG, Entity.TRANSFER)))
+        self.assertEqual(log_topics((Entity.TRANSFER,)), [[TRANSFER_EVENT_HEX_SIGNATURE]])
+        (signatures,) = log_topics((Entity.EVENT,))
+        self.assertNotIn(TRANSFER_EVENT_HEX_SIGNATURE, signatures)
+        self.assertEqual(
+            set(signatures), {signature for events in EVENT_HEX_SIGNATURES.values() for signature in events.values()}
+        )
+
+    async def test_matches_the_logs_of_the_receipts(self):
+        expected = await self.receipt_logs()
+        self.assertGreater(len(expected), self.server.max_logs)
+        self.assertEqual(await self.fetch_logs((Entity.LOG,)), expected)
+        # the range was split for the provider's result limit, and later calls start from there
+        self.assertIsNotNone(self.client.max_log_range)
+        self.assertLess(self.client.max_log_range, len(self.block_numbers))
+
+    async def test_only_wanted_topics_are_fetched(self):
+        expected = [log for log in await self.receipt_logs() if log["topics"][0] == TRANSFER_EVENT_HEX_SIGNATURE]
+        self.assertTrue(expected)
+        self.assertEqual(await self.fetch_logs((Entity.TRANSFER,)), expected)
+
+    async def test_missing_timestamps_come_from_block_headers(self):
+        dispatch = self.server.dispatch
+
+        def without_timestamps(request):
+            response = dispatch(request)
+            if request.get("method") == "eth_getLogs":
+                for raw_log in response.get("result") or []:
+                    raw_log.pop("blockTimestamp", None)
+            return response
+
+        self.server.dispatch = without_timestamps
+        expected = await self.receipt_logs()
+        self.assertEqual(await self.fetch_logs((Entity.LOG,)), expected)
+
+
+if __name__ == "__main__":
+    unittest.main()
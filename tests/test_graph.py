@@ -0,0 +1,157 @@
+import asyncio
+import unittest
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from src.tasks.graph import Graph, create_process_pool
+from src.utils.enumeration import Resource
+from tests.helpers import make_node
+
+
+def double(results: dict[str, list]):
+    results["doubled"].extend({"value": row["value"] * 2} for row in results["raw"])
+
+
+def widen(results: dict[str, list]):
+    # beyond 64 bits, orjson cannot carry it back
+    results["wide"].extend({"value": row["value"] * 2**200} for row in results["raw"])
+
+
+class GraphTest(unittest.IsolatedAsyncioTestCase):
+    async def test_dependents_run_in_order(self):
+        finished = []
+
+        async def first(**kwargs):
+            finished.append("first")
+
+        async def second(**kwargs):
+            finished.append("second")
+
+        graph = Graph(running_queue_size=5)
+        graph.add_nodes({("0_9", 0): make_node(0, first), ("0_9", 1): make_node(1, second, deps=(0,))})
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            async with asyncio.TaskGroup() as tg:
+                graph.run(tg, pool)
+                while graph.nodes:
+                    await graph.wait()
+
+        self.assertEqual(finished, ["first", "second"])
+
+    async def test_dependents_start_when_their_dependency_finishes(self):
+        async def step(**kwargs):
+            pass
+
+        # a 100 ms polling loop would need 5 s for this chain
+        chain = {("0_9", i): make_node(i, step, deps=(i - 1,) if i else ()) for i in range(50)}
+        graph = Graph(running_queue_size=5)
+        graph.add_nodes(chain)
+        started = asyncio.get_running_loop().time()
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            async with asyncio.TaskGroup() as tg:
+                graph.run(tg, pool)
+                while graph.nodes:
+                    await graph.wait()
+
+        self.assertLess(asyncio.get_running_loop().time() - started, 1)
+        self.assertEqual(graph.pending_count, 0)
+        self.assertEqual(graph.running_count, 0)
+
+    async def test_nodes_added_while_running_start_at_once(self):
+        finished = asyncio.Event()
+
+        async def late(**kwargs):
+            finished.set()
+
+        graph = Graph(running_queue_size=5)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            async with asyncio.TaskGroup() as tg:
+                graph.run(tg, pool)
+                graph.add_nodes({("0_9", 0): make_node(0, late)})
+                await asyncio.wait_for(finished.wait(), timeout=1)
+
+    async def test_resource_classes_have_their_own_limits(self):
+        running = {Resource.RPC: 0, Resource.CPU: 0}
+        peak = {Resource.RPC: 0, Resource.CPU: 0}
+        cpu_done = asyncio.Event()
+
+        def counted(resource: str, seconds: float):
+            async def node(**kwargs):
+                running[resource] = running[resource] + 1
+                peak[resource] = max(peak[resource], running[resource])
+                await asyncio.sleep(seconds)
+                running[resource] = running[resource] - 1
+                if resource == Resource.CPU:
+                    cpu_done.set()
+
+            return node
+
+        nodes = {}
+        for i in range(6):
+            node = make_node(i, counted(Resource.RPC, 0.05))
+            node.resource = Resource.RPC
+            nodes[("0_9", i)] = node
+        nodes[("0_9", 6)] = make_node(6, counted(Resource.CPU, 0))
+
+        graph = Graph(running_queue_size=5, resource_limits={Resource.RPC: 2})
+        graph.add_nodes(nodes)
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            async with asyncio.TaskGroup() as tg:
+                graph.run(tg, pool)
+                # the cpu node does not queue behind the saturated rpc class
+                await asyncio.wait_for(cpu_done.wait(), timeout=0.04)
+                while graph.nodes:
+                    await graph.wait()
+
+        self.assertEqual(peak[Resource.RPC], 2)
+
+    async def test_cancelled_node_fails_the_run(self):
+        async def cancelled(**kwargs):
+            raise asyncio.CancelledError()
+
+        async def dependent(**kwargs):
+            pass
+
+        graph = Graph(running_queue_size=5)
+        graph.add_nodes({("0_9", 0): make_node(0, cancelled), ("0_9", 1): make_node(1, dependent, deps=(0,))})
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            with self.assertRaises(ExceptionGroup) as raised:
+                async with asyncio.TaskGroup() as tg:
+                    graph.run(tg, pool)
+                    while graph.nodes:
+                        await asyncio.wait_for(graph.wait(), timeout=5)
+
+        self.assertIsInstance(raised.exception.exceptions[0], RuntimeError)
+        self.assertIn("cancelled", str(raised.exception.exceptions[0]))
+
+
+class ProcessPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def test_process_nodes_share_the_encoded_input(self):
+        results = defaultdict(list)
+        results["raw"].extend({"value": value} for value in range(5))
+        encoded = {}
+
+        nodes = {}
+        for node_id, (func, writes) in enumerate([(double, ("doubled",)), (widen, ("wide",))]):
+            node = make_node(node_id, func)
+            node.kwargs = {"results": results, "encoded": encoded}
+            node.reads = ("raw",)
+            node.writes = writes
+            node.in_process = True
+            nodes[("0_9", node_id)] = node
+
+        graph = Graph(running_queue_size=5)
+        graph.add_nodes(nodes)
+        with ThreadPoolExecutor(max_workers=2) as pool, create_process_pool(2) as process_pool:
+            async with asyncio.TaskGroup() as tg:
+                graph.run(tg, pool, process_pool)
+                while graph.nodes:
+                    await graph.wait()
+
+        self.assertEqual([row["value"] for row in results["doubled"]], [0, 2, 4, 6, 8])
+        self.assertEqual(results["wide"][1]["value"], 2**200)
+        # the input was encoded once for both nodes, the json output is kept, the pickled one is not
+        self.assertEqual(sorted(encoded), ["doubled", "raw"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,27 @@
+import queue
+import unittest
+
+from src.clis.historical import shard_ranges
+from src.utils.progress import QueueProgress
+
+
+class ShardTest(unittest.TestCase):
+    def test_shards_partition_the_batches(self):
+        block_ranges = [(0, 99), (150, 174)]
+        shards = [shard_ranges(block_ranges, 10, shard, 3) for shard in range(3)]
+
+        batches = sorted(batch for ranges in shards for batch in ranges)
+        self.assertEqual(batches, [(start, start + 9) for start in range(0, 100, 10)] + [(150, 159), (160, 169), (170, 174)])
+        # interleaved, not contiguous blocks of the span
+        self.assertEqual(shards[1][:2], [(10, 19), (40, 49)])
+
+    def test_progress_is_forwarded_with_the_shard(self):
+        progress_queue = queue.Queue()
+        progress = QueueProgress(progress_queue, shard=2)
+        task_id = progress.add_task(description="Block: ", total=100)
+        progress.advance(task_id=task_id, advance=10)
+        self.assertEqual(progress_queue.get_nowait(), (2, 10))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,43 @@
+import unittest
+
+import orjson
+
+from src.utils.json_stream import JsonArrayParser
+
+
+class JsonArrayParserTest(unittest.TestCase):
+    def test_elements_split_across_chunks(self):
+        elements = [
+            {"id": 1, "result": {"logs": [{"data": "0x00"}], "note": 'brace } and quote \\" inside'}},
+            {"id": 2, "result": []},
+            {"id": 3, "result": None},
+        ]
+        payload = orjson.dumps(elements)
+        for size in (1, 3, 7, len(payload)):
+            parser = JsonArrayParser()
+            parsed = []
+            for i in range(0, len(payload), size):
+                parsed.extend(parser.feed(payload[i : i + size]))
+            parser.close()
+            self.assertEqual(parsed, elements)
+
+    def test_only_the_element_being_read_is_buffered(self):
+        parser = JsonArrayParser()
+        self.assertEqual(parser.feed(b'[{"id": 1}, {"id": 2, "res'), [{"id": 1}])
+        self.assertLess(len(parser.buffer), 20)
+
+    def test_raw_bytes_are_the_element_as_received(self):
+        parser = JsonArrayParser(keep_raw=True)
+        self.assertEqual(parser.feed(b'[ {"id" : 1} ,{"id":2}]'), [({"id": 1}, b'{"id" : 1}'), ({"id": 2}, b'{"id":2}')])
+
+    def test_truncated_or_non_array_bodies_raise(self):
+        parser = JsonArrayParser()
+        parser.feed(b'[{"id": 1}, {"id"')
+        with self.assertRaises(ValueError):
+            parser.close()
+        with self.assertRaises(ValueError):
+            JsonArrayParser().feed(b'{"error": "rate limited"}')
+
+
+if __name__ == "__main__":
+    unittest.main()
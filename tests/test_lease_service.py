@@ -0,0 +1,171 @@
+import sqlite3
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from types import SimpleNamespace
+
+from nats.js.errors import KeyNotFoundError, KeyWrongLastSequenceError
+
+from src.services.lease_service import NatsLeaseService, SqliteLeaseService
+
+
+class MemoryKeyValue:
+    """The compare-and-set subset of a JetStream KV bucket the lease service uses."""
+
+    def __init__(self):
+        self.entries: dict[str, tuple[bytes, int]] = {}
+        self.revision = 0
+        self.reads = 0
+
+    async def create(self, key: str, value: bytes):
+        if key in self.entries:
+            raise KeyWrongLastSequenceError()
+        return await self.update(key, value)
+
+    async def get(self, key: str):
+        self.reads = self.reads + 1
+        if key not in self.entries:
+            raise KeyNotFoundError()
+        value, revision = self.entries[key]
+        return SimpleNamespace(key=key, value=value, revision=revision)
+
+    async def update(self, key: str, value: bytes, last: int = None):
+        if last is not None and self.entries.get(key, (None, None))[1] != last:
+            raise KeyWrongLastSequenceError()
+        self.revision = self.revision + 1
+        self.entries[key] = (value, self.revision)
+        return self.revision
+
+
+class MemoryJetStream:
+    def __init__(self):
+        self.kv = MemoryKeyValue()
+
+    async def create_key_value(self, bucket: str):
+        return self.kv
+
+
+class NatsLeaseServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_workers_split_the_ranges(self):
+        jetstream = MemoryJetStream()
+        workers = [NatsLeaseService(jetstream, f"worker-{i}", ttl=60, bucket="test") for i in range(2)]
+        for worker in workers:
+            await worker.init(0, 99, 10)
+
+        leased = []
+        while (block_range := await workers[len(leased) % 2].acquire()) is not None:
+            leased.append(block_range)
+        self.assertEqual(sorted(leased), [(start, start + 9) for start in range(0, 100, 10)])
+        self.assertEqual(await workers[0].remaining(), 10)
+
+        for i, block_range in enumerate(leased):
+            await workers[i % 2].complete(*block_range)
+        self.assertEqual(await workers[1].remaining(), 0)
+
+    async def test_reads_do_not_grow_with_the_span(self):
+        jetstream = MemoryJetStream()
+        worker = NatsLeaseService(jetstream, "worker", bucket="test")
+        await worker.init(0, 999_999, 10)
+        for _ in range(50):
+            await worker.complete(*await worker.acquire())
+        await worker.remaining()
+        self.assertLessEqual(jetstream.kv.reads, 2 * 50 + 2)
+
+    async def test_expired_lease_moves_to_another_worker(self):
+        jetstream = MemoryJetStream()
+        dead = NatsLeaseService(jetstream, "dead", ttl=0.01, bucket="test")
+        alive = NatsLeaseService(jetstream, "alive", ttl=60, bucket="test")
+        await dead.init(0, 19, 10)
+        await alive.init(0, 19, 10)
+
+        self.assertEqual(await dead.acquire(), (0, 9))
+        time.sleep(0.02)
+        self.assertEqual(await alive.acquire(), (0, 9))
+        self.assertEqual(await alive.acquire(), (10, 19))
+
+        await dead.heartbeat()
+        self.assertEqual(dead.held, set())
+
+    async def test_heartbeat_keeps_a_lease_from_expiring(self):
+        jetstream = MemoryJetStream()
+        busy = NatsLeaseService(jetstream, "busy", ttl=0.05, bucket="test")
+        other = NatsLeaseService(jetstream, "other", ttl=60, bucket="test")
+        await busy.init(0, 9, 10)
+        await other.init(0, 9, 10)
+
+        self.assertEqual(await busy.acquire(), (0, 9))
+        for _ in range(3):
+            time.sleep(0.03)
+            await busy.heartbeat()
+            self.assertIsNone(await other.acquire())
+        self.assertEqual(busy.held, {(0, 9)})
+
+        # without heartbeats the lease runs out and moves on
+        time.sleep(0.06)
+        self.assertEqual(await other.acquire(), (0, 9))
+        await other.complete(0, 9)
+        self.assertEqual(await busy.remaining(), 0)
+
+    async def test_restarted_worker_takes_back_its_expired_leases(self):
+        jetstream = MemoryJetStream()
+        crashed = NatsLeaseService(jetstream, "worker-0", ttl=0.01, bucket="test")
+        await crashed.init(0, 19, 10)
+        self.assertEqual(await crashed.acquire(), (0, 9))
+        self.assertEqual(await crashed.acquire(), (10, 19))
+        time.sleep(0.02)
+
+        # same --worker-id, fresh process holding nothing
+        restarted = NatsLeaseService(jetstream, "worker-0", ttl=60, bucket="test")
+        await restarted.init(0, 19, 10)
+        leased = [await restarted.acquire(), await restarted.acquire()]
+        self.assertEqual(sorted(leased), [(0, 9), (10, 19)])
+        self.assertIsNone(await restarted.acquire())
+
+        for block_range in leased:
+            await restarted.complete(*block_range)
+        self.assertEqual(await restarted.remaining(), 0)
+
+    async def test_span_mismatch_raises(self):
+        jetstream = MemoryJetStream()
+        await NatsLeaseService(jetstream, "a", bucket="test").init(0, 99, 10)
+        with self.assertRaises(ValueError):
+            await NatsLeaseService(jetstream, "b", bucket="test").init(0, 99, 20)
+
+
+class SqliteLeaseServiceTest(unittest.IsolatedAsyncioTestCase):
+    async def test_acquire_uses_the_status_index(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "lease.sqlite"
+            service = SqliteLeaseService("worker", path=path)
+            await service.init(0, 99, 10)
+            self.assertEqual(await service.acquire(), (0, 9))
+            await service.complete(0, 9)
+            self.assertEqual(await service.remaining(), 9)
+            service.close()
+
+            db = sqlite3.connect(path)
+            plan = db.execute(
+                "EXPLAIN QUERY PLAN SELECT start_block, end_block FROM lease WHERE status = 'pending' ORDER BY start_block LIMIT 1;"
+            ).fetchall()
+            db.close()
+            self.assertIn("lease_status", " ".join(str(row) for row in plan))
+
+    async def test_restarted_worker_takes_back_its_expired_leases(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "lease.sqlite"
+            crashed = SqliteLeaseService("worker-0", ttl=0.01, path=path)
+            await crashed.init(0, 19, 10)
+            self.assertEqual(await crashed.acquire(), (0, 9))
+            crashed.close()
+            time.sleep(0.02)
+
+            restarted = SqliteLeaseService("worker-0", ttl=60, path=path)
+            await restarted.init(0, 19, 10)
+            self.assertEqual(await restarted.acquire(), (0, 9))
+            self.assertEqual(await restarted.acquire(), (10, 19))
+            restarted.close()
+
+
+if __name__ == "__main__":
+    unittest.main()
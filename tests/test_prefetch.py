@@ -0,0 +1,42 @@
+import asyncio
+import unittest
+from types import SimpleNamespace
+
+from src.tasks.prefetch import Prefetcher, results_size
+
+
+class PrefetcherTest(unittest.IsolatedAsyncioTestCase):
+    async def test_budget_counts_stored_results_and_reserves_ahead(self):
+        running = []
+        peak = [0]
+
+        async def fetch(results: dict[str, list], block_numbers: range, **kwargs):
+            # no rpc at all, as if every block came from the cache
+            running.append(block_numbers)
+            peak[0] = max(peak[0], len(running))
+            await asyncio.sleep(0.01)
+            results["raw_block"].extend({"number": number, "data": "0" * 1000} for number in block_numbers)
+            running.remove(block_numbers)
+
+        template = SimpleNamespace(funcs={0: fetch}, fetch_ids=(0,), include_transaction=False, entities=())
+        ranges = [(start, start + 9) for start in range(0, 100, 10)]
+        # a little over two ranges of ten 1kB blocks
+        prefetcher = Prefetcher(template, None, iter(ranges), depth=8, memory_budget=25_000)
+
+        fetched = []
+        async with asyncio.TaskGroup() as tg:
+            tg.create_task(prefetcher.run(tg))
+            while (item := await prefetcher.get()) is not None:
+                start_block, end_block, results = item
+                self.assertGreater(results_size(results), 10_000)
+                self.assertLessEqual(prefetcher.buffered_bytes, 25_000)
+                fetched.append((start_block, end_block))
+                await asyncio.sleep(0.02)
+
+        self.assertEqual(fetched, ranges)
+        self.assertLessEqual(peak[0], 2)
+        self.assertEqual(prefetcher.buffered_bytes, 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,66 @@
+import asyncio
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import orjson
+
+from src.tasks.graph import Graph
+from src.tasks.profiler import Profiler
+from tests.helpers import make_node
+
+
+class ProfilerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        def sleeper(name: str, seconds: float):
+            async def node(**kwargs):
+                await asyncio.sleep(seconds)
+
+            node.__name__ = name
+            return node
+
+        # fetch feeds a slow and a fast branch, finish waits on both
+        nodes = [
+            make_node(0, sleeper("fetch", 0.01)),
+            make_node(1, sleeper("slow", 0.1), deps=(0,)),
+            make_node(2, sleeper("fast", 0.01), deps=(0,)),
+            make_node(3, sleeper("finish", 0), deps=(1, 2)),
+        ]
+        for node in nodes:
+            node.kwargs = {"results": {}}
+
+        self.profiler = Profiler()
+        graph = Graph(running_queue_size=5, profiler=self.profiler)
+        graph.add_nodes({(node.dag_id, node.node_id): node for node in nodes})
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            async with asyncio.TaskGroup() as tg:
+                graph.run(tg, pool)
+                while graph.nodes:
+                    await graph.wait()
+
+    async def test_critical_path_follows_the_slowest_dependency(self):
+        paths = self.profiler.critical_paths()
+        self.assertEqual([self.profiler.timings[key].name for key in paths["0_9"]], ["fetch", "slow", "finish"])
+        self.assertEqual(self.profiler.summary()["bottlenecks"][0]["name"], "slow")
+
+    async def test_trace_slices_of_a_lane_do_not_overlap(self):
+        lanes = {}
+        for event in self.profiler.trace_events():
+            if event["ph"] == "X":
+                lanes.setdefault((event["pid"], event["tid"]), []).append((event["ts"], event["ts"] + event["dur"]))
+        for slices in lanes.values():
+            for (_, end), (start, _) in zip(slices, slices[1:]):
+                self.assertLessEqual(end, start)
+
+    async def test_export_writes_trace_and_summary(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "trace.json"
+            self.profiler.export(path)
+            trace = orjson.loads(path.read_bytes())
+            self.assertEqual(len([event for event in trace["traceEvents"] if event["ph"] == "X"]), 4)
+            self.assertTrue((Path(directory) / "trace_summary.json").exists())
+
+
+if __name__ == "__main__":
+    unittest.main()
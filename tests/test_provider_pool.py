@@ -0,0 +1,117 @@
+import random
+import unittest
+from collections import Counter
+
+from src.clients.provider_pool import CLOSED, HALF_OPEN, OPEN, ProviderPool
+
+
+class ProviderPoolTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        random.seed(0)
+        self.pool = ProviderPool(["http://a", "http://b", "http://c"], rate_limit=10, max_rate_limit=100)
+        self.a, self.b, self.c = self.pool.providers
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    def picks(self, n: int = 2000, exclude=()):
+        return Counter(self.pool.pick(exclude).uri for _ in range(n))
+
+    async def test_faster_providers_get_more_traffic(self):
+        self.pool.success(self.a, 0.1)
+        self.pool.success(self.b, 0.4)
+        picks = self.picks()
+        # c is unmeasured and scored like an average provider, so it is still probed
+        self.assertGreater(picks["http://a"], 2 * picks["http://b"])
+        self.assertGreater(picks["http://c"], picks["http://b"])
+
+    async def test_errors_and_in_flight_lower_the_weight(self):
+        for provider in self.pool.providers:
+            self.pool.success(provider, 0.1)
+        self.pool.failure(self.a)
+        self.b.in_flight = 4
+        picks = self.picks()
+        self.assertGreater(picks["http://c"], picks["http://a"])
+        self.assertGreater(picks["http://a"], picks["http://b"])
+
+    async def test_retries_avoid_the_excluded_provider(self):
+        self.assertNotIn("http://a", self.picks(200, exclude=[self.a]))
+        # with every provider excluded there is still somewhere to go
+        self.assertEqual(sum(self.picks(10, exclude=self.pool.providers).values()), 10)
+
+
+class CircuitBreakerTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        random.seed(0)
+        self.pool = ProviderPool(
+            ["http://a", "http://b"],
+            rate_limit=10,
+            max_rate_limit=100,
+            failure_threshold=0.5,
+            open_timeout=5.0,
+            max_open_timeout=12.0,
+        )
+        self.a, self.b = self.pool.providers
+
+    async def asyncTearDown(self):
+        await self.pool.close()
+
+    def trip(self, provider):
+        while provider.state == CLOSED:
+            self.pool.failure(provider)
+
+    def elapse(self, provider):
+        # pretend the open timeout ran out
+        provider.open_until = 0.0
+
+    async def test_opens_at_the_failure_threshold(self):
+        self.pool.failure(self.a)
+        self.pool.failure(self.a)
+        self.assertEqual(self.a.state, CLOSED)
+        self.trip(self.a)
+        self.assertEqual(self.a.state, OPEN)
+        self.assertGreaterEqual(self.a.error_rate, 0.5)
+
+    async def test_open_circuit_gets_no_traffic(self):
+        self.trip(self.a)
+        self.assertEqual(self.pool.available(), [self.b])
+        self.assertEqual({self.pool.pick().uri for _ in range(200)}, {"http://b"})
+        # with every circuit open the one closest to probing is still tried
+        self.trip(self.b)
+        self.b.open_until = self.a.open_until + 1
+        self.assertIs(self.pool.pick(), self.a)
+
+    async def test_half_open_admits_a_single_probe(self):
+        self.trip(self.a)
+        self.elapse(self.a)
+        self.assertIs(self.pool.pick(exclude=[self.b]), self.a)
+        self.assertEqual(self.a.state, HALF_OPEN)
+        # the probe is in flight, nothing else goes through until it resolves
+        self.assertEqual(self.pool.available(), [self.b])
+
+    async def test_successful_probe_closes(self):
+        self.trip(self.a)
+        self.elapse(self.a)
+        self.pool.pick(exclude=[self.b])
+        self.pool.success(self.a, 0.1)
+        self.assertEqual(self.a.state, CLOSED)
+        self.assertEqual(self.a.error_rate, 0.0)
+        self.assertEqual(self.pool.available(), [self.a, self.b])
+
+    async def test_failed_probe_reopens_for_longer(self):
+        self.trip(self.a)
+        for open_timeout in (10.0, 12.0, 12.0):
+            self.elapse(self.a)
+            self.pool.pick(exclude=[self.b])
+            self.pool.failure(self.a)
+            self.assertEqual(self.a.state, OPEN)
+            self.assertEqual(self.a.open_timeout, open_timeout)
+        # once closed again the timeout starts over
+        self.elapse(self.a)
+        self.pool.pick(exclude=[self.b])
+        self.pool.success(self.a, 0.1)
+        self.assertEqual(self.a.open_timeout, 5.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
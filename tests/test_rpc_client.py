@@ -0,0 +1,230 @@
+import asyncio
+import tempfile
+import unittest
+from pathlib import Path
+
+import orjson
+
+from src.clients.rpc_client import RpcClient
+from tests.helpers import create_client, start_mock_server
+
+
+class CoalescingTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server, url = await start_mock_server(latency=0.2)
+        self.client = create_client(url)
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_identical_requests_are_sent_once(self):
+        first, second = await asyncio.gather(
+            self.client.get_block_by_number([5], False),
+            self.client.get_block_by_number([5], False),
+        )
+        self.assertEqual(first[0]["result"], second[0]["result"])
+        self.assertEqual(self.client.coalesced, 1)
+        self.assertEqual(self.server.stats["requests"], 1)
+
+    async def test_waiter_survives_cancelled_owner(self):
+        owner = asyncio.create_task(self.client.get_block_by_number([5], False))
+        await asyncio.sleep(0.05)
+        waiter = asyncio.create_task(self.client.get_block_by_number([5], False))
+        await asyncio.sleep(0.05)
+        self.assertEqual(self.client.coalesced, 1)
+
+        owner.cancel()
+        responses = await asyncio.wait_for(waiter, timeout=5)
+        self.assertTrue(owner.cancelled())
+        self.assertEqual(int(responses[0]["result"]["number"], 16), 5)
+        self.assertEqual(self.client._in_flight, {})
+
+    async def test_waiters_share_the_reissued_request(self):
+        owner = asyncio.create_task(self.client.get_block_by_number([5], False))
+        await asyncio.sleep(0.05)
+        waiters = [asyncio.create_task(self.client.get_block_by_number([5], False)) for _ in range(3)]
+        await asyncio.sleep(0.05)
+
+        owner.cancel()
+        results = await asyncio.wait_for(asyncio.gather(*waiters), timeout=5)
+        self.assertTrue(all(int(responses[0]["result"]["number"], 16) == 5 for responses in results))
+        # the cancelled post and a single reissue
+        self.assertEqual(self.server.stats["requests"], 2)
+
+
+class PartialRetryTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.server, url = await start_mock_server()
+        self.client = create_client(url)
+        self.sent = []
+
+        # the first answer for odd blocks is a retryable error, the rest of the batch is fine
+        dispatch = self.server.dispatch
+        failed = set()
+
+        def flaky(request: dict):
+            number = int(request["params"][0], 16)
+            self.sent.append(number)
+            if number % 2 and number not in failed:
+                failed.add(number)
+                return {"jsonrpc": "2.0", "id": request["id"], "error": {"code": -32005, "message": "limit exceeded"}}
+            return dispatch(request)
+
+        self.server.dispatch = flaky
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_only_failed_requests_are_resent(self):
+        block_numbers = list(range(100, 110))
+        responses = await self.client.get_block_by_number(block_numbers, include_transaction=False)
+
+        self.assertEqual([int(response["result"]["number"], 16) for response in responses], block_numbers)
+        self.assertEqual(sorted(self.sent), sorted(block_numbers + block_numbers[1::2]))
+
+    async def test_null_results_are_resent_until_the_block_exists(self):
+        head = self.server.head
+        # the head moves on before the retry
+        self.server.start_head = head - 1
+        asyncio.get_running_loop().call_later(0.005, setattr, self.server, "start_head", head)
+        responses = await self.client.get_receipt_by_block_number([head - 2, head])
+        self.assertTrue(all(response.get("result") is not None for response in responses))
+
+
+class ResponseCacheTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server, url = await start_mock_server()
+        self.client = create_client(
+            url, cache_max_bytes=64 * 1024 * 1024, cache_path=Path(self.directory.name) / "cache.sqlite"
+        )
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+        self.directory.cleanup()
+
+    async def test_finalized_blocks_are_read_back_from_disk(self):
+        block_numbers = list(range(100, 110))
+        first = await self.client.get_receipt_by_block_number(block_numbers)
+        requests = self.server.stats["requests"]
+        second = await self.client.get_receipt_by_block_number(block_numbers)
+
+        self.assertEqual([response["result"] for response in first], [response["result"] for response in second])
+        self.assertEqual(self.server.stats["requests"], requests)
+        self.assertEqual(self.client.cache.hits, 10)
+
+    async def test_least_recently_used_entries_are_evicted(self):
+        cache = self.client.cache
+        await self.client.get_receipt_by_block_number(list(range(100, 120)))
+        cache.max_bytes = cache.total_bytes // 2
+        # 100-104 were used last, the next fill evicts from 105 on
+        await self.client.get_receipt_by_block_number(list(range(100, 105)))
+        await self.client.get_receipt_by_block_number([200])
+
+        self.assertLessEqual(cache.total_bytes, cache.max_bytes)
+        keys = [cache.key(self.client.form_request("eth_getBlockReceipts", [hex(n)])) for n in (100, 105)]
+        self.assertEqual(list(cache.get(keys)), [keys[0]])
+
+
+class StreamResponsesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.server, url = await start_mock_server(latency=0.1)
+        self.client = create_client(
+            url,
+            stream_responses=True,
+            cache_max_bytes=64 * 1024 * 1024,
+            cache_path=Path(self.directory.name) / "cache.sqlite",
+        )
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+        self.directory.cleanup()
+
+    async def receipts(self, block_numbers: list[int]):
+        return {
+            block_number: response["result"]
+            async for block_number, response in self.client.iter_receipt_by_block_number(block_numbers)
+        }
+
+    async def test_streamed_blocks_go_through_the_cache(self):
+        block_numbers = list(range(100, 110))
+        first = await self.receipts(block_numbers)
+        requests = self.server.stats["requests"]
+        second = await self.receipts(block_numbers)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.server.stats["requests"], requests)
+        self.assertEqual(self.client.cache.hits, 10)
+        self.assertEqual(self.client.cache.misses, 10)
+
+    async def test_streamed_blocks_are_coalesced(self):
+        block_numbers = list(range(100, 110))
+        await self.client.finalized_block()
+        first, second = await asyncio.gather(self.receipts(block_numbers), self.receipts(block_numbers[5:]))
+
+        self.assertEqual(sorted(first), block_numbers)
+        self.assertEqual({number: first[number] for number in second}, second)
+        self.assertEqual(self.client.coalesced, 5)
+
+    async def test_blocks_past_finalized_are_not_cached(self):
+        await self.receipts([self.server.head - 1])
+        self.assertEqual(self.client.cache.metrics()["hits"] + self.client.cache.metrics()["misses"], 0)
+
+
+class HedgingTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.servers = []
+        urls = []
+        for _ in range(2):
+            server, url = await start_mock_server(latency=0.05)
+            self.servers.append(server)
+            urls.append(url)
+        self.client = RpcClient(uris=urls, rate_limit=1000, backoff=0.01, hedge_percentile=0.95, hedge_budget=1.0)
+        # a learned hedge delay of 0.1s and tokens to spend
+        for _ in range(20):
+            self.client.hedger.record("eth_blockNumber", 0.1)
+        self.payload = orjson.dumps([self.client.form_request("eth_blockNumber", [])])
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        for server in self.servers:
+            await server.close()
+
+    async def test_local_queueing_does_not_hedge(self):
+        provider = self.client.providers.providers[0]
+        # every connection slot is taken for 0.3s, the post waits locally before it is sent
+        slots = provider.connection_pool._value
+        for _ in range(slots):
+            await provider.connection_pool.acquire()
+        asyncio.get_running_loop().call_later(0.3, lambda: [provider.connection_pool.release() for _ in range(slots)])
+
+        answered, response = await self.client._post(self.payload, provider, method="eth_blockNumber")
+        self.assertIs(answered, provider)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.client.hedger.hedged, 0)
+        # the recorded latency is the exchange, not the 0.3s wait for a slot
+        self.assertLess(self.client.hedger._latencies["eth_blockNumber"][-1], 0.25)
+
+    async def test_slow_exchange_hedges(self):
+        self.servers[0].latency = 0.5
+        provider = self.client.providers.providers[0]
+        answered, response = await self.client._post(self.payload, provider, method="eth_blockNumber")
+        self.assertIsNot(answered, provider)
+        self.assertEqual(self.client.hedger.hedged, 1)
+        self.assertEqual(self.client.hedger.won, 1)
+
+        # the winning hedge's time is not recorded, the outpaced primary's is once it answers
+        latencies = self.client.hedger._latencies["eth_blockNumber"]
+        self.assertEqual(len(latencies), 20)
+        await asyncio.sleep(0.6)
+        self.assertEqual(len(latencies), 21)
+        self.assertGreaterEqual(latencies[-1], 0.5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,61 @@
+import unittest
+
+import httpx
+import orjson
+
+from scripts.benchmark.synthetic_chain import SyntheticChain
+from tests.helpers import start_mock_server
+
+
+class SyntheticChainTest(unittest.TestCase):
+    def test_blocks_are_deterministic(self):
+        first, second = SyntheticChain(seed=1), SyntheticChain(seed=1)
+        self.assertEqual(orjson.dumps(first.receipts(100)), orjson.dumps(second.receipts(100)))
+        self.assertNotEqual(orjson.dumps(first.receipts(100)), orjson.dumps(SyntheticChain(seed=2).receipts(100)))
+
+    def test_block_transactions_match_the_receipts(self):
+        chain = SyntheticChain()
+        block = chain.block(100, True)
+        receipts = chain.receipts(100)
+        self.assertEqual(
+            [transaction["hash"] for transaction in block["transactions"]],
+            [receipt["transactionHash"] for receipt in receipts],
+        )
+
+
+class MockRpcServerTest(unittest.IsolatedAsyncioTestCase):
+    async def post(self, url: str, payload):
+        async with httpx.AsyncClient() as client:
+            return await client.post(url, content=orjson.dumps(payload))
+
+    async def test_batches_are_answered_by_id(self):
+        server, url = await start_mock_server(head=200)
+        batch = [
+            {"jsonrpc": "2.0", "id": 7, "method": "eth_getBlockByNumber", "params": ["0x64", False]},
+            {"jsonrpc": "2.0", "id": 8, "method": "eth_getBlockByNumber", "params": ["0x12c", False]},
+            {"jsonrpc": "2.0", "id": 9, "method": "eth_foo", "params": []},
+        ]
+        responses = orjson.loads((await self.post(url, batch)).content)
+        await server.close()
+
+        self.assertEqual([response["id"] for response in responses], [7, 8, 9])
+        self.assertEqual(responses[0]["result"]["number"], "0x64")
+        # past the head
+        self.assertIsNone(responses[1]["result"])
+        self.assertEqual(responses[2]["error"]["code"], -32601)
+
+    async def test_faults_are_injected(self):
+        server, url = await start_mock_server(rate_limit_ratio=1)
+        response = await self.post(url, {"jsonrpc": "2.0", "id": 1, "method": "eth_blockNumber", "params": []})
+        await server.close()
+        self.assertEqual(response.status_code, 429)
+
+        server, url = await start_mock_server(max_logs=1)
+        request = {"jsonrpc": "2.0", "id": 1, "method": "eth_getLogs", "params": [{"fromBlock": "0x64", "toBlock": "0x6e"}]}
+        response = orjson.loads((await self.post(url, request)).content)
+        await server.close()
+        self.assertEqual(response["error"]["code"], -32005)
+
+
+if __name__ == "__main__":
+    unittest.main()
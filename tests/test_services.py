@@ -0,0 +1,103 @@
+import sqlite3
+import tempfile
+import unittest
+import zlib
+from pathlib import Path
+
+from scripts.benchmark.synthetic_chain import Revert, SyntheticChain
+from src.abis.function import MULTICALL3_ADDRESS
+from src.services.multicall_service import MulticallService, output_field
+from src.services.pool_service import PoolService
+from src.services.response_cache_service import ResponseCacheService
+from src.services.token_service import TokenService
+from tests.helpers import create_client, start_mock_server
+
+
+class OutputFieldTest(unittest.TestCase):
+    def test_failed_calls_have_no_field(self):
+        self.assertEqual(output_field({"decimals": 18}, "decimals"), 18)
+        self.assertIsNone(output_field({}, "decimals"))
+        self.assertIsNone(output_field(None, "decimals"))
+
+
+class ServicesTest(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.chain = SyntheticChain()
+        self.server, url = await start_mock_server()
+        self.client = create_client(url)
+        self.pool_address, (_, self.token0, self.token1) = next(iter(self.chain.pools.items()))
+        self.token_address = self.chain.tokens[5]
+
+    async def asyncTearDown(self):
+        await self.client.close()
+        await self.server.close()
+
+    async def test_token_info(self):
+        info = await TokenService(self.client).get_token_info(self.token_address)
+        self.assertEqual(info["symbol"], "TK5")
+        self.assertEqual(info["totalSupply"], self.chain.token_info[self.token_address]["totalSupply"])
+
+    async def test_token_info_of_a_reverting_contract(self):
+        # a pool has no erc20 metadata, every call reverts
+        service = TokenService(self.client)
+        info = await service.get_token_info(self.pool_address)
+        self.assertEqual(info, {"name": None, "symbol": None, "decimals": None, "totalSupply": None})
+        self.assertIsNone(await service.get_token_decimals(self.pool_address))
+
+    async def test_token_addresses(self):
+        service = PoolService(self.client)
+        self.assertEqual(await service.get_token_addresses(self.pool_address), (self.token0, self.token1))
+
+    async def test_token_addresses_of_a_reverting_contract(self):
+        service = PoolService(self.client)
+        self.assertEqual(await service.get_token_addresses(self.token_address), (None, None))
+        self.assertIsNone(await service.get_token0_address(self.token_address))
+        self.assertIsNone(await service.get_token1_address(self.token_address))
+
+    async def test_calls_are_packed_into_aggregates(self):
+        tokens = list(self.chain.token_info)[:3]
+        calls = [(token, "decimals", ()) for token in tokens] * 150
+        outputs = await MulticallService(self.client).call(calls)
+
+        self.assertEqual(
+            [output["decimals"] for output in outputs],
+            [self.chain.token_info[token]["decimals"] for token, _, _ in calls],
+        )
+        # 450 calls in aggregates of 200
+        self.assertEqual(self.server.stats["requests"], 3)
+
+    async def test_calls_fall_back_without_multicall(self):
+        call = self.chain.call
+
+        def no_multicall(to: str, data: str):
+            if to.lower() == MULTICALL3_ADDRESS.lower():
+                raise Revert("execution reverted")
+            return call(to, data)
+
+        self.chain.call = no_multicall
+        self.server.chain = self.chain
+        outputs = await MulticallService(self.client).call(
+            [(self.pool_address, "token0", ()), (self.token_address, "token0", ())]
+        )
+        self.assertEqual(outputs[0]["token_address"].lower(), self.token0)
+        self.assertIsNone(outputs[1])
+
+
+class ResponseCacheServiceTest(unittest.TestCase):
+    def test_raw_responses_are_stored_as_received(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = Path(directory) / "cache.sqlite"
+            cache = ResponseCacheService(path)
+            raw = b'{"jsonrpc": "2.0", "id": 7, "result": {"number": "0x64"}}'
+            cache.put({b"raw": raw, b"parsed": {"jsonrpc": "2.0", "id": 8, "result": []}})
+            self.assertEqual(cache.get([b"raw", b"parsed", b"missing"]), {b"raw": {"number": "0x64"}, b"parsed": []})
+            cache.close()
+
+            db = sqlite3.connect(path)
+            value = db.execute("SELECT value FROM rpc_response WHERE key = ?;", (b"raw",)).fetchone()[0]
+            db.close()
+            self.assertEqual(zlib.decompress(value), raw)
+
+
+if __name__ == "__main__":
+    unittest.main()
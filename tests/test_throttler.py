@@ -0,0 +1,79 @@
+import asyncio
+import time
+import unittest
+
+from src.clients.throttler import AdaptiveThrottler, Throttler
+
+
+class AdaptiveThrottlerTest(unittest.TestCase):
+    def test_additive_increase_multiplicative_decrease(self):
+        throttler = AdaptiveThrottler(rate_limit=10, cooldown=60)
+        # each success adds 1 / rate, ten of them a little less than 1 req/s
+        for _ in range(10):
+            throttler.success("a")
+        rate = throttler.rate("a")
+        self.assertTrue(10.8 < rate < 11)
+
+        throttler.throttled("a")
+        self.assertAlmostEqual(throttler.rate("a"), rate / 2)
+        # a burst of rejections inside the cooldown counts once
+        throttler.throttled("a")
+        self.assertAlmostEqual(throttler.rate("a"), rate / 2)
+        self.assertEqual(throttler.get("a").rate_limit, throttler.rate("a"))
+
+    def test_rate_stays_within_bounds_per_key(self):
+        throttler = AdaptiveThrottler(rate_limit=2, min_rate_limit=1, max_rate_limit=3, cooldown=0)
+        for _ in range(5):
+            throttler.throttled("a")
+        for _ in range(100):
+            throttler.success("b")
+
+        self.assertEqual(throttler.rate("a"), 1)
+        self.assertEqual(throttler.rate("b"), 3)
+        self.assertEqual(throttler.metrics(), {"a": 1, "b": 3})
+
+
+class ThrottlerTest(unittest.IsolatedAsyncioTestCase):
+    async def test_waiters_are_paced_not_serialized(self):
+        throttler = Throttler(rate_limit=100, period=1)
+        finished = []
+
+        async def request(i: int):
+            await throttler.acquire()
+            finished.append((i, time.monotonic()))
+
+        started = time.monotonic()
+        await asyncio.gather(*(request(i) for i in range(20)))
+
+        # served in call order, one permit every 10 ms
+        self.assertEqual([i for i, _ in finished], list(range(20)))
+        self.assertAlmostEqual(finished[-1][1] - started, 0.19, delta=0.08)
+
+    async def test_burst_and_weight(self):
+        throttler = Throttler(rate_limit=10, period=1, burst=5)
+        started = time.monotonic()
+        for _ in range(5):
+            await throttler.acquire()
+        self.assertLess(time.monotonic() - started, 0.05)
+
+        # a weighted request delays the one after it by its whole cost
+        await throttler.acquire(weight=3)
+        await throttler.acquire()
+        self.assertAlmostEqual(time.monotonic() - started, 0.4, delta=0.08)
+
+    async def test_cancelled_waiter_gives_its_permits_back(self):
+        throttler = Throttler(rate_limit=10, period=1)
+        await throttler.acquire()
+        waiter = asyncio.create_task(throttler.acquire(weight=5))
+        await asyncio.sleep(0)
+        waiter.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await waiter
+
+        started = time.monotonic()
+        await throttler.acquire()
+        self.assertLess(time.monotonic() - started, 0.15)
+
+
+if __name__ == "__main__":
+    unittest.main()